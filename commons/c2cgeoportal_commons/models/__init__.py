@@ -27,7 +27,7 @@
 
 
 import logging
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 
 import sqlalchemy.ext.declarative
 import sqlalchemy.orm
@@ -53,18 +53,61 @@ LOG = logging.getLogger(__name__)
 class InvalidateCacheEvent:
     """Event to be broadcast."""
 
+    def __init__(self, tree_item_ids: Optional[List[int]] = None, generation_incremented: bool = False):
+        # The modified tree items, None if we don't know which ones
+        self.tree_item_ids = tree_item_ids
+        # True if the cache generation was incremented in the originating process
+        self.generation_incremented = generation_incremented
+
+
+class InvalidateCacheOriginEvent:
+    """Event notified only in the process where the cache invalidation originates, before the broadcast."""
+
+    def __init__(self, tree_item_ids: Optional[List[int]] = None):
+        # The modified tree items, None if we don't know which ones
+        self.tree_item_ids = tree_item_ids
+        # To be set by the handler that increments the cache generation
+        self.generation_incremented = False
+
+
+def _invalidate_cache(tree_item_ids: Optional[List[int]] = None) -> None:
+    origin_event = InvalidateCacheOriginEvent(tree_item_ids)
+    zope.event.notify(origin_event)
+    _cache_invalidate_cb(
+        tree_item_ids=tree_item_ids, generation_incremented=origin_event.generation_incremented
+    )
+
 
 def cache_invalidate_cb(*args: List[Any]) -> None:
     """Invalidate the cache on a broadcast event."""
-    _cache_invalidate_cb()
+    _invalidate_cache()
+
+
+def tree_item_cache_invalidate_cb(*attributes: str) -> Callable[..., None]:
+    """
+    Get a mapper event listener that invalidates the cache on a broadcast event.
+
+    The event also holds the modified tree items, get from the given attributes of the target.
+    """
+
+    def callback(mapper: Any, connection: Any, target: Any) -> None:
+        del mapper, connection
+        tree_item_ids = [
+            getattr(target, attribute) for attribute in attributes if getattr(target, attribute) is not None
+        ]
+        _invalidate_cache(tree_item_ids=tree_item_ids or None)
+
+    return callback
 
 
 try:
     from c2cwsgiutils import broadcast
 
     @broadcast.decorator()
-    def _cache_invalidate_cb() -> None:
-        zope.event.notify(InvalidateCacheEvent())
+    def _cache_invalidate_cb(
+        tree_item_ids: Optional[List[int]] = None, generation_incremented: bool = False
+    ) -> None:
+        zope.event.notify(InvalidateCacheEvent(tree_item_ids, generation_incremented))
 
 except ModuleNotFoundError:
     LOG.error("c2cwsgiutils broadcast not found")
@@ -46,7 +46,7 @@ from sqlalchemy.types import Boolean, DateTime, Enum, Integer, String, Unicode
 
 from c2cgeoportal_commons.lib.literal import Literal
 from c2cgeoportal_commons.lib.url import get_url2
-from c2cgeoportal_commons.models import Base, _, cache_invalidate_cb
+from c2cgeoportal_commons.models import Base, _, cache_invalidate_cb, tree_item_cache_invalidate_cb
 from c2cgeoportal_commons.models.sqlalchemy import JSONEncodedDict, TsVector
 
 try:
@@ -362,9 +362,10 @@ class TreeItem(Base):  # type: ignore
         return f"{self.name}[{self.id}]>"
 
 
-event.listen(TreeItem, "after_insert", cache_invalidate_cb, propagate=True)
-event.listen(TreeItem, "after_update", cache_invalidate_cb, propagate=True)
-event.listen(TreeItem, "after_delete", cache_invalidate_cb, propagate=True)
+_tree_item_cache_invalidate_cb = tree_item_cache_invalidate_cb("id")
+event.listen(TreeItem, "after_insert", _tree_item_cache_invalidate_cb, propagate=True)
+event.listen(TreeItem, "after_update", _tree_item_cache_invalidate_cb, propagate=True)
+event.listen(TreeItem, "after_delete", _tree_item_cache_invalidate_cb, propagate=True)
 
 
 # association table TreeGroup <> TreeItem
@@ -426,9 +427,10 @@ class LayergroupTreeitem(Base):  # type: ignore
         return f"{self.id}"
 
 
-event.listen(LayergroupTreeitem, "after_insert", cache_invalidate_cb, propagate=True)
-event.listen(LayergroupTreeitem, "after_update", cache_invalidate_cb, propagate=True)
-event.listen(LayergroupTreeitem, "after_delete", cache_invalidate_cb, propagate=True)
+_layergroup_treeitem_cache_invalidate_cb = tree_item_cache_invalidate_cb("treegroup_id", "treeitem_id")
+event.listen(LayergroupTreeitem, "after_insert", _layergroup_treeitem_cache_invalidate_cb, propagate=True)
+event.listen(LayergroupTreeitem, "after_update", _layergroup_treeitem_cache_invalidate_cb, propagate=True)
+event.listen(LayergroupTreeitem, "after_delete", _layergroup_treeitem_cache_invalidate_cb, propagate=True)
 
 
 class TreeGroup(TreeItem):
@@ -1640,9 +1642,10 @@ class Metadata(Base):  # type: ignore
         return f"{self.name}={self.value}[{self.id}]"
 
 
-event.listen(Metadata, "after_insert", cache_invalidate_cb, propagate=True)
-event.listen(Metadata, "after_update", cache_invalidate_cb, propagate=True)
-event.listen(Metadata, "after_delete", cache_invalidate_cb, propagate=True)
+_metadata_cache_invalidate_cb = tree_item_cache_invalidate_cb("item_id")
+event.listen(Metadata, "after_insert", _metadata_cache_invalidate_cb, propagate=True)
+event.listen(Metadata, "after_update", _metadata_cache_invalidate_cb, propagate=True)
+event.listen(Metadata, "after_delete", _metadata_cache_invalidate_cb, propagate=True)
 
 
 class Dimension(Base):  # type: ignore
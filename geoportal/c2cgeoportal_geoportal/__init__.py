@@ -37,6 +37,7 @@ import c2cwsgiutils
 import c2cwsgiutils.db
 import c2cwsgiutils.index
 import pyramid.config
+import pyramid.events
 import pyramid.renderers
 import pyramid.request
 import pyramid.response
@@ -56,15 +57,26 @@ from sqlalchemy.orm import Session, joinedload
 
 import c2cgeoportal_commons.models
 import c2cgeoportal_geoportal.views
-from c2cgeoportal_commons.models import InvalidateCacheEvent
-from c2cgeoportal_geoportal.lib import C2CPregenerator, caching, check_collector, checker
+from c2cgeoportal_commons.models import InvalidateCacheEvent, InvalidateCacheOriginEvent
+from c2cgeoportal_geoportal.lib import (
+    C2CPregenerator,
+    caching,
+    check_collector,
+    checker,
+    legend_cache,
+    ogc_server_refresher,
+    upstream,
+    warmup,
+)
 from c2cgeoportal_geoportal.lib.cacheversion import version_cache_buster
 from c2cgeoportal_geoportal.lib.common_headers import Cache, set_common_headers
 from c2cgeoportal_geoportal.lib.i18n import available_locale_names
 from c2cgeoportal_geoportal.lib.metrics import (
+    STATS_FAMILIES,
     MemoryCacheSizeProvider,
     RasterDataSizeProvider,
     TotalPythonObjectMemoryProvider,
+    add_stats_providers,
 )
 from c2cgeoportal_geoportal.lib.xsd import XSD
 from c2cgeoportal_geoportal.views.entry import Entry, canvas_view
@@ -456,6 +468,12 @@ def includeme(config: pyramid.config.Configurator) -> None:
         add_provider(RasterDataSizeProvider())
     if metrics_config["total_python_object_memory"]:
         add_provider(TotalPythonObjectMemoryProvider())
+    if metrics_config.get("cache_stats", False):
+        # The regions are wrapped to count their usage only when the metrics are enabled
+        caching.configure_stats(True)
+    for family_name in STATS_FAMILIES:
+        if metrics_config.get(family_name, False):
+            add_stats_providers(family_name)
 
     # Initialize DBSessions
     init_db_sessions(settings, config, health_check)
@@ -473,17 +491,47 @@ def includeme(config: pyramid.config.Configurator) -> None:
         register_backend(
             "c2cgeoportal.hybridsentinel", "c2cgeoportal_geoportal.lib.caching", "HybridRedisSentinelBackend"
         )  # type: ignore[no-untyped-call]
+        register_backend(
+            "c2cgeoportal.memory", "c2cgeoportal_geoportal.lib.caching", "BoundedMemoryBackend"
+        )  # type: ignore[no-untyped-call]
+        register_backend(
+            "c2cgeoportal.shared", "c2cgeoportal_geoportal.lib.caching", "SharedMemoryBackend"
+        )  # type: ignore[no-untyped-call]
+        register_backend(
+            "c2cgeoportal.hybridshared", "c2cgeoportal_geoportal.lib.caching", "HybridSharedRedisBackend"
+        )  # type: ignore[no-untyped-call]
+        register_backend(
+            "c2cgeoportal.hybridsharedsentinel",
+            "c2cgeoportal_geoportal.lib.caching",
+            "HybridSharedRedisSentinelBackend",
+        )  # type: ignore[no-untyped-call]
+        caching.configure_memory_cache(settings.get("memory_cache", {}))
         for name, cache_config in settings["cache"].items():
             caching.init_region(cache_config, name)
 
+        @zope.event.classhandler.handler(InvalidateCacheOriginEvent)  # type: ignore[misc]
+        def handle_origin(event: InvalidateCacheOriginEvent) -> None:
+            caching.increment_generation(settings)
+            event.generation_incremented = True
+
         @zope.event.classhandler.handler(InvalidateCacheEvent)  # type: ignore[misc]
         def handle(event: InvalidateCacheEvent) -> None:
-            del event
-            caching.invalidate_region("std")
-            caching.invalidate_region("obj")
-            if caching.MEMORY_CACHE_DICT:
-                caching.get_region("std").delete_multi(list(caching.MEMORY_CACHE_DICT.keys()))
-            caching.MEMORY_CACHE_DICT.clear()
+            caching.invalidate_generation(settings, event.generation_incremented)
+
+        def refresh_generation(event: pyramid.events.NewRequest) -> None:
+            caching.refresh_generation(event.request.registry.settings)
+
+        config.add_subscriber(refresh_generation, pyramid.events.NewRequest)
+
+        ogc_server_refresher.init(config)
+
+    warmup.init(config)
+    upstream.init(settings)
+    legend_cache.init(settings)
+
+    from c2cgeoportal_geoportal.views.theme import FRAGMENT_CACHE  # pylint: disable=import-outside-toplevel
+
+    FRAGMENT_CACHE.configure(settings.get("themes", {}).get("fragment_cache_max_entries", 1000))
 
     # Register a tween to get back the cache buster path.
     if "cache_path" not in config.get_settings():
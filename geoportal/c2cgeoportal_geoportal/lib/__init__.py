@@ -27,12 +27,13 @@
 
 
 import datetime
+import functools
 import ipaddress
 import json
 import logging
 import re
 from string import Formatter
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union, cast
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar, Union, cast
 
 import dateutil
 import pyramid.request
@@ -47,6 +48,36 @@ from c2cgeoportal_geoportal.lib.caching import get_region
 LOG = logging.getLogger(__name__)
 CACHE_REGION = get_region("std")
 CACHE_REGION_OBJ = get_region("obj")
+_REQUEST_MEMO_ATTRIBUTE = "c2cgeoportal_memo"
+
+_Function = TypeVar("_Function", bound=Callable[..., Any])
+
+
+def request_memoize(key: Callable[..., Hashable], request_index: int = 0) -> Callable[[_Function], _Function]:
+    """
+    Memoize the result of a function for the duration of the request.
+
+    The result is stored on the request given as positional argument at `request_index`, the `key` function
+    gets the same arguments as the decorated function and should return what the result depends on,
+    e.g. the user. The returned values are shared, then they should not be modified by the callers.
+    """
+
+    def decorator(function: _Function) -> _Function:
+        @functools.wraps(function)
+        def wrapper(*args: Any) -> Any:
+            request = args[request_index]
+            memo = getattr(request, _REQUEST_MEMO_ATTRIBUTE, None)
+            if memo is None:
+                memo = {}
+                setattr(request, _REQUEST_MEMO_ATTRIBUTE, memo)
+            memo_key = (function.__qualname__, key(*args))
+            if memo_key not in memo:
+                memo[memo_key] = function(*args)
+            return memo[memo_key]
+
+        return cast(_Function, wrapper)
+
+    return decorator
 
 
 def get_types_map(types_array: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
@@ -216,6 +247,7 @@ def get_role_id(name: str) -> int:
     return cast(int, DBSession.query(main.Role.id).filter(main.Role.name == name).one()[0])
 
 
+@request_memoize(lambda request: request.user)
 def get_roles_id(request: pyramid.request.Request) -> List[int]:
     """Get the user roles ID."""
     result = [get_role_id(request.get_organization_role("anonymous"))]
@@ -227,6 +259,7 @@ def get_roles_id(request: pyramid.request.Request) -> List[int]:
     return result
 
 
+@request_memoize(lambda request: request.user)
 def get_roles_name(request: pyramid.request.Request) -> pyramid.response.Response:
     """Get the user roles name."""
     result = [request.get_organization_role("anonymous")]
@@ -238,6 +271,7 @@ def get_roles_name(request: pyramid.request.Request) -> pyramid.response.Respons
     return result
 
 
+@request_memoize(lambda request: request.client_addr)
 def is_intranet(request: pyramid.request.Request) -> bool:
     """Get if it's an intranet user."""
     address = ipaddress.ip_address(request.client_addr)
@@ -27,21 +27,51 @@
 
 
 import inspect
+import json
 import logging
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Sequence, Union
+import os
+import pickle  # nosec
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
 import pyramid.interfaces
 import sqlalchemy.ext.declarative
 import zope.interface
-from dogpile.cache.api import NO_VALUE, CacheBackend, CachedValue, NoValue
+from c2cwsgiutils import redis_utils
+from c2cwsgiutils.debug import get_size
+from dogpile.cache.api import NO_VALUE, CacheBackend, CachedValue, CacheMutex, NoValue
 from dogpile.cache.backends.memory import MemoryBackend
 from dogpile.cache.backends.redis import RedisBackend, RedisSentinelBackend
+from dogpile.cache.proxy import ProxyBackend
 from dogpile.cache.region import CacheRegion, make_region
 from dogpile.cache.util import sha1_mangle_key
 from sqlalchemy.orm.util import identity_key
 
 from c2cgeoportal_commons.models import Base
 
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None  # type: ignore[assignment]
+
 if TYPE_CHECKING:
     from dogpile.cache.api import SerializedReturnType
 else:
@@ -49,7 +79,414 @@ else:
 
 LOG = logging.getLogger(__name__)
 _REGION: Dict[str, CacheRegion] = {}
-MEMORY_CACHE_DICT: Dict[str, Any] = {}
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expire: Optional[float]
+
+
+_MISSING = object()
+
+
+class BoundedCacheDict(MutableMapping[str, Any]):
+    """
+    A thread safe dictionary used as memory cache, with a budget of entries and of size.
+
+    When the budget is exceeded the least recently used entries are evicted, the entries can also have
+    a time to live. The size of the entries is only computed when a maximum size is configured.
+    """
+
+    def __init__(self, max_entries: int = 0, max_size: int = 0):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.evictions: Dict[str, int] = {"entries": 0, "size": 0, "expired": 0}
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def configure(self, max_entries: int = 0, max_size: int = 0) -> None:
+        """Set the budget, 0 for no limit."""
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_size = max_size
+            self._entries = OrderedDict(
+                (key, entry._replace(size=self._get_size(entry.value)))
+                for key, entry in self._entries.items()
+            )
+            self.size = sum(entry.size for entry in self._entries.values())
+            self._evict()
+
+    def _get_size(self, value: Any) -> int:
+        return int(get_size(value)) if self.max_size > 0 else 0
+
+    def _evict(self) -> None:
+        while self.max_entries > 0 and len(self._entries) > self.max_entries:
+            self._pop_lru("entries")
+        # Keep at least the last entry even if it alone exceeds the budget
+        while self.max_size > 0 and self.size > self.max_size and len(self._entries) > 1:
+            self._pop_lru("size")
+
+    def _pop_lru(self, reason: str) -> None:
+        _, entry = self._entries.popitem(last=False)
+        self.size -= entry.size
+        self.evictions[reason] += 1
+
+    def _get_entry(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expire is not None and entry.expire < time.monotonic():
+            del self._entries[key]
+            self.size -= entry.size
+            self.evictions["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._get_entry(key)
+            return default if entry is None else entry.value
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                raise KeyError(key)
+            return entry.value
+
+    def set(self, key: str, value: Any, expiration_time: Optional[float] = None) -> None:
+        """Set a value, with an optional time to live in seconds."""
+        entry = _Entry(
+            value,
+            self._get_size(value),
+            time.monotonic() + expiration_time if expiration_time else None,
+        )
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry.size
+            self._entries[key] = entry
+            self.size += entry.size
+            self._evict()
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key)
+            self.size -= entry.size
+
+    def pop(self, key: str, default: Any = _MISSING) -> Any:
+        """Remove a value and return it, atomically (an entry can be evicted by an other thread)."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+                if entry.expire is None or entry.expire >= time.monotonic():
+                    return entry.value
+                self.evictions["expired"] += 1
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return isinstance(key, str) and self._get_entry(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> List[str]:  # type: ignore[override]
+        """Get a snapshot of the keys, without updating the recently used order."""
+        with self._lock:
+            return list(self._entries.keys())
+
+    def items(self) -> List[Tuple[str, Any]]:  # type: ignore[override]
+        """Get a snapshot of the items, without updating the recently used order."""
+        with self._lock:
+            return [(key, entry.value) for key, entry in self._entries.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+MEMORY_CACHE_DICT = BoundedCacheDict()
+
+
+def configure_memory_cache(config: Dict[str, Any]) -> None:
+    """Configure the budget of the memory cache, the maximum size is in MB."""
+    MEMORY_CACHE_DICT.configure(
+        max_entries=int(config.get("max_entries", 0)),
+        max_size=int(config.get("max_size", 0)) * 1024 * 1024,
+    )
+
+
+class SharedMemoryStore:
+    """
+    A bytes store shared by all the processes of the host.
+
+    The values are stored in an SQLite database that should be on a memory file system (``/dev/shm``),
+    it is memory-mapped by each process, then a value set by one process is directly visible to the others
+    and it is stored only once.
+    When the budget of entries or of size (in bytes) is exceeded the least recently used entries are evicted,
+    the budget is checked every ``EVICTION_CHECK_INTERVAL`` sets of each process.
+    """
+
+    EVICTION_CHECK_INTERVAL = 100
+    # Minimum time between two updates of the access time of an entry, in seconds
+    ACCESS_RESOLUTION = 10.0
+    # Maximum number of keys in one query, SQLite limits the number of variables of a statement
+    QUERY_KEYS = 500
+
+    def __init__(self, path: str, max_entries: int = 0, max_size: int = 0, timeout: float = 10.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.timeout = timeout
+        self.evictions: Dict[str, int] = {"entries": 0, "size": 0, "expired": 0}
+        self._local = threading.local()
+        self._sets = 0
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # The connections are not shared between the threads, and not reused after a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            if self.max_size > 0:
+                connection.execute(f"PRAGMA mmap_size={self.max_size * 2}")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expire REAL, access REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_access ON cache (access)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return cast(sqlite3.Connection, self._local.connection)
+
+    def get_multi(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Get the values, ``None`` for the missing or expired ones."""
+        if not keys:
+            return []
+        now = time.time()
+        connection = self._connection()
+        found: Dict[str, bytes] = {}
+        accessed = []
+        for chunk in self._chunks(keys):
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT key, value, expire, access FROM cache WHERE key IN ({placeholders})",  # nosec
+                chunk,
+            ).fetchall()
+            for key, value, expire, access in rows:
+                if expire is not None and expire < now:
+                    continue
+                found[key] = value
+                if access < now - self.ACCESS_RESOLUTION:
+                    accessed.append(key)
+        for chunk in self._chunks(accessed):
+            connection.execute(
+                f"UPDATE cache SET access = ? WHERE key IN ({','.join('?' * len(chunk))})",  # nosec
+                [now, *chunk],
+            )
+        return [found.get(key) for key in keys]
+
+    def _chunks(self, keys: Sequence[str]) -> Iterator[List[str]]:
+        for index in range(0, len(keys), self.QUERY_KEYS):
+            yield list(keys[index : index + self.QUERY_KEYS])
+
+    def set_multi(self, mapping: Mapping[str, bytes], expiration_time: Optional[float] = None) -> None:
+        if not mapping:
+            return
+        now = time.time()
+        expire = now + expiration_time if expiration_time else None
+        self._connection().executemany(
+            "INSERT OR REPLACE INTO cache (key, value, size, expire, access) VALUES (?, ?, ?, ?, ?)",
+            [(key, value, len(value), expire, now) for key, value in mapping.items()],
+        )
+        with self._lock:
+            self._sets += len(mapping)
+            if self._sets < self.EVICTION_CHECK_INTERVAL:
+                return
+            self._sets = 0
+        self.evict()
+
+    def delete_multi(self, keys: Sequence[str]) -> None:
+        for chunk in self._chunks(keys):
+            self._connection().execute(
+                f"DELETE FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk  # nosec
+            )
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM cache")
+
+    def evict(self) -> None:
+        """Remove the expired entries, then the least recently used ones while the budget is exceeded."""
+        connection = self._connection()
+        self.evictions["expired"] += connection.execute(
+            "DELETE FROM cache WHERE expire < ?", (time.time(),)
+        ).rowcount
+        if self.max_entries <= 0 and self.max_size <= 0:
+            return
+        entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        evicted = []
+        for key, entry_size in connection.execute("SELECT key, size FROM cache ORDER BY access"):
+            if self.max_entries > 0 and entries > self.max_entries:
+                self.evictions["entries"] += 1
+            # Keep at least the last entry even if it alone exceeds the budget
+            elif self.max_size > 0 and size > self.max_size and entries > 1:
+                self.evictions["size"] += 1
+            else:
+                break
+            evicted.append(key)
+            entries -= 1
+            size -= entry_size
+        self.delete_multi(evicted)
+
+
+class CacheStats:
+    """Thread safe counters of the cache usage, by region and by cached function."""
+
+    COUNTERS = (
+        "hits",
+        "misses",
+        "memory_hits",
+        "redis_hits",
+        "creations",
+        "creation_seconds",
+        "stored_bytes",
+    )
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def add(self, region: str, key: str, counter: str, value: float = 1) -> None:
+        labels = (region, _get_function_name(key))
+        with self._lock:
+            counters = self._data.get(labels)
+            if counters is None:
+                counters = self._data[labels] = {counter_: 0 for counter_ in self.COUNTERS}
+            counters[counter] += value
+
+    def get_data(self) -> List[Tuple[Dict[str, str], Dict[str, float]]]:
+        with self._lock:
+            return [
+                ({"region": region, "function": function}, dict(counters))
+                for (region, function), counters in self._data.items()
+            ]
+
+
+CACHE_STATS = CacheStats()
+_stats_enabled = False
+
+
+def _get_function_name(key: str) -> str:
+    """Get the cached function ('module|function') from a key generated by the ``keygen_function``."""
+    generation, separator, key_ = key.partition(":")
+    if separator and generation.isdigit():
+        key = key_
+    parts = key.split("|", 2)
+    return "|".join(parts[:2]) if len(parts) > 1 else "other"
+
+
+class StatsProxy(ProxyBackend):
+    """
+    Count the hits, the misses and the creations of the values of a region in ``CACHE_STATS``.
+
+    The creation time is the time between the miss and the set of the value in the same thread.
+
+    Dogpile reads the value a second time once the creation lock is acquired, so a miss is only
+    counted once, on the set of the value or on the hit that follows it in the same thread.
+    """
+
+    def __init__(self, region: str):
+        super().__init__()  # type: ignore[no-untyped-call]
+        self.region = region
+        self._local = threading.local()
+
+    def wrap(self, backend: CacheBackend) -> ProxyBackend:
+        if isinstance(backend, HybridRedisBackend):
+            backend.stats_region = self.region
+        return super().wrap(backend)
+
+    def _get_misses(self) -> Dict[str, float]:
+        misses: Optional[Dict[str, float]] = getattr(self._local, "misses", None)
+        if misses is None or len(misses) > 100:
+            misses = self._local.misses = {}
+        return misses
+
+    def _count_get(self, key: str, value: Any) -> None:
+        if value is NO_VALUE:
+            self._get_misses().setdefault(key, time.monotonic())
+        elif self._get_misses().pop(key, None) is not None:
+            # The value was created by an other thread while waiting for the creation lock
+            CACHE_STATS.add(self.region, key, "misses")
+        else:
+            CACHE_STATS.add(self.region, key, "hits")
+
+    def _count_set(self, key: str) -> None:
+        CACHE_STATS.add(self.region, key, "creations")
+        start = self._get_misses().pop(key, None)
+        if start is not None:
+            CACHE_STATS.add(self.region, key, "misses")
+            CACHE_STATS.add(self.region, key, "creation_seconds", time.monotonic() - start)
+
+    def get(self, key: str) -> Union[CachedValue, bytes, NoValue]:
+        value = self.proxied.get(key)
+        self._count_get(key, value)
+        return value
+
+    def get_multi(self, keys: Sequence[str]) -> Sequence[Union[CachedValue, bytes, NoValue]]:
+        values = self.proxied.get_multi(keys)
+        for key, value in zip(keys, values):
+            self._count_get(key, value)
+        return values
+
+    def set(self, key: str, value: Union[CachedValue, bytes]) -> None:
+        self.proxied.set(key, value)
+        self._count_set(key)
+
+    def set_multi(self, mapping: Mapping[str, Union[CachedValue, bytes]]) -> None:
+        self.proxied.set_multi(mapping)
+        for key in mapping:
+            self._count_set(key)
+
+    # For the backends with a serializer, like dogpile.cache.redis
+
+    def get_serialized(self, key: str) -> SerializedReturnType:
+        value = self.proxied.get_serialized(key)
+        self._count_get(key, value)
+        return value
+
+    def get_serialized_multi(self, keys: Sequence[str]) -> Sequence[SerializedReturnType]:
+        values = self.proxied.get_serialized_multi(keys)
+        for key, value in zip(keys, values):
+            self._count_get(key, value)
+        return values
+
+    def set_serialized(self, key: str, value: bytes) -> None:
+        self.proxied.set_serialized(key, value)
+        self._count_set(key)
+        CACHE_STATS.add(self.region, key, "stored_bytes", len(value))
+
+    def set_serialized_multi(self, mapping: Mapping[str, bytes]) -> None:
+        self.proxied.set_serialized_multi(mapping)
+        for key, value in mapping.items():
+            self._count_set(key)
+            CACHE_STATS.add(self.region, key, "stored_bytes", len(value))
 
 
 def map_dbobject(
@@ -95,25 +532,119 @@ def keygen_function(namespace: Any, function: Callable[..., Any]) -> Callable[..
 def init_region(conf: Dict[str, Any], region: str) -> CacheRegion:
     """Initialize the caching module."""
     cache_region = get_region(region)
-    _configure_region(conf, cache_region)
+    _configure_region(conf, cache_region, region)
     return cache_region
 
 
-def _configure_region(conf: Dict[str, Any], cache_region: CacheRegion) -> None:
+def configure_stats(enabled: bool) -> None:
+    """Count the cache usage in ``CACHE_STATS`` in the regions initialized afterwards."""
+    global _stats_enabled  # pylint: disable=global-statement
+    _stats_enabled = enabled
+
+
+def _configure_region(conf: Dict[str, Any], cache_region: CacheRegion, region: str) -> None:
     kwargs: Dict[str, Any] = {"replace_existing_backend": True}
     backend = conf["backend"]
     kwargs.update({k: conf[k] for k in conf if k != "backend"})
     kwargs.setdefault("arguments", {}).setdefault("cache_dict", MEMORY_CACHE_DICT)
+    kwargs["arguments"].setdefault("region_name", region)
+    if _stats_enabled:
+        kwargs["wrap"] = [*kwargs.get("wrap", []), StatsProxy(region)]
     cache_region.configure(backend, **kwargs)
 
 
 def get_region(region: str) -> CacheRegion:
     """Return a cache region."""
     if region not in _REGION:
-        _REGION[region] = make_region(function_key_generator=keygen_function)
+        _REGION[region] = make_region(
+            function_key_generator=keygen_function,
+            key_mangler=_generation_key_mangler if region in GENERATION_REGIONS else None,
+        )
     return _REGION[region]
 
 
+# The regions invalidated on an InvalidateCacheEvent, the generation is folded into their keys
+GENERATION_REGIONS = ("std", "obj")
+# Minimum interval in seconds between two reads of the generation in Redis
+GENERATION_CHECK_INTERVAL = 1.0
+_GENERATION_KEY = "c2cgeoportal_cache_generation"
+_generation = 0
+_generation_checked = 0.0
+_generation_lock = threading.Lock()
+
+
+def _generation_key_mangler(key: str) -> str:
+    return f"{_generation}:{key}"
+
+
+def get_generation() -> int:
+    """Get the current generation of the cache, as mirrored in the process."""
+    return _generation
+
+
+def _set_generation(generation: int) -> None:
+    global _generation  # pylint: disable=global-statement
+    with _generation_lock:
+        if generation == _generation:
+            return
+        _generation = generation
+        # The entries of the previous generations will never be used again, free the memory
+        prefix = f"{generation}:"
+        for key in MEMORY_CACHE_DICT.keys():
+            generation_, separator, _ = key.partition(":")
+            if separator and generation_.isdigit() and not key.startswith(prefix):
+                MEMORY_CACHE_DICT.pop(key, None)
+
+
+def increment_generation(settings: Optional[Mapping[str, Any]] = None) -> int:
+    """
+    Invalidate the generation regions of all the processes with one atomic ``INCR`` in Redis.
+
+    Without Redis only the generation of the current process is incremented.
+    """
+    master, _, _ = redis_utils.get(settings)
+    _set_generation(int(master.incr(_GENERATION_KEY)) if master is not None else _generation + 1)
+    return _generation
+
+
+def refresh_generation(settings: Optional[Mapping[str, Any]] = None, force: bool = False) -> None:
+    """Get the generation from Redis, at most every ``GENERATION_CHECK_INTERVAL`` seconds."""
+    global _generation_checked  # pylint: disable=global-statement
+    now = time.monotonic()
+    if not force and now - _generation_checked < GENERATION_CHECK_INTERVAL:
+        return
+    _generation_checked = now
+    _, slave, _ = redis_utils.get(settings)
+    if slave is None:
+        return
+    try:
+        _set_generation(int(slave.get(_GENERATION_KEY) or 0))
+    except Exception:  # pylint: disable=broad-exception-caught
+        LOG.warning("Unable to get the cache generation from Redis", exc_info=True)
+
+
+def invalidate_generation(settings: Optional[Mapping[str, Any]], generation_incremented: bool) -> None:
+    """
+    Apply a broadcast cache invalidation to the current process.
+
+    When the originating process didn't increment the generation (e.g. the admin interface or a script,
+    that hasn't the geoportal handler) the generation regions are invalidated locally.
+    The memory entries of the other regions (e.g. ``ogc-server``) are dropped, then they are get back
+    from the shared backend or created again.
+    """
+    if generation_incremented:
+        # Not needed for the correctness, the generation is also checked on each request
+        refresh_generation(settings, force=True)
+    else:
+        for region in GENERATION_REGIONS:
+            if region in _REGION:
+                invalidate_region(region)
+    for key in MEMORY_CACHE_DICT.keys():
+        generation, separator, _ = key.partition(":")
+        if not separator or not generation.isdigit():
+            MEMORY_CACHE_DICT.pop(key, None)
+
+
 def invalidate_region(region: Optional[str] = None) -> None:
     """Invalidate a cache region."""
     if region is None:
@@ -123,51 +654,309 @@ def invalidate_region(region: Optional[str] = None) -> None:
         get_region(region).invalidate()  # type: ignore[no-untyped-call]
 
 
+class BoundedMemoryBackend(MemoryBackend):
+    """
+    A memory backend with a time to live on the entries.
+
+    With the ``memory_expiration_time`` argument in seconds, requires a ``BoundedCacheDict`` as
+    ``cache_dict``, the default one is bounded by the ``memory_cache`` configuration.
+    """
+
+    def __init__(self, arguments: Dict[str, Any]):
+        super().__init__(arguments)  # type: ignore[no-untyped-call]
+        self._expiration_time: Optional[float] = arguments.pop("memory_expiration_time", None)
+        if self._expiration_time and not isinstance(self._cache, BoundedCacheDict):
+            raise ValueError("The 'memory_expiration_time' requires a 'BoundedCacheDict' as 'cache_dict'")
+
+    def set(self, key: str, value: Union[CachedValue, bytes]) -> None:
+        if self._expiration_time:
+            self._cache.set(key, value, self._expiration_time)
+        else:
+            self._cache[key] = value
+
+    def set_multi(self, mapping: Mapping[str, Union[CachedValue, bytes]]) -> None:
+        for key, value in mapping.items():
+            self.set(key, value)
+
+
+def _redis_key(key: str) -> str:
+    """Get the key used in Redis, the keys can be too long to be used directly."""
+    return sha1_mangle_key(key.encode())  # type: ignore[no-untyped-call,no-any-return]
+
+
+def _get_compression(
+    name: str,
+) -> Tuple[bytes, Callable[[bytes, Optional[int]], bytes], Callable[[bytes], bytes]]:
+    """Get the code, the compress and the decompress functions of a compression algorithm."""
+    # pylint: disable=import-outside-toplevel
+    if name == "zlib":
+        import zlib
+
+        return (
+            b"z",
+            lambda data, level: zlib.compress(data, -1 if level is None else level),
+            zlib.decompress,
+        )
+    if name == "zstd":
+        import zstandard
+
+        return (
+            b"s",
+            lambda data, level: zstandard.ZstdCompressor(level=3 if level is None else level).compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data),
+        )
+    if name == "lz4":
+        import lz4.frame
+
+        return (
+            b"4",
+            lambda data, level: lz4.frame.compress(data, compression_level=level or 0),
+            lz4.frame.decompress,
+        )
+    raise ValueError(f"Unknown compression '{name}', should be 'zlib', 'zstd' or 'lz4'")
+
+
+_COMPRESSION_NAMES = {b"z": "zlib", b"s": "zstd", b"4": "lz4"}
+_SERIALIZED_VERSION = b"\x01"
+
+
+def _check_json_keys(value: Any) -> None:
+    """Reject the not string keys, that the standard JSON module silently converts to strings, like orjson."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError(f"Dict key must be str, not {type(key).__name__}")
+            _check_json_keys(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _check_json_keys(item)
+
+
+class CacheSerializer:
+    """
+    Serialize the values stored in Redis, with a compression above a size threshold.
+
+    The ``json`` serializer uses orjson when it is installed (``orjson`` extra), it is faster and more
+    compact than pickle but only for the regions with JSON values: the tuples are get back as lists.
+    The values that are not JSON serializable, including the dictionaries with not string keys,
+    fall back to pickle.
+    The compression can be ``zlib``, ``zstd`` (requires zstandard) or ``lz4`` (requires lz4).
+
+    The serialized values start with a header with the used serializer and compression, then the values
+    stay readable after a configuration change.
+    """
+
+    def __init__(
+        self,
+        serializer: str = "pickle",
+        compression: Optional[str] = None,
+        compression_threshold: int = 1024,
+        compression_level: Optional[int] = None,
+    ):
+        if serializer not in ("pickle", "json"):
+            raise ValueError(f"Unknown serializer '{serializer}', should be 'pickle' or 'json'")
+        self.serializer = serializer
+        self.compression = _get_compression(compression) if compression else None
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self._decompressions: Dict[bytes, Callable[[bytes], bytes]] = {}
+
+    def dumps(self, value: Union[CachedValue, bytes]) -> bytes:
+        data = None
+        if self.serializer == "json" and isinstance(value, CachedValue):
+            try:
+                if orjson is not None:
+                    data = b"j" + orjson.dumps([value.payload, value.metadata])
+                else:
+                    _check_json_keys(value.payload)
+                    data = b"j" + json.dumps([value.payload, value.metadata]).encode()
+            except (TypeError, ValueError):
+                pass
+        if data is None:
+            data = b"p" + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.compression is not None and len(data) > self.compression_threshold:
+            code, compress, _ = self.compression
+            return _SERIALIZED_VERSION + code + compress(data, self.compression_level)
+        return _SERIALIZED_VERSION + b"-" + data
+
+    def loads(self, data: bytes) -> Union[CachedValue, bytes]:
+        if not data.startswith(_SERIALIZED_VERSION):
+            # Value stored without serializer configuration
+            return cast(Union[CachedValue, bytes], pickle.loads(data))  # nosec
+        code = data[1:2]
+        data = data[2:]
+        if code != b"-":
+            if code not in self._decompressions:
+                _, _, self._decompressions[code] = _get_compression(_COMPRESSION_NAMES[code])
+            data = self._decompressions[code](data)
+        if data[:1] == b"j":
+            payload, metadata = json.loads(data[1:]) if orjson is None else orjson.loads(data[1:])
+            return CachedValue(payload, metadata)
+        return cast(Union[CachedValue, bytes], pickle.loads(data[1:]))  # nosec
+
+
+def _pop_serializer(arguments: Dict[str, Any]) -> CacheSerializer:
+    return CacheSerializer(
+        serializer=arguments.pop("serializer", "pickle"),
+        compression=arguments.pop("compression", None),
+        compression_threshold=int(arguments.pop("compression_threshold", 1024)),
+        compression_level=arguments.pop("compression_level", None),
+    )
+
+
+def _pop_shared_memory_store(arguments: Dict[str, Any]) -> Tuple[SharedMemoryStore, Optional[float]]:
+    # One file per region by default, each one with its own size budget
+    region_name = arguments.pop("region_name", "default")
+    return (
+        SharedMemoryStore(
+            arguments.pop("shared_path", f"/dev/shm/c2cgeoportal_cache_{region_name}.sqlite"),  # nosec
+            max_entries=int(arguments.pop("shared_max_entries", 0)),
+            max_size=int(arguments.pop("shared_max_size", 0)) * 1024 * 1024,
+        ),
+        arguments.pop("shared_expiration_time", None),
+    )
+
+
+class SharedMemoryBackend(CacheBackend):
+    """
+    A Dogpile cache backend that stores the values in a ``SharedMemoryStore``.
+
+    The store is configured with the ``shared_path`` (one file per region by default), ``shared_max_entries``,
+    ``shared_max_size`` (MB) and ``shared_expiration_time`` (seconds) arguments, the values are serialized by
+    a ``CacheSerializer``.
+    The values are deserialized on each get, then it's not suitable for the regions with SQLAlchemy objects
+    or classes (like the ``obj`` region).
+    """
+
+    def __init__(self, arguments: Dict[str, Any]):
+        self._serializer = _pop_serializer(arguments)
+        self._store, self._expiration_time = _pop_shared_memory_store(arguments)
+
+    def get(self, key: str) -> Union[CachedValue, bytes, NoValue]:
+        return self.get_multi([key])[0]
+
+    def get_multi(self, keys: Sequence[str]) -> List[Union[CachedValue, bytes, NoValue]]:
+        return [
+            NO_VALUE if value is None else self._serializer.loads(value)
+            for value in self._store.get_multi(keys)
+        ]
+
+    def set(self, key: str, value: Union[CachedValue, bytes]) -> None:
+        self.set_multi({key: value})
+
+    def set_multi(self, mapping: Mapping[str, Union[CachedValue, bytes]]) -> None:
+        self._store.set_multi(
+            {key: self._serializer.dumps(value) for key, value in mapping.items()}, self._expiration_time
+        )
+
+    def delete(self, key: str) -> None:
+        self._store.delete_multi([key])
+
+    def delete_multi(self, keys: Sequence[str]) -> None:
+        self._store.delete_multi(keys)
+
+
 class HybridRedisBackend(CacheBackend):
-    """A Dogpile cache backend with a memory cache backend in front of a Redis backend for performance."""
+    """
+    A Dogpile cache backend with a memory cache backend in front of a Redis backend for performance.
+
+    The values stored in Redis are serialized by a ``CacheSerializer`` configured with the
+    ``serializer``, ``compression``, ``compression_threshold`` and ``compression_level`` arguments.
+    """
+
+    # The region name used in the stats, set by the StatsProxy
+    stats_region: Optional[str] = None
 
     def __init__(self, arguments: Dict[str, Any]):
         self._use_memory_cache = not arguments.pop("disable_memory_cache", False)
-        self._memory: CacheBackend = MemoryBackend(  # type: ignore[no-untyped-call]
-            {"cache_dict": arguments.pop("cache_dict", {})},
+        self._serializer = _pop_serializer(arguments)
+        self._memory: CacheBackend = BoundedMemoryBackend(
+            {
+                "cache_dict": arguments.pop("cache_dict", {}),
+                "memory_expiration_time": arguments.pop("memory_expiration_time", None),
+            },
         )
         self._redis: CacheBackend = RedisBackend(arguments)  # type: ignore[no-untyped-call]
 
+    def _count(self, key: str, counter: str, value: float = 1) -> None:
+        if self.stats_region is not None:
+            CACHE_STATS.add(self.stats_region, key, counter, value)
+
     def get(self, key: str) -> Union[CachedValue, bytes, NoValue]:
         value = self._memory.get(key)
         if value == NO_VALUE:
-            val = self._redis.get_serialized(sha1_mangle_key(key.encode()))  # type: ignore[no-untyped-call]
+            val = self._redis.get_serialized(_redis_key(key))
             if val in (None, NO_VALUE):
                 return NO_VALUE
             assert isinstance(val, bytes)
-            value = self._redis.deserializer(val)  # type: ignore[misc]
-            if value != NO_VALUE and self._use_memory_cache:
-                assert isinstance(value, (CachedValue, bytes))
+            self._count(key, "redis_hits")
+            value = self._serializer.loads(val)
+            if self._use_memory_cache:
                 self._memory.set(key, value)
+        else:
+            self._count(key, "memory_hits")
         return value
 
     def get_multi(self, keys: Sequence[str]) -> List[Union[CachedValue, bytes, NoValue]]:
-        return [self.get(key) for key in keys]
+        """Get the values from the memory cache, then the missing ones from Redis with one ``MGET``."""
+        values: List[Union[CachedValue, bytes, NoValue]] = list(self._memory.get_multi(keys))
+        missing = [index for index, value in enumerate(values) if value == NO_VALUE]
+        for index, key in enumerate(keys):
+            if values[index] != NO_VALUE:
+                self._count(key, "memory_hits")
+        if not missing:
+            return values
+        serialized_values = self._redis.get_serialized_multi([_redis_key(keys[index]) for index in missing])
+        backfill: Dict[str, Union[CachedValue, bytes]] = {}
+        for index, serialized in zip(missing, serialized_values):
+            if serialized in (None, NO_VALUE):
+                continue
+            assert isinstance(serialized, bytes)
+            self._count(keys[index], "redis_hits")
+            values[index] = backfill[keys[index]] = self._serializer.loads(serialized)
+        if backfill and self._use_memory_cache:
+            self._memory.set_multi(backfill)
+        return values
 
     def set(self, key: str, value: Union[CachedValue, bytes]) -> None:
         if self._use_memory_cache:
             self._memory.set(key, value)
-        self._redis.set_serialized(
-            sha1_mangle_key(key.encode()),  # type: ignore[no-untyped-call]
-            self._redis.serializer(value),  # type: ignore[misc]
-        )
+        serialized = self._serializer.dumps(value)
+        self._count(key, "stored_bytes", len(serialized))
+        self._redis.set_serialized(_redis_key(key), serialized)
 
     def set_multi(self, mapping: Mapping[str, Union[CachedValue, bytes]]) -> None:
+        """Set the values with one ``MSET`` (or one pipeline of ``SETEX`` when an expiration is set)."""
+        if not mapping:
+            return
+        if self._use_memory_cache:
+            self._memory.set_multi(mapping)
+        serialized_mapping = {}
         for key, value in mapping.items():
-            self.set(key, value)
+            serialized = self._serializer.dumps(value)
+            self._count(key, "stored_bytes", len(serialized))
+            serialized_mapping[_redis_key(key)] = serialized
+        self._redis.set_serialized_multi(serialized_mapping)
+
+    def get_mutex(self, key: str) -> Optional[CacheMutex]:
+        """
+        Get the Redis lock when ``distributed_lock`` is set.
+
+        Only one process computes a value, the others wait on the lock (during at most ``lock_timeout``
+        seconds) then get the value from Redis.
+        """
+        return self._redis.get_mutex(_redis_key(key))
 
     def delete(self, key: str) -> None:
         self._memory.delete(key)
-        self._redis.delete(key)
+        self._redis.delete(_redis_key(key))
 
     def delete_multi(self, keys: Sequence[str]) -> None:
+        """Delete the keys with one ``DEL``."""
+        if not keys:
+            return
         self._memory.delete_multi(keys)
-        self._redis.delete_multi(keys)
+        self._redis.delete_multi([_redis_key(key) for key in keys])
 
 
 class HybridRedisSentinelBackend(HybridRedisBackend):
@@ -176,3 +965,74 @@ class HybridRedisSentinelBackend(HybridRedisBackend):
     def __init__(self, arguments: Dict[str, Any]):
         super().__init__(arguments)
         self._redis = RedisSentinelBackend(arguments)  # type: ignore[no-untyped-call]
+
+
+class HybridSharedRedisBackend(HybridRedisBackend):
+    """
+    Same as HybridRedisBackend but with a ``SharedMemoryStore`` in front of Redis instead of the memory cache.
+
+    The values are stored once for all the processes of the host (instead of once per process), and a value
+    computed by a process is directly visible to the others. The store is configured like the one
+    of the ``SharedMemoryBackend``, the values are serialized once for the store and Redis.
+    """
+
+    def __init__(self, arguments: Dict[str, Any]):
+        self._store, self._expiration_time = _pop_shared_memory_store(arguments)
+        super().__init__(arguments)
+
+    def get(self, key: str) -> Union[CachedValue, bytes, NoValue]:
+        return self.get_multi([key])[0]
+
+    def get_multi(self, keys: Sequence[str]) -> List[Union[CachedValue, bytes, NoValue]]:
+        """Get the values from the shared store, then the missing ones from Redis with one ``MGET``."""
+        serialized_values: List[Optional[bytes]] = self._store.get_multi(keys)
+        missing = [index for index, value in enumerate(serialized_values) if value is None]
+        for index, key in enumerate(keys):
+            if serialized_values[index] is not None:
+                self._count(key, "memory_hits")
+        if missing:
+            backfill = {}
+            for index, serialized in zip(
+                missing, self._redis.get_serialized_multi([_redis_key(keys[index]) for index in missing])
+            ):
+                if serialized in (None, NO_VALUE):
+                    continue
+                assert isinstance(serialized, bytes)
+                self._count(keys[index], "redis_hits")
+                serialized_values[index] = backfill[keys[index]] = serialized
+            if backfill and self._use_memory_cache:
+                self._store.set_multi(backfill, self._expiration_time)
+        return [NO_VALUE if value is None else self._serializer.loads(value) for value in serialized_values]
+
+    def set(self, key: str, value: Union[CachedValue, bytes]) -> None:
+        self.set_multi({key: value})
+
+    def set_multi(self, mapping: Mapping[str, Union[CachedValue, bytes]]) -> None:
+        if not mapping:
+            return
+        serialized_mapping = {}
+        for key, value in mapping.items():
+            serialized_mapping[key] = self._serializer.dumps(value)
+            self._count(key, "stored_bytes", len(serialized_mapping[key]))
+        if self._use_memory_cache:
+            self._store.set_multi(serialized_mapping, self._expiration_time)
+        self._redis.set_serialized_multi(
+            {_redis_key(key): value for key, value in serialized_mapping.items()}
+        )
+
+    def delete(self, key: str) -> None:
+        self.delete_multi([key])
+
+    def delete_multi(self, keys: Sequence[str]) -> None:
+        if not keys:
+            return
+        self._store.delete_multi(keys)
+        self._redis.delete_multi([_redis_key(key) for key in keys])
+
+
+class HybridSharedRedisSentinelBackend(HybridSharedRedisBackend):
+    """Same as HybridSharedRedisBackend but using the Redis Sentinel."""
+
+    def __init__(self, arguments: Dict[str, Any]):
+        super().__init__(arguments)
+        self._redis = RedisSentinelBackend(arguments)  # type: ignore[no-untyped-call]
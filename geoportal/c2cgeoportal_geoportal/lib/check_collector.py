@@ -30,9 +30,9 @@ from typing import Any, Dict, Optional, cast
 import c2cwsgiutils.health_check
 import pyramid.config
 import pyramid.request
-import requests
 
 from c2cgeoportal_geoportal.lib.checker import build_url
+from c2cgeoportal_geoportal.lib.http_session import get_session
 
 LOG = logging.getLogger(__name__)
 
@@ -66,7 +66,8 @@ def init(config: pyramid.config.Configurator, health_check: c2cwsgiutils.health_
                         f"{self.host['url'].rstrip('/')}/{c2c_base.strip('/')}/health_check",
                         request,
                     )
-                    r = requests.get(
+                    session, _ = get_session(request.registry.settings.get("http_options", {}))
+                    r = session.get(
                         params={"max_level": str(self.host.get("max_level", max_level))},
                         timeout=120,
                         **url_headers,  # type: ignore
@@ -36,7 +36,8 @@ from urllib.parse import urljoin
 import c2cwsgiutils.health_check
 import pyramid.config
 import pyramid.request
-import requests
+
+from c2cgeoportal_geoportal.lib.http_session import get_cookie_session, get_session
 
 LOG = logging.getLogger(__name__)
 
@@ -106,7 +107,8 @@ def _pdf3(settings: Dict[str, Any], health_check: c2cwsgiutils.health_check.Heal
         path = request.route_path("printproxy_report_create", format="pdf")
         url_headers = build_url("Check the printproxy request (create)", path, request)
 
-        session = requests.session()
+        # The print jobs can be sticky to a print server instance with a cookie (e.g. JSESSIONID)
+        session = get_cookie_session(request.registry.settings.get("http_options", {}))
         resp = session.post(json=print_settings["spec"], timeout=30, **url_headers)  # type: ignore
         resp.raise_for_status()
 
@@ -166,7 +168,7 @@ def _themes_errors(settings: Dict[str, Any], health_check: c2cwsgiutils.health_c
 
     def check(request: pyramid.request.Request) -> None:
         path = request.route_path("themes")
-        session = requests.session()
+        session, _ = get_session(request.registry.settings.get("http_options", {}))
         for (interface,) in DBSession.query(Interface.name).all():
             params: Dict[str, str] = {}
             params.update(default_params)
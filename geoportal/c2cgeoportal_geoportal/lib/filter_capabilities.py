@@ -36,7 +36,6 @@ from xml.sax.saxutils import XMLFilterBase, XMLGenerator  # nosec
 import defusedxml.expatreader
 import pyramid.httpexceptions
 import pyramid.request
-import requests
 from owslib.map.wms111 import ContentMetadata as ContentMetadata111
 from owslib.map.wms130 import ContentMetadata as ContentMetadata130
 from owslib.wms import WebMapService
@@ -44,6 +43,7 @@ from pyramid.httpexceptions import HTTPBadGateway
 
 from c2cgeoportal_commons.lib.url import Url
 from c2cgeoportal_geoportal.lib import caching, get_ogc_server_wfs_url_ids, get_ogc_server_wms_url_ids
+from c2cgeoportal_geoportal.lib.http_session import get_session
 from c2cgeoportal_geoportal.lib.layers import get_private_layers, get_protected_layers, get_writable_layers
 
 CACHE_REGION = caching.get_region("std")
@@ -61,9 +61,8 @@ def wms_structure(wms_url: Url, host: str, request: pyramid.request.Request) ->
     if url.hostname == "localhost" and host is not None:
         headers["Host"] = host
     try:
-        response = requests.get(
-            url.url(), headers=headers, **request.registry.settings.get("http_options", {})
-        )
+        session, options = get_session(request.registry.settings.get("http_options", {}))
+        response = session.get(url.url(), headers=headers, **options)
     except Exception:
         LOG.exception("Unable to GetCapabilities from wms_url '%s'", wms_url)
         raise HTTPBadGateway(  # pylint: disable=raise-missing-from
@@ -33,7 +33,7 @@ import pyramid.request
 from sqlalchemy.orm import joinedload
 
 from c2cgeoportal_commons.models import main, static
-from c2cgeoportal_geoportal.lib import get_typed, get_types_map, is_intranet
+from c2cgeoportal_geoportal.lib import get_typed, get_types_map, is_intranet, request_memoize
 from c2cgeoportal_geoportal.lib.caching import get_region
 
 LOG = logging.getLogger(__name__)
@@ -101,6 +101,7 @@ def _get_functionalities_type(request: pyramid.request.Request) -> Dict[str, Dic
     )
 
 
+@request_memoize(lambda name, request, is_intranet_: (name, is_intranet_, request.user), request_index=1)
 def get_functionality(
     name: str, request: pyramid.request.Request, is_intranet_: bool
 ) -> List[Union[str, int, float, bool, List[Any], Dict[str, Any]]]:
@@ -144,6 +145,7 @@ def get_functionality(
     return result
 
 
+@request_memoize(lambda request: request.user)
 def get_mapserver_substitution_params(request: pyramid.request.Request) -> Dict[str, str]:
     """Get the parameters used by the mapserver substitution."""
     params: Dict[str, str] = {}
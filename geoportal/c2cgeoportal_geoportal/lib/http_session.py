@@ -0,0 +1,130 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+import http.cookiejar
+import json
+import os
+import threading
+from typing import Any, Dict, List, Mapping, Tuple
+
+import requests
+import requests.adapters
+from urllib3.util.retry import Retry
+
+# The options of the http_options used to configure the connection pools, the other ones are given
+# to the requests
+POOL_OPTIONS = ("pool_connections", "pool_maxsize", "pool_block", "max_retries")
+
+_SESSIONS: Dict[str, requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    """Don't share the connections of the main process with the forked workers."""
+    global _SESSIONS_LOCK  # pylint: disable=global-statement
+    _SESSIONS.clear()
+    _SESSIONS_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_session(http_options: Mapping[str, Any]) -> Tuple[requests.Session, Dict[str, Any]]:
+    """
+    Get the shared session for the pool options of the ``http_options``, and the other options.
+
+    The session keeps the connections to the upstream servers alive, with one pool per host.
+    The pool options are ``pool_connections`` (the number of hosts), ``pool_maxsize`` (the number of kept
+    connections per host), ``pool_block`` (wait for a free connection instead of opening a new one) and
+    ``max_retries`` (a number, or the arguments of the urllib3 ``Retry``).
+    The other options (``timeout``, ``verify``, ...) should be given to the requests.
+    """
+    pool_options = {key: value for key, value in http_options.items() if key in POOL_OPTIONS}
+    request_options = {key: value for key, value in http_options.items() if key not in POOL_OPTIONS}
+    key = json.dumps(pool_options, sort_keys=True)
+    with _SESSIONS_LOCK:
+        if key not in _SESSIONS:
+            _SESSIONS[key] = _create_session(pool_options)
+        return _SESSIONS[key], request_options
+
+
+def get_cookie_session(http_options: Mapping[str, Any]) -> requests.Session:
+    """
+    Get a new session that keeps the cookies, e.g. for a sticky session, with the pooled connections.
+
+    Should not be closed, the connection pools are shared with the session of ``get_session``.
+    """
+    shared_session, _ = get_session(http_options)
+    session = requests.Session()
+    session.mount("http://", shared_session.get_adapter("http://"))
+    session.mount("https://", shared_session.get_adapter("https://"))
+    return session
+
+
+def _create_session(pool_options: Dict[str, Any]) -> requests.Session:
+    session = requests.Session()
+    # The session is shared by all the users, the cookies of the upstream servers should not be kept
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    max_retries = pool_options.get("max_retries", 0)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=int(pool_options.get("pool_connections", 10)),
+        pool_maxsize=int(pool_options.get("pool_maxsize", 10)),
+        pool_block=bool(pool_options.get("pool_block", False)),
+        max_retries=Retry(**max_retries) if isinstance(max_retries, dict) else int(max_retries),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_pool_stats() -> List[Tuple[Dict[str, str], Dict[str, float]]]:
+    """
+    Get the usage of the connection pools by host.
+
+    The number of opened connections, of requests and of idle connections. When there are many more requests
+    than opened connections, the connections are reused.
+    """
+    stats: Dict[str, Dict[str, float]] = {}
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.values())
+    for session in sessions:
+        for adapter in set(session.adapters.values()):
+            pools = getattr(adapter, "poolmanager", None)
+            if pools is None:
+                continue
+            for pool_key in pools.pools.keys():
+                pool = pools.pools.get(pool_key)
+                if pool is None:
+                    continue
+                host_stats = stats.setdefault(
+                    f"{pool.scheme}://{pool.host}:{pool.port}", {"connections": 0, "requests": 0, "idle": 0}
+                )
+                host_stats["connections"] += pool.num_connections
+                host_stats["requests"] += pool.num_requests
+                if pool.pool is not None:
+                    host_stats["idle"] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    return [({"host": host}, host_stats) for host, host_stats in stats.items()]
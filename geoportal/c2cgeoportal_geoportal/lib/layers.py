@@ -26,7 +26,7 @@
 # either expressed or implied, of the FreeBSD Project.
 
 
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
 
 from pyramid.request import Request
 from sqlalchemy.ext.declarative import DeclarativeMeta
@@ -35,6 +35,105 @@ from sqlalchemy.orm.query import Query
 from c2cgeoportal_geoportal.lib import caching, get_roles_id
 
 CACHE_REGION = caching.get_region("std")
+CACHE_REGION_OBJ = caching.get_region("obj")
+
+
+class LayersACL:
+    """
+    The access rights on the layers, as bitsets over the layers positions.
+
+    The layers ids are mapped to dense positions (the bit ``n`` is the layer ``layer_ids[n]``), then the
+    bitsets stay small even with sparse ids. Getting the layers that a set of roles can read or write is
+    a bitwise OR.
+    """
+
+    def __init__(
+        self,
+        layer_ids: Sequence[int],
+        public: int,
+        readable: Dict[int, int],
+        writable: Dict[int, int],
+        with_area: Dict[int, int],
+    ):
+        self._layer_ids = list(layer_ids)
+        self._positions = {layer_id: position for position, layer_id in enumerate(self._layer_ids)}
+        self.public = public
+        self._readable = readable
+        self._writable = writable
+        self._with_area = with_area
+
+    @staticmethod
+    def _union(bitsets: Dict[int, int], role_ids: Iterable[int]) -> int:
+        result = 0
+        for role_id in role_ids:
+            result |= bitsets.get(role_id, 0)
+        return result
+
+    def readable(self, role_ids: Iterable[int]) -> int:
+        """Get the layers in a restriction area of one of the roles."""
+        return self._union(self._readable, role_ids)
+
+    def protected(self, role_ids: Iterable[int]) -> int:
+        """Get the private layers accessible with one of the roles."""
+        return self.readable(role_ids) & ~self.public
+
+    def writable(self, role_ids: Iterable[int]) -> int:
+        """Get the layers in a read-write restriction area of one of the roles."""
+        return self._union(self._writable, role_ids)
+
+    def with_area(self, role_ids: Iterable[int]) -> int:
+        """Get the layers in a restriction area with a geometry of one of the roles."""
+        return self._union(self._with_area, role_ids)
+
+    def contains(self, bitset: int, layer_id: int) -> bool:
+        position = self._positions.get(layer_id)
+        return position is not None and (bitset >> position) & 1 == 1
+
+    def ids(self, bitset: int) -> Iterator[int]:
+        """Get the layers ids of the bitset."""
+        while bitset:
+            lowest = bitset & -bitset
+            yield self._layer_ids[lowest.bit_length() - 1]
+            bitset ^= lowest
+
+
+@CACHE_REGION_OBJ.cache_on_arguments()
+def get_layers_acl() -> LayersACL:
+    """Get the access rights on the layers, rebuilt after each cache invalidation."""
+    from c2cgeoportal_commons.models import DBSession, main  # pylint: disable=import-outside-toplevel
+
+    layer_ids: List[int] = []
+    bits: Dict[int, int] = {}
+    public = 0
+    for layer_id, layer_public in DBSession.query(main.Layer.id, main.Layer.public).order_by(main.Layer.id):
+        bits[layer_id] = 1 << len(layer_ids)
+        layer_ids.append(layer_id)
+        if layer_public:
+            public |= bits[layer_id]
+
+    readable: Dict[int, int] = {}
+    writable: Dict[int, int] = {}
+    with_area: Dict[int, int] = {}
+    query = (
+        DBSession.query(
+            main.role_ra.c.role_id,
+            main.layer_ra.c.layer_id,
+            main.RestrictionArea.readwrite,
+            main.RestrictionArea.area.isnot(None),
+        )
+        .select_from(main.RestrictionArea)
+        .join(main.role_ra, main.role_ra.c.restrictionarea_id == main.RestrictionArea.id)
+        .join(main.layer_ra, main.layer_ra.c.restrictionarea_id == main.RestrictionArea.id)
+    )
+    for role_id, layer_id, readwrite, has_area in query:
+        bit = bits[layer_id]
+        readable[role_id] = readable.get(role_id, 0) | bit
+        if readwrite:
+            writable[role_id] = writable.get(role_id, 0) | bit
+        if has_area:
+            with_area[role_id] = with_area.get(role_id, 0) | bit
+
+    return LayersACL(layer_ids, public, readable, writable, with_area)
 
 
 def _get_layers_query(request: Request, what: DeclarativeMeta) -> Query:
@@ -88,7 +187,13 @@ def get_protected_layers(request: Request, ogc_server_ids: Iterable[int]) -> Dic
     """
     from c2cgeoportal_commons.models import DBSession, main  # pylint: disable=import-outside-toplevel
 
-    q = get_protected_layers_query(request, ogc_server_ids, what=main.LayerWMS)
+    layers_acl = get_layers_acl()
+    layer_ids = list(layers_acl.ids(layers_acl.protected(get_roles_id(request))))
+    if not layer_ids:
+        return {}
+    q = DBSession.query(main.LayerWMS).filter(main.LayerWMS.id.in_(layer_ids))
+    if ogc_server_ids is not None:
+        q = q.filter(main.LayerWMS.ogc_server_id.in_(ogc_server_ids))
     results = q.all()
     DBSession.expunge_all()
     return {r.id: r for r in results}
@@ -96,9 +201,15 @@ def get_protected_layers(request: Request, ogc_server_ids: Iterable[int]) -> Dic
 
 def get_writable_layers(request: Request, ogc_server_ids: Iterable[int]) -> Dict[int, DeclarativeMeta]:
     """Get the writable layers."""
-    from c2cgeoportal_commons.models import DBSession  # pylint: disable=import-outside-toplevel
+    from c2cgeoportal_commons.models import DBSession, main  # pylint: disable=import-outside-toplevel
 
-    q = get_writable_layers_query(request, ogc_server_ids)
+    layers_acl = get_layers_acl()
+    layer_ids = list(layers_acl.ids(layers_acl.writable(get_roles_id(request))))
+    if not layer_ids:
+        return {}
+    q = DBSession.query(main.LayerWMS).filter(
+        main.LayerWMS.id.in_(layer_ids), main.LayerWMS.ogc_server_id.in_(ogc_server_ids)
+    )
     results = q.all()
     DBSession.expunge_all()
     return {r.id: r for r in results}
@@ -0,0 +1,239 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+import types
+from typing import Any, Dict, FrozenSet, Iterator, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+import sqlalchemy
+import sqlalchemy.orm
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from c2cgeoportal_geoportal.lib.caching import get_region
+
+CACHE_REGION_OBJ = get_region("obj")
+
+GROUP_TYPES = ("theme", "group")
+
+
+class TreeNodeMetadata(NamedTuple):
+    """A metadata of a tree node, like the ``Metadata`` model."""
+
+    name: str
+    value: str
+
+
+class TreeNode(NamedTuple):
+    """
+    An immutable tree item (theme, group or layer), without the ORM overhead.
+
+    The ``children`` are the ordered ids of the children nodes.
+    """
+
+    id: int
+    item_type: str
+    name: str
+    description: Optional[str]
+    public: Optional[bool]
+    ogc_server: Optional[str]
+    layer: Optional[str]
+    interfaces: FrozenSet[str]
+    metadatas: Tuple[TreeNodeMetadata, ...]
+    children: Tuple[int, ...]
+
+    @property
+    def is_group(self) -> bool:
+        return self.item_type in GROUP_TYPES
+
+    def is_in_interface(self, name: str) -> bool:
+        return name in self.interfaces
+
+    def get_metadata(self, name: str) -> List[TreeNodeMetadata]:
+        return [metadata for metadata in self.metadatas if metadata.name == name]
+
+
+class LayerTree:
+    """The immutable layer tree, all the tree items reachable from the roots (usually the themes)."""
+
+    def __init__(self, nodes: Dict[int, TreeNode]):
+        self.nodes: Mapping[int, TreeNode] = types.MappingProxyType(nodes)
+        parents: Dict[int, List[int]] = {}
+        for node in nodes.values():
+            for child_id in node.children:
+                parents.setdefault(child_id, []).append(node.id)
+        self._parents = {node_id: tuple(parent_ids) for node_id, parent_ids in parents.items()}
+        self._by_name = {(node.item_type, node.name): node for node in nodes.values()}
+
+    def __reduce__(self) -> Tuple[Any, Tuple[Dict[int, TreeNode]]]:
+        # The mapping proxy can't be pickled (e.g. in a shared cache backend), rebuild from the nodes
+        return (LayerTree, (dict(self.nodes),))
+
+    def __contains__(self, node_id: int) -> bool:
+        return node_id in self.nodes
+
+    def get(self, node_id: int) -> Optional[TreeNode]:
+        return self.nodes.get(node_id)
+
+    def get_by_name(self, item_type: str, name: str) -> Optional[TreeNode]:
+        return self._by_name.get((item_type, name))
+
+    def children(self, node: TreeNode) -> Iterator[TreeNode]:
+        for child_id in node.children:
+            yield self.nodes[child_id]
+
+    def parents(self, node: TreeNode) -> Iterator[TreeNode]:
+        for parent_id in self._parents.get(node.id, ()):
+            yield self.nodes[parent_id]
+
+    def walk(self, node: TreeNode, max_depth: int = 30) -> Iterator[TreeNode]:
+        """Iterate on the node and all its descendants, depth first."""
+        yield node
+        if max_depth > 0:
+            for child in self.children(node):
+                yield from self.walk(child, max_depth - 1)
+
+
+def _build_query() -> sqlalchemy.sql.Select:
+    from c2cgeoportal_commons.models import main  # pylint: disable=import-outside-toplevel
+
+    treeitem = main.TreeItem.__table__
+    link = main.LayergroupTreeitem.__table__
+    layer = main.Layer.__table__
+    layer_wms = main.LayerWMS.__table__
+    ogc_server = main.OGCServer.__table__
+    theme = main.Theme.__table__
+    interface = main.Interface.__table__
+    metadata = main.Metadata.__table__
+
+    # The links reachable from the root tree items (the ones without any parent)
+    roots = sqlalchemy.select(
+        treeitem.c.id.label("id"),
+        sqlalchemy.cast(sqlalchemy.null(), sqlalchemy.Integer).label("parent_id"),
+        sqlalchemy.cast(sqlalchemy.null(), sqlalchemy.Integer).label("ordering"),
+        sqlalchemy.cast(sqlalchemy.null(), sqlalchemy.Integer).label("link_id"),
+    ).where(~sqlalchemy.exists().where(link.c.treeitem_id == treeitem.c.id))
+    tree = roots.cte("tree", recursive=True)
+    tree = tree.union(
+        sqlalchemy.select(link.c.treeitem_id, link.c.treegroup_id, link.c.ordering, link.c.id).join(
+            tree, link.c.treegroup_id == tree.c.id
+        )
+    )
+
+    interfaces = (
+        sqlalchemy.select(sqlalchemy.func.json_agg(interface.c.name))
+        .where(
+            sqlalchemy.or_(
+                interface.c.id.in_(
+                    sqlalchemy.select(main.interface_layer.c.interface_id)
+                    .where(main.interface_layer.c.layer_id == treeitem.c.id)
+                    .correlate(treeitem)
+                ),
+                interface.c.id.in_(
+                    sqlalchemy.select(main.interface_theme.c.interface_id)
+                    .where(main.interface_theme.c.theme_id == treeitem.c.id)
+                    .correlate(treeitem)
+                ),
+            )
+        )
+        .scalar_subquery()
+    )
+    metadatas = (
+        sqlalchemy.select(
+            sqlalchemy.func.json_agg(
+                aggregate_order_by(
+                    sqlalchemy.func.json_build_array(metadata.c.name, metadata.c.value),
+                    metadata.c.name,
+                    metadata.c.id,
+                )
+            )
+        )
+        .where(metadata.c.item_id == treeitem.c.id)
+        .scalar_subquery()
+    )
+
+    return (
+        sqlalchemy.select(
+            tree.c.parent_id,
+            tree.c.ordering,
+            tree.c.link_id,
+            treeitem.c.id,
+            treeitem.c.type,
+            treeitem.c.name,
+            treeitem.c.description,
+            sqlalchemy.func.coalesce(layer.c.public, theme.c.public).label("public"),
+            ogc_server.c.name.label("ogc_server"),
+            layer_wms.c.layer,
+            interfaces.label("interfaces"),
+            metadatas.label("metadatas"),
+        )
+        .select_from(tree)
+        .join(treeitem, treeitem.c.id == tree.c.id)
+        .outerjoin(layer, layer.c.id == treeitem.c.id)
+        .outerjoin(theme, theme.c.id == treeitem.c.id)
+        .outerjoin(layer_wms, layer_wms.c.id == treeitem.c.id)
+        .outerjoin(ogc_server, ogc_server.c.id == layer_wms.c.ogc_server_id)
+    )
+
+
+def load_layer_tree(session: sqlalchemy.orm.Session) -> LayerTree:
+    """Load the layer tree from the database, in one query."""
+    items: Dict[int, Any] = {}
+    links: Set[Tuple[int, int, int, int]] = set()
+    for row in session.execute(_build_query()):
+        items.setdefault(row.id, row)
+        if row.parent_id is not None:
+            links.add((row.parent_id, row.ordering or 0, row.link_id, row.id))
+
+    children: Dict[int, List[int]] = {}
+    for parent_id, _, _, child_id in sorted(links):
+        children.setdefault(parent_id, []).append(child_id)
+
+    return LayerTree(
+        {
+            item.id: TreeNode(
+                id=item.id,
+                item_type=item.type,
+                name=item.name,
+                description=item.description,
+                public=item.public,
+                ogc_server=item.ogc_server,
+                layer=item.layer,
+                interfaces=frozenset(item.interfaces or []),
+                metadatas=tuple(TreeNodeMetadata(name, value) for name, value in item.metadatas or []),
+                children=tuple(children.get(item.id, [])),
+            )
+            for item in items.values()
+        }
+    )
+
+
+@CACHE_REGION_OBJ.cache_on_arguments()
+def get_layer_tree() -> LayerTree:
+    """Get the layer tree, cached in the process until the cache is invalidated."""
+    from c2cgeoportal_commons.models import DBSession  # pylint: disable=import-outside-toplevel
+
+    return load_layer_tree(DBSession)
@@ -0,0 +1,232 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from c2cgeoportal_geoportal.lib.caching import CACHE_STATS, get_generation
+
+LOG = logging.getLogger(__name__)
+# The region and the function used in the cache statistics
+_STATS_REGION = "legend"
+_STATS_KEY = f"{__name__}|LegendCache"
+# The parameters that don't change the legend image
+_IGNORED_PARAMS = ("cache_version", "_", "user_id", "role_ids")
+
+_legend_cache: Optional["LegendCache"] = None
+
+
+class LegendEntry(NamedTuple):
+    """A cached legend image."""
+
+    content: bytes
+    content_type: str
+    etag: str
+    last_modified: float
+
+
+class LegendCache:
+    """
+    A cache of the legend images (GetLegendGraphic responses) stored on the local disk.
+
+    The files are shared by all the processes of the host, when the ``max_size`` (in bytes) is exceeded the
+    least recently used images are removed, the size is checked every ``EVICTION_CHECK_INTERVAL`` sets of
+    each process.
+    The keys contain the generation of the cache, then the images are renewed after a cache invalidation.
+    """
+
+    EVICTION_CHECK_INTERVAL = 100
+    # Minimum time between two updates of the access time of an image, in seconds
+    ACCESS_RESOLUTION = 60.0
+    # Age after which a temporary file is considered as left by an interrupted write, in seconds
+    TEMP_FILE_MAX_AGE = 3600.0
+
+    def __init__(self, path: str, max_size: int = 0):
+        self.path = path
+        self.max_size = max_size
+        self.evictions = 0
+        self._sets = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(ogc_server: str, path: str, params: Mapping[str, Any]) -> str:
+        """
+        Get the key of a legend image.
+
+        The parameter names are case insensitive, their order and the parameters that don't change the
+        image are ignored, and the scale is rounded.
+        """
+        normalized: Dict[str, str] = {}
+        for name, value in params.items():
+            name = name.lower()
+            if name in _IGNORED_PARAMS or value in (None, ""):
+                continue
+            value = str(value)
+            if name == "scale":
+                try:
+                    value = str(round(float(value)))
+                except ValueError:
+                    pass
+            normalized[name] = value
+        return json.dumps([get_generation(), ogc_server, path, sorted(normalized.items())])
+
+    def _file_path(self, key: str) -> str:
+        hash_ = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.path, hash_[:2], hash_)
+
+    def get(self, key: str) -> Optional[LegendEntry]:
+        """Get the cached legend image, ``None`` if it is not in the cache."""
+        file_path = self._file_path(key)
+        try:
+            with open(file_path + ".json", encoding="utf-8") as metadata_file:
+                metadata = json.load(metadata_file)
+            with open(file_path, "rb") as content_file:
+                content = content_file.read()
+            now = time.time()
+            if os.stat(file_path).st_mtime < now - self.ACCESS_RESOLUTION:
+                os.utime(file_path, (now, now))
+        except (OSError, ValueError):
+            CACHE_STATS.add(_STATS_REGION, _STATS_KEY, "misses")
+            return None
+        if metadata.get("key") != key:
+            CACHE_STATS.add(_STATS_REGION, _STATS_KEY, "misses")
+            return None
+        CACHE_STATS.add(_STATS_REGION, _STATS_KEY, "hits")
+        return LegendEntry(content, metadata["content_type"], metadata["etag"], metadata["last_modified"])
+
+    def set(self, key: str, content: bytes, content_type: str) -> LegendEntry:
+        """Store the legend image, the errors of the disk are only logged."""
+        entry = LegendEntry(content, content_type, hashlib.sha256(content).hexdigest()[:32], time.time())
+        file_path = self._file_path(key)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # The metadata is written last, the image is available only when both files are complete
+            self._write(file_path, content)
+            self._write(
+                file_path + ".json",
+                json.dumps(
+                    {
+                        "key": key,
+                        "content_type": content_type,
+                        "etag": entry.etag,
+                        "last_modified": entry.last_modified,
+                    }
+                ).encode(),
+            )
+            CACHE_STATS.add(_STATS_REGION, _STATS_KEY, "stored_bytes", len(content))
+        except OSError:
+            LOG.exception("Unable to store the legend image in '%s'.", self.path)
+            return entry
+
+        with self._lock:
+            self._sets += 1
+            check = self._sets % self.EVICTION_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+        return entry
+
+    @staticmethod
+    def _write(file_path: str, content: bytes) -> None:
+        # Atomic write, the other processes never read a partial file
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=".")
+        try:
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                temp_file.write(content)
+            os.replace(temp_path, file_path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used images until the size is under the ``max_size``.
+
+        The size includes the metadata files, and the temporary files older than ``TEMP_FILE_MAX_AGE``
+        (left by an interrupted write) are removed.
+        """
+        images: Dict[str, Tuple[float, int]] = {}
+        metadata_sizes: Dict[str, int] = {}
+        total_size = 0
+        temp_time_limit = time.time() - self.TEMP_FILE_MAX_AGE
+        for directory, _, file_names in os.walk(self.path):
+            for file_name in file_names:
+                file_path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(file_path)
+                    if file_name.startswith("."):
+                        if stat.st_mtime < temp_time_limit:
+                            os.unlink(file_path)
+                        continue
+                except OSError:
+                    continue
+                total_size += stat.st_size
+                if file_name.endswith(".json"):
+                    metadata_sizes[file_path[: -len(".json")]] = stat.st_size
+                    # Also evict the metadata files without image
+                    images.setdefault(file_path[: -len(".json")], (stat.st_mtime, 0))
+                else:
+                    images[file_path] = (stat.st_mtime, stat.st_size)
+        if self.max_size <= 0 or total_size <= self.max_size:
+            return
+        files = sorted(
+            (mtime, size + metadata_sizes.get(file_path, 0), file_path)
+            for file_path, (mtime, size) in images.items()
+        )
+        for _, size, file_path in files:
+            if total_size <= self.max_size:
+                break
+            for path in (file_path + ".json", file_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            total_size -= size
+            self.evictions += 1
+
+
+def init(settings: Mapping[str, Any]) -> None:
+    """Initialize the legend cache from the ``legend_cache`` settings."""
+    global _legend_cache  # pylint: disable=global-statement
+    config = settings.get("legend_cache") or {}
+    if not config.get("enabled", False):
+        _legend_cache = None
+        return
+    _legend_cache = LegendCache(
+        config.get("path") or os.path.join(tempfile.gettempdir(), "c2cgeoportal-legends"),
+        int(config.get("max_size", 100)) * 1024 * 1024,
+    )
+
+
+def get_legend_cache() -> Optional[LegendCache]:
+    """Get the legend cache, ``None`` if it is not enabled."""
+    return _legend_cache
@@ -27,13 +27,16 @@
 
 import gc
 import sys
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 from c2cwsgiutils import broadcast
 from c2cwsgiutils.debug import get_size
-from c2cwsgiutils.metrics import Provider
+from c2cwsgiutils.metrics import Provider, add_provider
 
-from c2cgeoportal_geoportal.lib.caching import MEMORY_CACHE_DICT
+from c2cgeoportal_geoportal.lib.caching import CACHE_STATS, MEMORY_CACHE_DICT, CacheStats
+from c2cgeoportal_geoportal.lib.http_session import get_pool_stats
+from c2cgeoportal_geoportal.lib.timing import THEMES_HISTOGRAM
+from c2cgeoportal_geoportal.lib.upstream import get_upstream_stats
 from c2cgeoportal_geoportal.views.raster import Raster
 
 
@@ -65,6 +68,10 @@ def _get_memory_cache(all_: bool) -> Dict[str, List[Tuple[Dict[str, Any], float]
         else []
     )
     values.append(({"key": "total"}, get_size(MEMORY_CACHE_DICT) / 1024))
+    # Number of entries evicted by reason: entries, size or expired
+    values.extend(
+        ({"key": f"evictions_{reason}"}, count) for reason, count in MEMORY_CACHE_DICT.evictions.items()
+    )
     return {"values": values}
 
 
@@ -110,3 +117,139 @@ class TotalPythonObjectMemoryProvider(Provider):
 @broadcast.decorator(expect_answers=True, timeout=15)
 def _get_python_object_size() -> Dict[str, float]:
     return {"value": sum(sys.getsizeof(o) / 1024 for o in gc.get_objects())}
+
+
+class StatsProvider(Provider):
+    """
+    Get a series of a family of metrics collected from all the processes.
+
+    A provider exports a single metric name, then the family is exported with one provider per series, see
+    ``add_stats_providers``.
+    """
+
+    def __init__(self, name: str, help_: str, type_: str, family: "StatsFamily", series: str):
+        super().__init__(name, help_, type_)
+        self.family = family
+        self.series = series
+
+    def get_data(self) -> List[Tuple[Dict[str, str], float]]:
+        elements = self.family.get_stats()
+        assert elements is not None
+        result: List[Tuple[Dict[str, str], float]] = []
+        for elem in elements:
+            if elem is None:
+                continue
+            for labels, values in elem["values"]:
+                result.extend(
+                    self.family.get_samples(
+                        self.series,
+                        {**labels, "pid": str(elem["pid"]), "hostname": str(elem["hostname"])},
+                        values,
+                    )
+                )
+        return result
+
+
+def _get_value(series: str, labels: Dict[str, str], values: Any) -> List[Tuple[Dict[str, str], float]]:
+    return [(labels, values[series])]
+
+
+class StatsFamily(NamedTuple):
+    """
+    A family of metrics.
+
+    ``get_stats`` is a broadcast function that returns the ``(labels, values)`` of each process, and
+    ``get_samples`` gets the samples of a series from the values of labels.
+    """
+
+    prefix: str
+    # The help and the type of each series
+    series: Dict[str, Tuple[str, str]]
+    get_stats: Callable[[], Optional[List[Dict[str, Any]]]]
+    get_samples: Callable[[str, Dict[str, str], Any], List[Tuple[Dict[str, str], float]]] = _get_value
+
+
+@broadcast.decorator(expect_answers=True, timeout=15)
+def _get_themes_timing() -> Dict[str, List[Tuple[Dict[str, str], Tuple[List[int], float]]]]:
+    return {"values": [(labels, (counts, sum_)) for labels, counts, sum_ in THEMES_HISTOGRAM.get_data()]}
+
+
+def _get_themes_timing_samples(
+    series: str, labels: Dict[str, str], values: Any
+) -> List[Tuple[Dict[str, str], float]]:
+    # Each series of the histogram is exported as a counter of the totals since the process start
+    counts, sum_ = values
+    if series == "bucket":
+        return [
+            ({**labels, "le": str(bucket)}, count)
+            for bucket, count in zip([*THEMES_HISTOGRAM.buckets, "+Inf"], counts)
+        ]
+    if series == "sum":
+        return [(labels, sum_)]
+    return [(labels, counts[-1])]
+
+
+@broadcast.decorator(expect_answers=True, timeout=15)
+def _get_cache_stats() -> Dict[str, List[Tuple[Dict[str, str], Dict[str, float]]]]:
+    return {"values": CACHE_STATS.get_data()}
+
+
+@broadcast.decorator(expect_answers=True, timeout=15)
+def _get_http_pool_stats() -> Dict[str, List[Tuple[Dict[str, str], Dict[str, float]]]]:
+    return {"values": get_pool_stats()}
+
+
+@broadcast.decorator(expect_answers=True, timeout=15)
+def _get_upstream_stats() -> Dict[str, List[Tuple[Dict[str, str], Dict[str, float]]]]:
+    return {"values": get_upstream_stats()}
+
+
+# The families of metrics, by name of the metrics configuration
+STATS_FAMILIES = {
+    # The histogram of the durations of the themes building phases
+    "themes_timing": StatsFamily(
+        "c2cgeoportal_themes_phase_seconds",
+        {
+            "bucket": ("Number of themes building phases by upper bound of the duration", "counter"),
+            "sum": ("Total duration of the themes building phases", "counter"),
+            "count": ("Number of themes building phases", "counter"),
+        },
+        _get_themes_timing,
+        _get_themes_timing_samples,
+    ),
+    # The cache usage by region and by cached function
+    "cache_stats": StatsFamily(
+        "c2cgeoportal_cache",
+        {counter: (f"Cache {counter.replace('_', ' ')}", "counter") for counter in CacheStats.COUNTERS},
+        _get_cache_stats,
+    ),
+    # The usage of the pools of connections to the upstream servers, by host
+    "http_pool": StatsFamily(
+        "c2cgeoportal_http_pool",
+        {
+            "connections": ("HTTP pool connections", "counter"),
+            "requests": ("HTTP pool requests", "counter"),
+            "idle": ("HTTP pool idle", "gauge"),
+        },
+        _get_http_pool_stats,
+    ),
+    # The state of the limiters and circuit breakers of the upstream servers, by host: the state is 0 for
+    # closed, 1 for half open and 2 for open
+    "upstream": StatsFamily(
+        "c2cgeoportal_upstream",
+        {
+            "state": ("Upstream state", "gauge"),
+            "in_flight": ("Upstream in flight", "gauge"),
+            "trips": ("Upstream trips", "counter"),
+            "rejected": ("Upstream rejected", "counter"),
+        },
+        _get_upstream_stats,
+    ),
+}
+
+
+def add_stats_providers(family_name: str) -> None:
+    """Register the providers of a family of metrics, one for each series."""
+    family = STATS_FAMILIES[family_name]
+    for series, (help_, type_) in family.series.items():
+        add_provider(StatsProvider(f"{family.prefix}_{series}", help_, type_, family, series))
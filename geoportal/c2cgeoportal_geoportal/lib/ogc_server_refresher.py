@@ -0,0 +1,162 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Optional
+
+import pyramid.config
+import pyramid.events
+import pyramid.registry
+import pyramid.request
+import pyramid.scripting
+import transaction
+from c2cwsgiutils import redis_utils
+
+LOG = logging.getLogger(__name__)
+_LEADER_KEY = "c2cgeoportal_ogc_server_refresher"
+# Time to live of the leader lock in seconds, extended while the refresh is running
+LOCK_TIMEOUT = 60
+# Update the leader lock only if it's still ours
+_EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_refresher: Optional["OGCServerRefresher"] = None
+_refresher_lock = threading.Lock()
+
+
+class OGCServerRefresher(threading.Thread):
+    """
+    Refresh periodically the cache of the OGC servers (WMS GetCapabilities and WFS DescribeFeatureType).
+
+    The old values are served until the new ones are ready, then the themes requests don't have to wait
+    on the map servers.
+    When Redis is configured, only one process does the refresh on each interval.
+    """
+
+    def __init__(self, registry: pyramid.registry.Registry, interval: float):
+        super().__init__(name="c2cgeoportal-ogc-server-refresher", daemon=True)
+        self.registry = registry
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._leader_refresh()
+            except Exception:  # pylint: disable=broad-exception-caught
+                LOG.exception("Error while refreshing the OGC servers cache")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _leader_refresh(self) -> None:
+        """
+        Refresh if no other process did it during the interval.
+
+        The leader lock is extended while refreshing, then it's kept until the end of the interval to skip
+        the refresh of the other processes, and only released if it's still our one.
+        """
+        master, _, _ = redis_utils.get(self.registry.settings)
+        if master is None:
+            self.refresh()
+            return
+        token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        if not master.set(_LEADER_KEY, token, nx=True, ex=LOCK_TIMEOUT):
+            return
+        start = time.monotonic()
+        refreshed = threading.Event()
+
+        def extend() -> None:
+            while not refreshed.wait(LOCK_TIMEOUT / 3):
+                master.eval(_EXTEND_SCRIPT, 1, _LEADER_KEY, token, LOCK_TIMEOUT)
+
+        extender = threading.Thread(target=extend, name="c2cgeoportal-ogc-server-refresher-lock", daemon=True)
+        extender.start()
+        try:
+            self.refresh()
+        finally:
+            refreshed.set()
+            extender.join()
+            remaining = int(self.interval - (time.monotonic() - start)) - 1
+            if remaining > 0:
+                master.eval(_EXTEND_SCRIPT, 1, _LEADER_KEY, token, remaining)
+            else:
+                master.eval(_RELEASE_SCRIPT, 1, _LEADER_KEY, token)
+
+    def refresh(self) -> None:
+        """Refresh the cache of all the used OGC servers."""
+        from c2cgeoportal_commons.models import (  # pylint: disable=import-outside-toplevel
+            DBSession,
+            cache_invalidate_cb,
+        )
+        from c2cgeoportal_geoportal.views.theme import Theme  # pylint: disable=import-outside-toplevel
+
+        # Anonymous request, the address should not be in an intranet network
+        request = pyramid.request.Request.blank("/", environ={"REMOTE_ADDR": "0.0.0.0"})  # nosec
+        env = pyramid.scripting.prepare(request=request, registry=self.registry)
+        try:
+            if asyncio.run(Theme(env["request"]).refresh_ogc_servers()):
+                LOG.info("The OGC servers capabilities changed, invalidate the cache")
+                cache_invalidate_cb()
+        finally:
+            transaction.abort()
+            DBSession.remove()
+            env["closer"]()
+
+
+def _start(event: pyramid.events.NewRequest) -> None:
+    """Start the refresher in the current process (after the fork of the workers)."""
+    global _refresher  # pylint: disable=global-statement
+    if _refresher is not None and _refresher.is_alive():
+        return
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            interval = event.request.registry.settings["themes"]["ogc_servers_refresh_interval"]
+            _refresher = OGCServerRefresher(event.request.registry, interval)
+            _refresher.start()
+
+
+def init(config: pyramid.config.Configurator) -> None:
+    """Initialize the OGC servers refresher if the refresh interval is configured."""
+    if config.get_settings().get("themes", {}).get("ogc_servers_refresh_interval", 0) > 0:
+        config.add_subscriber(_start, pyramid.events.NewRequest)
@@ -0,0 +1,135 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+import contextlib
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import pyramid.request
+import pyramid.response
+from c2cwsgiutils.auth import is_auth
+
+# The upper bounds of the histograms buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """A Prometheus like histogram of durations, by labels, for the current process."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels => (count by bucket (the last one is +Inf), sum)
+        self._values: Dict[Labels, Tuple[List[int], float]] = {}
+
+    def observe(self, labels: Dict[str, str], value: float) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, sum_ = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for index, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    counts[index] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, sum_ + value)
+
+    def get_data(self) -> List[Tuple[Dict[str, str], List[int], float]]:
+        """Get the cumulative counts by bucket and the sum, by labels."""
+        with self._lock:
+            return [(dict(labels), list(counts), sum_) for labels, (counts, sum_) in self._values.items()]
+
+
+THEMES_HISTOGRAM = Histogram()
+
+
+def get_interface_label(settings: Mapping[str, Any], interface: str) -> str:
+    """Get the ``interface`` label, ``other`` for the not configured interfaces to bound the cardinality."""
+    if interface in {config["name"] for config in settings.get("interfaces", [])}:
+        return interface
+    return "other"
+
+
+class PhaseTimer:
+    """
+    Measure the duration of the phases of a request.
+
+    The durations are added in the histogram and can be sent to the client in a ``Server-Timing`` header,
+    see: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing.
+    """
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.timings: List[Tuple[str, float, Optional[str]]] = []
+        self._start = time.perf_counter()
+        self._view_end: Optional[float] = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str, description: Optional[str] = None, ogc_server: str = "") -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, description, ogc_server)
+
+    def add(
+        self, name: str, duration: float, description: Optional[str] = None, ogc_server: str = ""
+    ) -> None:
+        self.timings.append((name, duration, description))
+        self.histogram.observe({**self.labels, "phase": name, "ogc_server": ogc_server}, duration)
+
+    def server_timing(self) -> str:
+        """Get the value of the ``Server-Timing`` header."""
+        result = []
+        for name, duration, description in self.timings:
+            timing = f"{name};dur={duration * 1000:.1f}"
+            if description is not None:
+                escaped_description = description.replace("\\", "\\\\").replace('"', '\\"')
+                timing += f';desc="{escaped_description}"'
+            result.append(timing)
+        return ", ".join(result)
+
+    def start_request(self, request: pyramid.request.Request) -> None:
+        """Measure the serialization and add the ``Server-Timing`` header for the authenticated admins."""
+        self._start = time.perf_counter()
+        request.add_response_callback(self._response_callback)
+
+    def end_view(self) -> None:
+        self._view_end = time.perf_counter()
+
+    def _response_callback(
+        self, request: pyramid.request.Request, response: pyramid.response.Response
+    ) -> None:
+        now = time.perf_counter()
+        if self._view_end is not None:
+            self.add("serialization", now - self._view_end)
+        self.add("total", now - self._start)
+        if is_auth(request):
+            response.headers["Server-Timing"] = self.server_timing()
@@ -0,0 +1,203 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+LOG = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Value of the state in the metrics
+STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+# Status codes that show that the upstream server is not able to answer
+_FAILURE_STATUS_CODES = (502, 503, 504)
+
+_CONFIG: Dict[str, Any] = {}
+_UPSTREAMS: Dict[str, "Upstream"] = {}
+_UPSTREAMS_LOCK = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    """Start with new limiters in the forked workers, a thread of the main process may hold their locks."""
+    global _UPSTREAMS_LOCK  # pylint: disable=global-statement
+    _UPSTREAMS.clear()
+    _UPSTREAMS_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class UpstreamUnavailable(Exception):
+    """The request is not sent because the upstream server is overloaded or failing."""
+
+
+class Upstream:
+    """
+    Concurrency limiter and circuit breaker of an upstream server.
+
+    At most ``max_concurrency`` requests are sent at the same time, the other ones wait up to
+    ``queue_timeout`` seconds for a free slot.
+    After ``failure_threshold`` consecutive failures (connection errors, timeouts, 502, 503 or 504 status,
+    responses slower than ``slow_threshold`` seconds) the circuit opens and the requests fail fast during
+    ``open_duration`` seconds, then one trial request decides whether the circuit closes or opens again.
+    """
+
+    def __init__(self, name: str, config: Mapping[str, Any]):
+        self.name = name
+        self.max_concurrency = int(config.get("max_concurrency", 0))
+        self.queue_timeout = float(config.get("queue_timeout", 10))
+        self.failure_threshold = int(config.get("failure_threshold", 0))
+        self.slow_threshold = float(config.get("slow_threshold", 0))
+        self.open_duration = float(config.get("open_duration", 30))
+
+        self._semaphore = (
+            threading.BoundedSemaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+        )
+        self._lock = threading.Lock()
+        self._trial = False
+        self._opened_at = 0.0
+        self.state = CLOSED
+        self.failures = 0
+        self.in_flight = 0
+        self.trips = 0
+        self.rejected = 0
+
+    def call(self, function: Callable[[], requests.Response]) -> requests.Response:
+        """Do the request with the ``function``, or raise ``UpstreamUnavailable``."""
+        self._enter()
+        if self._semaphore is not None and not self._semaphore.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._trial = False
+                self.rejected += 1
+            raise UpstreamUnavailable(
+                f"Too many concurrent requests to the upstream server '{self.name}', "
+                f"no free slot after {self.queue_timeout}s"
+            )
+        with self._lock:
+            self.in_flight += 1
+        start = time.monotonic()
+        try:
+            response = function()
+        except Exception:
+            self._record(False)
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+        duration = time.monotonic() - start
+        self._record(
+            response.status_code not in _FAILURE_STATUS_CODES
+            and (self.slow_threshold <= 0 or duration <= self.slow_threshold)
+        )
+        return response
+
+    def _enter(self) -> None:
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_duration:
+                    self.rejected += 1
+                    raise UpstreamUnavailable(f"The circuit of the upstream server '{self.name}' is open")
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._trial:
+                    self.rejected += 1
+                    raise UpstreamUnavailable(
+                        f"The circuit of the upstream server '{self.name}' is half open, "
+                        "waiting on the trial request"
+                    )
+                self._trial = True
+
+    def _record(self, success: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if success:
+                if self.state != CLOSED:
+                    LOG.info("The circuit of the upstream server '%s' is closed.", self.name)
+                self.state = CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failure_threshold > 0 and (
+                self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold)
+            ):
+                LOG.warning(
+                    "The circuit of the upstream server '%s' is open after %i failures.",
+                    self.name,
+                    self.failures,
+                )
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+
+
+def init(settings: Mapping[str, Any]) -> None:
+    """Set the limits of the upstream servers from the ``upstream_limits`` settings."""
+    global _CONFIG  # pylint: disable=global-statement
+    with _UPSTREAMS_LOCK:
+        _CONFIG = dict(settings.get("upstream_limits") or {})
+        _UPSTREAMS.clear()
+
+
+def get_upstream(url: str) -> Upstream:
+    """Get the limiter and circuit breaker of the upstream server (scheme, host and port) of the URL."""
+    split_url = urlsplit(url)
+    name = f"{split_url.scheme}://{split_url.netloc}"
+    with _UPSTREAMS_LOCK:
+        upstream: Optional[Upstream] = _UPSTREAMS.get(name)
+        if upstream is None:
+            upstream = Upstream(name, _CONFIG)
+            _UPSTREAMS[name] = upstream
+        return upstream
+
+
+def get_upstream_stats() -> List[Tuple[Dict[str, str], Dict[str, float]]]:
+    """Get the state (see ``STATES``), in flight, trips and rejected requests counts by upstream server."""
+    with _UPSTREAMS_LOCK:
+        upstreams = list(_UPSTREAMS.values())
+    return [
+        (
+            {"upstream": upstream.name},
+            {
+                "state": STATES[upstream.state],
+                "in_flight": upstream.in_flight,
+                "trips": upstream.trips,
+                "rejected": upstream.rejected,
+            },
+        )
+        for upstream in upstreams
+    ]
@@ -0,0 +1,251 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+import importlib
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, Optional
+
+import pyramid.config
+import pyramid.events
+import pyramid.registry
+import pyramid.request
+import pyramid.scripting
+import transaction
+import zope.event.classhandler
+from c2cwsgiutils import redis_utils
+
+from c2cgeoportal_commons.models import InvalidateCacheEvent
+from c2cgeoportal_geoportal.lib import caching
+
+LOG = logging.getLogger(__name__)
+_REWARM_LEADER_KEY = "c2cgeoportal_cache_rewarm"
+
+_rewarmer: Optional["Rewarmer"] = None
+_rewarmer_lock = threading.Lock()
+
+
+def warm_up(registry: pyramid.registry.Registry) -> None:
+    """
+    Fill the caches: anonymous themes, full-text search groups, editing classes and raster libraries.
+
+    Run in the main process before the fork of the workers (gunicorn ``preload``), the workers start with
+    hot caches and share the memory pages with the main process (copy-on-write).
+    """
+    from c2cgeoportal_commons.models import DBSession  # pylint: disable=import-outside-toplevel
+
+    settings = registry.settings
+    config = settings.get("warmup", {})
+
+    # Use the same cache generation as the workers, otherwise they drop the warmed values
+    caching.refresh_generation(settings, force=True)
+
+    try:
+        _warm_up_themes(registry, config)
+        _warm_up_fulltextsearch_groups(registry)
+        _warm_up_editing_classes()
+        _warm_up_raster(settings.get("raster", {}))
+    finally:
+        transaction.abort()
+        DBSession.remove()
+        _dispose_engines()
+
+
+def _warm_up_themes(registry: pyramid.registry.Registry, config: Dict[str, Any]) -> None:
+    from c2cgeoportal_commons.models import DBSession, main  # pylint: disable=import-outside-toplevel
+    from c2cgeoportal_geoportal.views.theme import Theme  # pylint: disable=import-outside-toplevel
+
+    interfaces = config.get("interfaces") or [
+        interface.name for interface in DBSession.query(main.Interface).order_by(main.Interface.name)
+    ]
+    for host in config.get("hosts") or ["localhost"]:
+        for interface in interfaces:
+            # Anonymous request, the address should not be in an intranet network
+            request = pyramid.request.Request.blank(
+                "/themes?" + urllib.parse.urlencode({"interface": interface}),
+                environ={"REMOTE_ADDR": "0.0.0.0", "HTTP_HOST": host},  # nosec
+            )
+            env = pyramid.scripting.prepare(request=request, registry=registry)
+            try:
+                Theme(env["request"]).themes()
+            except Exception:  # pylint: disable=broad-exception-caught
+                LOG.exception(
+                    "Error while warming up the themes of the interface '%s' on '%s'", interface, host
+                )
+            finally:
+                env["closer"]()
+
+
+def _warm_up_fulltextsearch_groups(registry: pyramid.registry.Registry) -> None:
+    from c2cgeoportal_geoportal.views.dynamic import DynamicView  # pylint: disable=import-outside-toplevel
+
+    env = pyramid.scripting.prepare(request=pyramid.request.Request.blank("/"), registry=registry)
+    try:
+        DynamicView(env["request"])._fulltextsearch_groups()  # pylint: disable=protected-access
+    except Exception:  # pylint: disable=broad-exception-caught
+        LOG.exception("Error while warming up the full-text search groups")
+    finally:
+        env["closer"]()
+
+
+def _warm_up_editing_classes() -> None:
+    from c2cgeoportal_commons.models import DBSession, main  # pylint: disable=import-outside-toplevel
+    from c2cgeoportal_geoportal.views.layers import get_layer_class  # pylint: disable=import-outside-toplevel
+
+    for layer in DBSession.query(main.Layer).filter(main.Layer.geo_table.isnot(None)).all():
+        if not layer.geo_table:
+            continue
+        try:
+            get_layer_class(layer)
+            get_layer_class(layer, with_last_update_columns=True)
+        except Exception:  # pylint: disable=broad-exception-caught
+            LOG.warning("Unable to get the editing class of the layer '%s'", layer.name, exc_info=True)
+
+
+def _warm_up_raster(rasters: Dict[str, Dict[str, Any]]) -> None:
+    # The datasets are not opened: the file handles would be shared by all the workers,
+    # only the libraries are loaded.
+    modules = {"shp_index": "fiona.collection", "gdal": "rasterio"}
+    for type_ in {raster.get("type", "shp_index") for raster in rasters.values()}:
+        if type_ in modules:
+            importlib.import_module(modules[type_])
+
+
+def _dispose_engines() -> None:
+    """Close the database connections, they should not be shared with the workers."""
+    from c2cgeoportal_commons.models import DBSessions  # pylint: disable=import-outside-toplevel
+
+    for session in DBSessions.values():
+        for bind in ("c2c_rw_bind", "c2c_ro_bind"):
+            engine = getattr(session, bind, None)
+            if engine is not None:
+                engine.dispose()
+
+
+class Rewarmer(threading.Thread):
+    """
+    Warm up the caches again after an invalidation.
+
+    The anonymous themes (with the OGC servers capabilities) and the full-text search groups are rebuilt.
+    The successive invalidations are coalesced, the warm-up is done when there is no new invalidation
+    during ``delay`` seconds.
+    When Redis is configured, only one process does the warm-up for each cache generation.
+    """
+
+    def __init__(self, registry: pyramid.registry.Registry, delay: float):
+        super().__init__(name="c2cgeoportal-cache-rewarmer", daemon=True)
+        self.registry = registry
+        self.delay = delay
+        self._deadline = 0.0
+        self._scheduled = threading.Event()
+        self._lock = threading.Lock()
+
+    def schedule(self) -> None:
+        """Schedule a warm-up, postpone the scheduled one if any."""
+        with self._lock:
+            self._deadline = time.monotonic() + self.delay
+            self._scheduled.set()
+
+    def run(self) -> None:
+        while True:
+            self._scheduled.wait()
+            while True:
+                with self._lock:
+                    # The invalidations received until now are handled by this warm-up
+                    self._scheduled.clear()
+                    remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+            try:
+                if self._is_leader():
+                    self.rewarm()
+            except Exception:  # pylint: disable=broad-exception-caught
+                LOG.exception("Error while warming up the caches after an invalidation")
+
+    def _is_leader(self) -> bool:
+        settings = self.registry.settings
+        master, _, _ = redis_utils.get(settings)
+        if master is None:
+            return True
+        caching.refresh_generation(settings, force=True)
+        return bool(
+            master.set(
+                f"{_REWARM_LEADER_KEY}:{caching.get_generation()}",
+                f"{socket.gethostname()}:{os.getpid()}",
+                nx=True,
+                ex=3600,
+            )
+        )
+
+    def rewarm(self) -> None:
+        """Warm up the caches."""
+        from c2cgeoportal_commons.models import DBSession  # pylint: disable=import-outside-toplevel
+
+        LOG.info("Warm up the caches after an invalidation")
+        try:
+            _warm_up_themes(self.registry, self.registry.settings.get("warmup", {}))
+            _warm_up_fulltextsearch_groups(self.registry)
+        finally:
+            transaction.abort()
+            DBSession.remove()
+
+
+def _schedule_rewarm(registry: pyramid.registry.Registry) -> None:
+    """Schedule a warm-up in the current process (after the fork of the workers)."""
+    global _rewarmer  # pylint: disable=global-statement
+    with _rewarmer_lock:
+        if _rewarmer is None or not _rewarmer.is_alive():
+            _rewarmer = Rewarmer(registry, registry.settings["warmup"]["rewarm_delay"])
+            _rewarmer.start()
+        _rewarmer.schedule()
+
+
+def _warm_up(event: pyramid.events.ApplicationCreated) -> None:
+    LOG.info("Warm up the caches")
+    try:
+        warm_up(event.app.registry)
+    except Exception:  # pylint: disable=broad-exception-caught
+        LOG.exception("Error while warming up the caches")
+
+
+def init(config: pyramid.config.Configurator) -> None:
+    """Initialize the warm-up of the caches on the application creation and after the invalidations."""
+    warmup_config = config.get_settings().get("warmup", {})
+    if warmup_config.get("enabled", False):
+        config.add_subscriber(_warm_up, pyramid.events.ApplicationCreated)
+    if warmup_config.get("rewarm_delay", 0) > 0:
+        registry = config.registry
+
+        @zope.event.classhandler.handler(InvalidateCacheEvent)  # type: ignore[misc]
+        def handle(event: InvalidateCacheEvent) -> None:
+            del event
+            _schedule_rewarm(registry)
@@ -0,0 +1,185 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+import io
+from math import sqrt
+from typing import Any, Dict, List, Optional, Tuple
+
+from lxml import etree  # nosec
+
+_CAPABILITIES_ROOTS = ("WMT_MS_Capabilities", "WMS_Capabilities")
+_MAX_RESOLUTION = 999999999
+
+
+class _LayerFrame:
+    """The information collected on a ``Layer`` element while it's open."""
+
+    __slots__ = (
+        "element",
+        "index",
+        "name",
+        "queryable",
+        "scale_hint",
+        "timepositions",
+        "default",
+        "children",
+    )
+
+    def __init__(self, element: etree.Element, index: int):
+        self.element = element
+        self.index = index
+        self.name: Optional[str] = None
+        self.queryable = int(element.get("queryable", 0))
+        self.scale_hint: Tuple[Optional[float], Optional[float]] = (None, None)
+        self.timepositions: Optional[List[str]] = None
+        self.default: Optional[str] = None
+        self.children: List[Tuple[Optional[str], Optional[float], Optional[float]]] = []
+
+
+def _local_name(element: etree.Element) -> str:
+    return etree.QName(element).localname  # type: ignore[no-any-return]
+
+
+def _resolution_hint(scale_hint: etree.Element) -> Tuple[Optional[float], Optional[float]]:
+    if "min" not in scale_hint.attrib or "max" not in scale_hint.attrib:
+        return None, None
+    # scaleHint is based upon a pixel diagonal length whereas we use
+    # resolutions based upon a pixel edge length. There is a sqrt(2)
+    # ratio between edge and diagonal of a square.
+    max_ = scale_hint.get("max")
+    return (
+        float(scale_hint.get("min")) / sqrt(2),
+        float(max_) / sqrt(2) if max_ not in ("0", "Infinity") else _MAX_RESOLUTION,
+    )
+
+
+def _merge_min(value: Optional[float], other: Optional[float]) -> Optional[float]:
+    if value is None:
+        return other
+    return value if other is None else min(value, other)
+
+
+def _merge_max(value: Optional[float], other: Optional[float]) -> Optional[float]:
+    if value is None:
+        return other
+    return value if other is None else max(value, other)
+
+
+def parse_layers(content: bytes) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the layers information needed by the themes from a WMS 1.1.1 GetCapabilities document.
+
+    The document is read in one pass, the elements are dropped as soon as they are read,
+    then the memory usage doesn't depend on the size of the document.
+
+    Returns a dictionary of the named layers, as: ``{"info": {"name", "minResolutionHint",
+    "maxResolutionHint", "queryable"}, "timepositions", "defaulttimeposition", "children"}``,
+    where the resolution hints are merged with the ones of the children layers.
+    """
+    found: List[Tuple[int, str, Dict[str, Any]]] = []
+    stack: List[_LayerFrame] = []
+    index = 0
+    for event, element in etree.iterparse(  # nosec
+        io.BytesIO(content),
+        events=("start", "end"),
+        resolve_entities=False,
+        no_network=True,
+        load_dtd=False,
+        huge_tree=True,
+    ):
+        if not isinstance(element.tag, str):
+            # Comments and processing instructions
+            if event == "end":
+                element.clear()
+            continue
+        tag = _local_name(element)
+        if event == "start":
+            if index == 0 and tag not in _CAPABILITIES_ROOTS:
+                raise ValueError(f"The document is not a WMS GetCapabilities, root element: {tag}")
+            index += 1
+            if tag == "Layer":
+                stack.append(_LayerFrame(element, index))
+            continue
+
+        if tag == "Layer":
+            frame = stack.pop()
+            resolution_min, resolution_max = frame.scale_hint
+            for _, child_min, child_max in frame.children:
+                resolution_min = _merge_min(resolution_min, child_min)
+                resolution_max = _merge_max(resolution_max, child_max)
+            if stack:
+                stack[-1].children.append((frame.name, resolution_min, resolution_max))
+            if frame.name:
+                found.append(
+                    (
+                        frame.index,
+                        frame.name,
+                        {
+                            "info": {
+                                "name": frame.name,
+                                "minResolutionHint": float(
+                                    f"{0.0 if resolution_min is None else resolution_min:0.2f}"
+                                ),
+                                "maxResolutionHint": float(
+                                    f"{_MAX_RESOLUTION if resolution_max is None else resolution_max:0.2f}"
+                                ),
+                                "queryable": frame.queryable == 1,
+                            },
+                            "timepositions": frame.timepositions,
+                            "defaulttimeposition": frame.default,
+                            "children": [child[0] for child in frame.children],
+                        },
+                    )
+                )
+        elif stack and element.getparent() is stack[-1].element:
+            frame = stack[-1]
+            if tag == "Name":
+                frame.name = element.text.strip() if element.text else None
+            elif tag == "ScaleHint":
+                frame.scale_hint = _resolution_hint(element)
+            elif (
+                tag == "Extent"
+                and frame.timepositions is None
+                and element.get("name", "").lower() == "time"
+                and element.text
+            ):
+                frame.timepositions = element.text.split(",")
+                frame.default = element.get("default")
+
+        # Drop the already read elements
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+    # Same order as in the document, on duplicated names the last layer wins
+    layers: Dict[str, Dict[str, Any]] = {}
+    for _, name, layer in sorted(found, key=lambda layer: layer[0]):
+        layers[name] = layer
+    return layers
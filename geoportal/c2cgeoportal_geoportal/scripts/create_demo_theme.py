@@ -28,17 +28,92 @@
 
 import argparse
 import logging
+from typing import TYPE_CHECKING, List, Sequence
 
 import transaction
+from sqlalchemy.orm import Session
 
 from c2cgeoportal_geoportal.scripts import fill_arguments, get_appsettings, get_session
 
+if TYPE_CHECKING:
+    import c2cgeoportal_commons.models.main
+
 LOG = logging.getLogger(__name__)
 
 
+def create_synthetic_themes(
+    session: Session,
+    ogc_server: "c2cgeoportal_commons.models.main.OGCServer",
+    interfaces: Sequence["c2cgeoportal_commons.models.main.Interface"],
+    nb_themes: int,
+    nb_groups: int,
+    nb_layers: int,
+    roles: Sequence["c2cgeoportal_commons.models.main.Role"] = (),
+    prefix: str = "synthetic",
+) -> List["c2cgeoportal_commons.models.main.Theme"]:
+    """
+    Create a synthetic layer tree, used to test the performance of the themes.
+
+    Create ``nb_themes`` themes with ``nb_groups`` groups with ``nb_layers`` WMS layers, with some metadata,
+    a dimension on each layer, and one layer on two private, accessible by the ``roles`` through
+    a restriction area by theme.
+    The WMS layer name is ``<prefix>_<theme>_<group>_<layer>``.
+    """
+    from c2cgeoportal_commons.models.main import (  # pylint: disable=import-outside-toplevel
+        Dimension,
+        LayerGroup,
+        LayerWMS,
+        Metadata,
+        RestrictionArea,
+        Theme,
+    )
+
+    themes = []
+    for theme_index in range(nb_themes):
+        theme = Theme(f"{prefix}_{theme_index}")
+        theme.interfaces = list(interfaces)
+        theme.metadatas = [Metadata("thumbnail", f"static://img/{prefix}_{theme_index}.png")]
+        private_layers = []
+        groups = []
+        for group_index in range(nb_groups):
+            group = LayerGroup(f"{prefix}_{theme_index}_{group_index}")
+            group.metadatas = [Metadata("isExpanded", "true")]
+            layers = []
+            for layer_index in range(nb_layers):
+                name = f"{prefix}_{theme_index}_{group_index}_{layer_index}"
+                layer = LayerWMS(name, name, public=layer_index % 2 == 0)
+                layer.interfaces = list(interfaces)
+                layer.ogc_server = ogc_server
+                layer.metadatas = [Metadata("legend", "true"), Metadata("identifierAttributeField", "id")]
+                layer.dimensions = [Dimension("YEAR", str(2000 + layer_index % 20))]
+                if not layer.public:
+                    private_layers.append(layer)
+                layers.append(layer)
+            group.children = layers
+            groups.append(group)
+        theme.children = groups
+        session.add(theme)
+        if private_layers and roles:
+            session.add(RestrictionArea(f"{prefix}_{theme_index}", layers=private_layers, roles=list(roles)))
+        themes.append(theme)
+    return themes
+
+
 def main() -> None:
     """Create and populate the database tables."""
     parser = argparse.ArgumentParser(description="Create and populate the database tables.")
+    parser.add_argument(
+        "--synthetic-themes",
+        type=int,
+        default=0,
+        help="Also create the given number of synthetic themes, to test the performance",
+    )
+    parser.add_argument(
+        "--synthetic-groups", type=int, default=10, help="Number of groups by synthetic theme"
+    )
+    parser.add_argument(
+        "--synthetic-layers", type=int, default=10, help="Number of layers by synthetic group"
+    )
     fill_arguments(parser)
     options = parser.parse_args()
     settings = get_appsettings(options)
@@ -75,6 +150,17 @@ def main() -> None:
 
         print("Successfully added the demo theme")
 
+        if options.synthetic_themes > 0:
+            create_synthetic_themes(
+                session,
+                ogc_server,
+                interfaces,
+                options.synthetic_themes,
+                options.synthetic_groups,
+                options.synthetic_layers,
+            )
+            print(f"Successfully added {options.synthetic_themes} synthetic themes")
+
 
 if __name__ == "__main__":
     main()
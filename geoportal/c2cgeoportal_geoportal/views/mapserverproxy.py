@@ -38,13 +38,16 @@ from c2cgeoportal_commons.lib.url import Url
 from c2cgeoportal_commons.models import main
 from c2cgeoportal_geoportal.lib import get_roles_id, get_roles_name
 from c2cgeoportal_geoportal.lib.caching import get_region
-from c2cgeoportal_geoportal.lib.common_headers import Cache
+from c2cgeoportal_geoportal.lib.common_headers import Cache, set_common_headers
 from c2cgeoportal_geoportal.lib.filter_capabilities import filter_capabilities
 from c2cgeoportal_geoportal.lib.functionality import get_mapserver_substitution_params
+from c2cgeoportal_geoportal.lib.legend_cache import LegendCache, get_legend_cache
 from c2cgeoportal_geoportal.views.ogcproxy import OGCProxy
 
 CACHE_REGION = get_region("std")
 LOG = logging.getLogger(__name__)
+# The requests that return small documents about the service
+_METADATA_REQUESTS = ("getcapabilities", "getlegendgraphic", "describefeaturetype", "describelayer")
 
 
 class MapservProxy(OGCProxy):
@@ -130,14 +133,7 @@ class MapservProxy(OGCProxy):
 
         cache_control = (
             Cache.PRIVATE
-            if method == "GET"
-            and self.lower_params.get("request")
-            in (
-                "getcapabilities",
-                "getlegendgraphic",
-                "describefeaturetype",
-                "describelayer",
-            )
+            if method == "GET" and self.lower_params.get("request") in _METADATA_REQUESTS
             else Cache.PRIVATE_NO
         )
 
@@ -147,6 +143,11 @@ class MapservProxy(OGCProxy):
             headers["sec-username"] = self.user.username
             headers["sec-roles"] = ";".join(get_roles_name(self.request))
 
+        # The legends that don't depend on the user are cached on the disk
+        legend_cache = get_legend_cache() if use_cache and "sec-username" not in headers else None
+        if legend_cache is not None:
+            return self._cached_legend(legend_cache, cache_control, _url, headers)
+
         response = self._proxy_callback(
             cache_control,
             url=_url,
@@ -165,6 +166,33 @@ class MapservProxy(OGCProxy):
 
         return response
 
+    def _cached_legend(
+        self, legend_cache: LegendCache, cache_control: Cache, url: Url, headers: Dict[str, str]
+    ) -> Response:
+        """Get the legend image from the legend cache, or from the OGC server and store it in the cache."""
+        key = legend_cache.key(self.ogc_server.name, self.request.path, self.params)
+        entry = legend_cache.get(key)
+        if entry is None:
+            response = self._proxy_callback(
+                cache_control,
+                url=url,
+                params=self.params,
+                cache=True,
+                headers=headers,
+                body=self.request.body,
+            )
+            if response.status_code != 200 or not response.content_type.startswith("image/"):
+                return response
+            entry = legend_cache.set(key, response.body, response.content_type)
+
+        # The client can revalidate its copy with the ETag or the Last-Modified headers
+        response = Response(entry.content, content_type=entry.content_type, conditional_response=True)
+        response.etag = entry.etag
+        response.last_modified = entry.last_modified
+        return set_common_headers(
+            self.request, "mapserver", cache_control, response=response, content_type=entry.content_type
+        )
+
     def _proxy_callback(
         self, cache_control: Cache, url: Url, params: Dict[str, str], **kwargs: Any
     ) -> Response:
@@ -174,6 +202,14 @@ class MapservProxy(OGCProxy):
             url = url.clone()
             url.path = self.request.path
 
+        # The metadata responses are small and shared by the concurrent identical requests,
+        # the other ones are streamed to the client
+        if self.lower_params.get("request") not in _METADATA_REQUESTS:
+            response = self._proxy(url=url, params=params, stream=True, **kwargs)
+            return self._build_response(
+                response, None, cache_control, "mapserver", content_type=response.headers["Content-Type"]
+            )
+
         response = self._proxy(url=url, params=params, **kwargs)
 
         content = response.content
@@ -28,7 +28,7 @@
 
 import logging
 import time
-from typing import Any, Dict, cast
+from typing import Any, Dict, Mapping, cast
 
 import pyramid.request
 from c2cwsgiutils import broadcast
@@ -57,7 +57,7 @@ def _nice_type_name(obj: Any, dogpile_cache: bool = False) -> str:
     return f"{type_.__module__}.{type_.__name__}"
 
 
-def _process_dict(dict_: Dict[str, Any], dogpile_cache: bool = False) -> Dict[str, Any]:
+def _process_dict(dict_: Mapping[str, Any], dogpile_cache: bool = False) -> Dict[str, Any]:
     # Timeout after one minute, must be set to a bit less that the timeout of the broadcast
     timeout = time.monotonic() + 20
 
@@ -62,9 +62,10 @@ class PdfReport(OGCProxy):
             method="POST",
             body=dumps(spec).encode("utf-8"),
             headers=headers,
+            stream=True,
         )
 
-        return self._build_response(response, response.content, Cache.PRIVATE_NO, "pdfreport")
+        return self._build_response(response, None, Cache.PRIVATE_NO, "pdfreport")
 
     @staticmethod
     def _build_map(
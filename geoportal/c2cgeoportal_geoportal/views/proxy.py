@@ -28,20 +28,40 @@
 
 import logging
 import sys
-from typing import Any, Dict, List, Optional, Union
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple, Union
 
 import pyramid.request
 import pyramid.response
 import requests
+import requests.structures
 from pyramid.httpexceptions import HTTPBadGateway, exception_response
 
 from c2cgeoportal_commons.lib.url import Url
 from c2cgeoportal_geoportal.lib.caching import get_region
 from c2cgeoportal_geoportal.lib.common_headers import Cache, set_common_headers
+from c2cgeoportal_geoportal.lib.http_session import get_session
+from c2cgeoportal_geoportal.lib.upstream import UpstreamUnavailable, get_upstream
 from c2cgeoportal_geoportal.views import restrict_headers
 
 LOG = logging.getLogger(__name__)
 CACHE_REGION = get_region("std")
+# Size of the chunks read from the upstream server in the streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+# Headers that are different on each request and don't change the upstream response
+_COALESCING_IGNORED_HEADERS = {
+    "forwarded",
+    "user-agent",
+    "x-forwarded-for",
+    "x-forwarded-host",
+    "x-forwarded-proto",
+    "x-request-id",
+}
+
+# The upstream requests in progress, by coalescing key
+_in_flight: Dict[Hashable, "Future[requests.models.Response]"] = {}
+_in_flight_lock = threading.Lock()
 
 
 class Proxy:
@@ -52,7 +72,10 @@ class Proxy:
         self.host_forward_host = request.registry.settings.get("host_forward_host", [])
         self.headers_whitelist = request.registry.settings.get("headers_whitelist", [])
         self.headers_blacklist = request.registry.settings.get("headers_blacklist", [])
-        self.http_options = self.request.registry.settings.get("http_options", {})
+        # Shared session to keep the connections to the upstream servers alive
+        self.http_session, self.http_options = get_session(
+            self.request.registry.settings.get("http_options", {})
+        )
 
     def _proxy(
         self,
@@ -62,6 +85,7 @@ class Proxy:
         cache: bool = False,
         body: Optional[bytes] = None,
         headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
     ) -> requests.models.Response:
         # Get query string
         params = dict(self.request.params) if params is None else params
@@ -111,11 +135,14 @@ class Proxy:
 
         try:
             if method in ("POST", "PUT"):
-                response = requests.request(
-                    method, url.url(), data=body, headers=headers, **self.http_options
-                )
+                response = self._request(method, url.url(), data=body, headers=headers, stream=stream)
+            elif stream:
+                response = self._request(method, url.url(), headers=headers, stream=True)
             else:
-                response = requests.request(method, url.url(), headers=headers, **self.http_options)
+                response = self._coalesced_request(method, url.url(), headers)
+        except UpstreamUnavailable as exception:
+            LOG.warning("Request to URL %s not sent: %s.", url, exception)
+            raise HTTPBadGateway(str(exception))  # pylint: disable=raise-missing-from
         except Exception:
             errors = ["Error '%s' while getting the URL:", "%s", "Method: %s", "--- With headers ---", "%s"]
             args1 = [
@@ -172,6 +199,53 @@ class Proxy:
 
         return response
 
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.models.Response:
+        """Send the request, within the concurrency limit and the circuit breaker of the upstream server."""
+        return get_upstream(url).call(
+            lambda: self.http_session.request(method, url, **kwargs, **self.http_options)
+        )
+
+    @staticmethod
+    def _coalescing_key(method: str, url: str, headers: Dict[str, str]) -> Tuple[Hashable, ...]:
+        return (
+            method,
+            url,
+            tuple(
+                sorted(
+                    (name.lower(), value)
+                    for name, value in headers.items()
+                    if name.lower() not in _COALESCING_IGNORED_HEADERS
+                )
+            ),
+        )
+
+    def _coalesced_request(self, method: str, url: str, headers: Dict[str, str]) -> requests.models.Response:
+        """
+        Do the upstream request, the concurrent identical requests share the same upstream fetch.
+
+        The returned response is shared, it should not be modified.
+        """
+        key = self._coalescing_key(method, url, headers)
+        with _in_flight_lock:
+            future = _in_flight.get(key)
+            leader = future is None
+            if future is None:
+                future = Future()
+                _in_flight[key] = future
+
+        if not leader:
+            LOG.debug("Wait on the identical request in progress for URL: %s.", url)
+            return future.result()
+
+        try:
+            future.set_result(self._request(method, url, headers=headers))
+        except BaseException as exception:  # pylint: disable=broad-exception-caught
+            future.set_exception(exception)
+        finally:
+            with _in_flight_lock:
+                del _in_flight[key]
+        return future.result()
+
     @CACHE_REGION.cache_on_arguments()
     def _proxy_cache(self, method: str, *args: Any, **kwargs: Any) -> pyramid.response.Response:
         # Method is only for the cache
@@ -192,8 +266,10 @@ class Proxy:
         cache = kwargs.get("cache", False)
         if cache is True:
             response = self._proxy_cache(url, self.request.method, **kwargs)
+            content: Optional[bytes] = response.content
         else:
-            response = self._proxy(url, **kwargs)
+            response = self._proxy(url, stream=True, **kwargs)
+            content = None
 
         cache_control = (
             (Cache.PUBLIC if public else Cache.PRIVATE)
@@ -201,22 +277,39 @@ class Proxy:
             else (Cache.PUBLIC_NO if public else Cache.PRIVATE_NO)
         )
         return self._build_response(
-            response, response.content, cache_control, service_name, headers_update=headers_update
+            response, content, cache_control, service_name, headers_update=headers_update
         )
 
+    @staticmethod
+    def _stream_content(response: requests.models.Response) -> Iterator[bytes]:
+        """Forward the upstream content by chunks, the connection goes back to the pool at the end."""
+        try:
+            yield from response.iter_content(STREAM_CHUNK_SIZE)
+        finally:
+            response.close()
+
     def _build_response(
         self,
         response: pyramid.response.Response,
-        content: bytes,
+        content: Optional[bytes],
         cache_control: Cache,
         service_name: str,
         headers: Optional[Dict[str, str]] = None,
         headers_update: Optional[Dict[str, str]] = None,
         content_type: Optional[str] = None,
     ) -> pyramid.response.Response:
+        """
+        Build the response sent to the client.
+
+        When the content is None, the upstream response (requested with `stream=True`) is streamed to the
+        client without being buffered in memory.
+        """
         if headers_update is None:
             headers_update = {}
-        headers = response.headers if headers is None else headers
+        # Copy the headers, the upstream response can be shared by several requests
+        response_headers: Dict[str, str] = requests.structures.CaseInsensitiveDict(
+            response.headers if headers is None else headers
+        )
 
         # Hop-by-hop Headers are not supported by WSGI
         # See:
@@ -232,16 +325,23 @@ class Proxy:
             "Transfer-Encoding",
             "Upgrade",
         ]:
-            if header in headers:
-                del headers[header]
+            if header in response_headers:
+                del response_headers[header]
         # Other problematic headers
         for header in ["Content-Length", "Content-Location", "Content-Encoding"]:
-            if header in headers:
-                del headers[header]
+            if header in response_headers:
+                del response_headers[header]
 
-        headers.update(headers_update)
+        response_headers.update(headers_update)
 
-        response = pyramid.response.Response(content, status=response.status_code, headers=headers)
+        if content is None:
+            response = pyramid.response.Response(
+                app_iter=self._stream_content(response), status=response.status_code, headers=response_headers
+            )
+        else:
+            response = pyramid.response.Response(
+                content, status=response.status_code, headers=response_headers
+            )
 
         return set_common_headers(
             self.request, service_name, cache_control, response=response, content_type=content_type
@@ -57,13 +57,13 @@ class ResourceProxy(Proxy):
             values = ast.literal_eval(self.request.params.get("values"))
             url = url % values
 
-            response = self._proxy(url=url)
+            response = self._proxy(url=url, stream=True)
 
             cache_control = Cache.PRIVATE_NO
             content_type = response.headers["Content-Type"]
 
             response = self._build_response(
-                response, response.content, cache_control, "externalresource", content_type=content_type
+                response, None, cache_control, "externalresource", content_type=content_type
             )
             for header in response.headers.keys():
                 if header not in self.settings["allowed_headers"]:
@@ -27,15 +27,17 @@
 
 
 import asyncio
-import gc
+import functools
 import logging
 import os
 import re
 import sys
+import threading
 import time
 from collections import Counter
-from math import sqrt
-from typing import Any, Dict, List, Optional, Set, Tuple, Union, cast
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union, cast
+from urllib.parse import urlsplit
 
 import dogpile.cache.api
 import pyramid.httpexceptions
@@ -43,26 +45,31 @@ import pyramid.request
 import requests
 import sqlalchemy
 import sqlalchemy.orm.query
+import zope.event.classhandler
 from c2cwsgiutils.auth import auth_view
 from defusedxml import lxml
 from lxml import etree  # nosec
-from owslib.wms import WebMapService
 from pyramid.view import view_config
 from sqlalchemy.orm import subqueryload
-from sqlalchemy.orm.exc import NoResultFound
 
 from c2cgeoportal_commons import models
 from c2cgeoportal_commons.lib.url import Url, get_url2
-from c2cgeoportal_commons.models import cache_invalidate_cb, main
+from c2cgeoportal_commons.models import InvalidateCacheEvent, cache_invalidate_cb, main
 from c2cgeoportal_geoportal.lib import get_roles_id, get_typed, get_types_map, is_intranet
-from c2cgeoportal_geoportal.lib.caching import get_region
+from c2cgeoportal_geoportal.lib.caching import BoundedCacheDict, get_region
 from c2cgeoportal_geoportal.lib.common_headers import Cache, set_common_headers
 from c2cgeoportal_geoportal.lib.functionality import get_mapserver_substitution_params
+from c2cgeoportal_geoportal.lib.http_session import get_session
 from c2cgeoportal_geoportal.lib.layers import (
+    LayersACL,
+    get_layers_acl,
     get_private_layers,
     get_protected_layers,
-    get_protected_layers_query,
 )
+from c2cgeoportal_geoportal.lib.layertree import LayerTree, TreeNode, get_layer_tree
+from c2cgeoportal_geoportal.lib.timing import THEMES_HISTOGRAM, PhaseTimer, get_interface_label
+from c2cgeoportal_geoportal.lib.upstream import get_upstream
+from c2cgeoportal_geoportal.lib.wmscapabilities import parse_layers
 from c2cgeoportal_geoportal.lib.wmstparsing import TimeInformation, parse_extent
 from c2cgeoportal_geoportal.views.layers import get_layer_metadata
 
@@ -70,25 +77,89 @@ LOG = logging.getLogger(__name__)
 CACHE_REGION = get_region("std")
 CACHE_OGC_SERVER_REGION = get_region("ogc-server")
 TIMEOUT = int(os.environ.get("C2CGEOPORTAL_THEME_TIMEOUT", "300"))
+# Number of OGC servers documents fetched concurrently
+HTTP_WORKERS = int(os.environ.get("C2CGEOPORTAL_THEME_HTTP_WORKERS", "16"))
+# Number of concurrent requests to the same host
+HTTP_HOST_CONCURRENCY = int(os.environ.get("C2CGEOPORTAL_THEME_HTTP_HOST_CONCURRENCY", "4"))
 
 Metadata = Union[str, int, float, bool, List[Any], Dict[str, Any]]
 
+_HTTP_EXECUTOR = ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix="c2cgeoportal-theme-http")
+_HOST_SEMAPHORES: Dict[str, threading.BoundedSemaphore] = {}
+_HOST_SEMAPHORES_LOCK = threading.Lock()
 
-def get_http_cached(
-    http_options: Dict[str, Any], url: str, headers: Dict[str, str], cache: bool = True
-) -> Tuple[bytes, str]:
-    """Get the content of the URL with a cash (dogpile)."""
 
+def _reset_after_fork() -> None:
+    """Recreate the thread pool in the forked workers, the threads of the main process are not copied."""
+    global _HTTP_EXECUTOR, _HOST_SEMAPHORES_LOCK  # pylint: disable=global-statement
+    _HTTP_EXECUTOR = ThreadPoolExecutor(
+        max_workers=HTTP_WORKERS, thread_name_prefix="c2cgeoportal-theme-http"
+    )
+    _HOST_SEMAPHORES.clear()
+    _HOST_SEMAPHORES_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_host_semaphore(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc
+    with _HOST_SEMAPHORES_LOCK:
+        if host not in _HOST_SEMAPHORES:
+            _HOST_SEMAPHORES[host] = threading.BoundedSemaphore(HTTP_HOST_CONCURRENCY)
+        return _HOST_SEMAPHORES[host]
+
+
+def _http_cache(fetch: Callable[[str], Tuple[bytes, str]]) -> Any:
     @CACHE_OGC_SERVER_REGION.cache_on_arguments()
     def do_get_http_cached(url: str) -> Tuple[bytes, str]:
-        response = requests.get(url, headers=headers, timeout=TIMEOUT, **http_options)
+        return fetch(url)
+
+    return do_get_http_cached
+
+
+def get_http_cached(
+    http_options: Dict[str, Any], url: str, headers: Dict[str, str], cache: bool = True
+) -> Tuple[bytes, str]:
+    """
+    Get the content of the URL with a cash (dogpile).
+
+    Without ``cache`` the content is get from the server and the cache is not updated, the caller should
+    store it with ``set_http_cached`` once it is validated.
+    """
+
+    def fetch(url: str) -> Tuple[bytes, str]:
+        # Shared between the requests to reuse the connections to the OGC servers
+        session, options = get_session({"pool_maxsize": HTTP_WORKERS, **http_options})
+        with _get_host_semaphore(url):
+            response = get_upstream(url).call(
+                lambda: session.get(url, headers=headers, **{"timeout": TIMEOUT, **options})
+            )
         response.raise_for_status()
         LOG.info("Get url '%s' in %.1fs.", url, response.elapsed.total_seconds())
         return response.content, response.headers.get("Content-Type", "")
 
     if cache:
-        return do_get_http_cached(url)  # type: ignore[no-any-return]
-    return do_get_http_cached.refresh(url)  # type: ignore[attr-defined,no-any-return]
+        return _http_cache(fetch)(url)  # type: ignore[no-any-return]
+    return fetch(url)
+
+
+def set_http_cached(url: str, value: Tuple[bytes, str]) -> None:
+    """Store the content (and the content type) of the URL in the cache of ``get_http_cached``."""
+    _http_cache(lambda url: value).set(value, url)
+
+
+async def async_get_http_cached(
+    http_options: Dict[str, Any], url: str, headers: Dict[str, str], cache: bool = True
+) -> Tuple[bytes, str]:
+    """
+    Get the content of the URL with a cash (dogpile), without blocking the event loop.
+
+    The requests are done in a shared thread pool, with a limited number of concurrent requests per host.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _HTTP_EXECUTOR, functools.partial(get_http_cached, http_options, url, headers, cache)
+    )
 
 
 class DimensionInformation:
@@ -141,6 +212,69 @@ class DimensionInformation:
         return self._dimensions
 
 
+class ThemeFragmentCache:
+    """
+    Process cache of the first level groups of the themes.
+
+    Each fragment records the tree items it was built from, then a modification of a tree item only drops
+    the fragments that depend on it. The least recently used fragments are evicted over ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._generation = 0
+        # The values are the fragments with the ids of the tree items they depend on
+        self._fragments = BoundedCacheDict(max_entries)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def configure(self, max_entries: int) -> None:
+        """Set the maximum number of fragments, 0 for no limit."""
+        self._fragments.configure(max_entries=max_entries)
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Tuple[Optional[Dict[str, Any]], Set[str]]]:
+        entry = self._fragments.get(repr(key))
+        return None if entry is None else entry[0]
+
+    def set(
+        self,
+        key: Tuple[Any, ...],
+        value: Tuple[Optional[Dict[str, Any]], Set[str]],
+        tree_item_ids: Iterable[int],
+        generation: int,
+    ) -> None:
+        with self._lock:
+            # Don't store a fragment that was built before an invalidation
+            if generation != self._generation:
+                return
+            self._fragments[repr(key)] = (value, frozenset(tree_item_ids))
+
+    def invalidate(self, tree_item_ids: Optional[Iterable[int]] = None) -> None:
+        """Drop the fragments that depend on the given tree items, all the fragments if it's None."""
+        with self._lock:
+            self._generation += 1
+            if tree_item_ids is None:
+                self._fragments.clear()
+                return
+            invalidated = set(tree_item_ids)
+            for key, (_, dependencies) in self._fragments.items():
+                if not dependencies.isdisjoint(invalidated):
+                    self._fragments.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+
+FRAGMENT_CACHE = ThemeFragmentCache()
+
+
+@zope.event.classhandler.handler(InvalidateCacheEvent)  # type: ignore[misc]
+def _handle_invalidate_cache(event: InvalidateCacheEvent) -> None:
+    FRAGMENT_CACHE.invalidate(event.tree_item_ids)
+
+
 class Theme:
     """All the views concerning the themes."""
 
@@ -151,13 +285,19 @@ class Theme:
         self.metadata_type = get_types_map(
             self.settings.get("admin_interface", {}).get("available_metadata", [])
         )
+        self.fragment_cache = self.settings.get("themes", {}).get("fragment_cache", False)
+        self.timer = PhaseTimer(
+            THEMES_HISTOGRAM,
+            {"interface": get_interface_label(self.settings, request.params.get("interface", "desktop"))},
+        )
 
         self._ogcservers_cache = None
-        self._treeitems_cache = None
         self._layerswms_cache = None
         self._layerswmts_cache = None
-        self._layergroup_cache = None
         self._themes_cache = None
+        self._layer_tree: Optional[LayerTree] = None
+        self._writable_layers: Optional[Tuple[LayersACL, int]] = None
+        self._ogc_servers_layers_count: Optional[Dict[int, int]] = None
 
     def _get_metadata(
         self, item: main.TreeItem, metadata: str, errors: Set[str]
@@ -171,9 +311,10 @@ class Theme:
             )
         )
 
-    def _get_metadata_list(self, item: main.TreeItem, errors: Set[str]) -> Dict[str, Metadata]:
+    def _get_metadata_list(
+        self, item: Union[main.TreeItem, TreeNode], errors: Set[str]
+    ) -> Dict[str, Metadata]:
         metadatas: Dict[str, Metadata] = {}
-        metadata: main.Metadata
         for metadata in item.metadatas:
             value = get_typed(metadata.name, metadata.value, self.metadata_type, self.request, errors)
             if value is not None:
@@ -182,7 +323,7 @@ class Theme:
         return metadatas
 
     async def _wms_getcap(
-        self, ogc_server: main.OGCServer, preload: bool = False, cache: bool = True
+        self, ogc_server: main.OGCServer, preload: bool = False, cache: bool = True, cached_only: bool = False
     ) -> Tuple[Optional[Dict[str, Dict[str, Any]]], Set[str]]:
         LOG.debug("Get the WMS Capabilities of %s, preload: %s, cache: %s", ogc_server.name, preload, cache)
 
@@ -193,10 +334,10 @@ class Theme:
             if url is None:
                 raise RuntimeError("URL is None")
 
-            version = url.query.get("VERSION", "1.1.1")
-            layers = {}
             try:
-                wms = WebMapService(None, xml=content, version=version)
+                if content is None:
+                    raise RuntimeError("Content is None")
+                layers = parse_layers(content)
             except Exception as e:
                 error = (
                     f"WARNING! an error '{e!s}' occurred while trying to read the mapfile and "
@@ -205,36 +346,18 @@ class Theme:
                 )
                 LOG.error(error, exc_info=True)
                 return None, {error}
-            wms_layers_name = list(wms.contents)
-            for layer_name in wms_layers_name:
-                wms_layer = wms[layer_name]
-                resolution = self._get_layer_resolution_hint(wms_layer)
-                info = {
-                    "name": wms_layer.name,
-                    "minResolutionHint": float(f"{resolution[0]:0.2f}"),
-                    "maxResolutionHint": float(f"{resolution[1]:0.2f}"),
-                }
-                if hasattr(wms_layer, "queryable"):
-                    info["queryable"] = wms_layer.queryable == 1
-
-                layers[layer_name] = {
-                    "info": info,
-                    "timepositions": wms_layer.timepositions,
-                    "defaulttimeposition": wms_layer.defaulttimeposition,
-                    "children": [layer.name for layer in wms_layer.layers],
-                }
-
-            del wms
 
             return {"layers": layers}, set()
 
-        if cache:
+        if cache or cached_only:
             result = build_web_map_service.get(ogc_server.id)  # type: ignore[attr-defined]
             if result != dogpile.cache.api.NO_VALUE:
                 return result  # type: ignore[no-any-return]
+            if cached_only:
+                return None, set()
 
         try:
-            url, content, errors = await self._wms_getcap_cached(ogc_server, cache=cache)
+            url, content, content_type, errors = await self._wms_getcap_cached(ogc_server, cache=cache)
         except requests.exceptions.RequestException as exception:
             error = (
                 f"Unable to get the WMS Capabilities for OGC server '{ogc_server.name}', "
@@ -242,18 +365,29 @@ class Theme:
             )
             LOG.exception(error)
             return None, {error}
-        if errors or preload:
+        if errors:
             return None, errors
+        if cache:
+            if preload:
+                return None, errors
+            return build_web_map_service.refresh(ogc_server.id)  # type: ignore
 
-        return build_web_map_service.refresh(ogc_server.id)  # type: ignore
+        # Get without the cache, the cached values are replaced only when the new document is valid
+        assert url is not None
+        assert content is not None
+        result = build_web_map_service.original(ogc_server.id)  # type: ignore[attr-defined]
+        if result[0] is not None:
+            set_http_cached(url.url(), (content, content_type))
+            build_web_map_service.set(result, ogc_server.id)  # type: ignore[attr-defined]
+        return result  # type: ignore[no-any-return]
 
     async def _wms_getcap_cached(
         self, ogc_server: main.OGCServer, cache: bool = True
-    ) -> Tuple[Optional[Url], Optional[bytes], Set[str]]:
+    ) -> Tuple[Optional[Url], Optional[bytes], str, Set[str]]:
         errors: Set[str] = set()
         url = get_url2(f"The OGC server '{ogc_server.name}'", ogc_server.url, self.request, errors)
         if errors or url is None:
-            return url, None, errors
+            return url, None, "", errors
 
         # Add functionality params
         if (
@@ -282,12 +416,14 @@ class Theme:
             headers["sec-roles"] = "root"
 
         try:
-            content, content_type = get_http_cached(self.http_options, url.url(), headers, cache=cache)
+            content, content_type = await async_get_http_cached(
+                self.http_options, url.url(), headers, cache=cache
+            )
         except Exception:
             error = f"Unable to GetCapabilities from URL {url}"
             errors.add(error)
             LOG.error(error, exc_info=True)
-            return url, None, errors
+            return url, None, "", errors
 
         # With wms 1.3 it returns text/xml also in case of error :-(
         if content_type.split(";")[0].strip() not in [
@@ -300,30 +436,9 @@ class Theme:
             )
             errors.add(error)
             LOG.error(error)
-            return url, None, errors
+            return url, None, "", errors
 
-        return url, content, errors
-
-    def _create_layer_query(self, interface: str) -> sqlalchemy.orm.query.Query:
-        """Create an SQLAlchemy query for Layer and for the role identified to by ``role_id``."""
-        query = models.DBSession.query(main.Layer.name).filter(main.Layer.public.is_(True))
-
-        if interface is not None:
-            query = query.join(main.Layer.interfaces)
-            query = query.filter(main.Interface.name == interface)
-
-        query2 = get_protected_layers_query(self.request, None, what=main.LayerWMS.name)
-        if interface is not None:
-            query2 = query2.join(main.Layer.interfaces)
-            query2 = query2.filter(main.Interface.name == interface)
-        query = query.union(query2)
-        query3 = get_protected_layers_query(self.request, None, what=main.LayerWMTS.name)
-        if interface is not None:
-            query3 = query3.join(main.Layer.interfaces)
-            query3 = query3.filter(main.Interface.name == interface)
-        query = query.union(query3)
-
-        return query
+        return url, content, content_type, errors
 
     def _get_layer_metadata_urls(self, layer: main.Layer) -> List[str]:
         metadata_urls: List[str] = []
@@ -333,45 +448,6 @@ class Theme:
             metadata_urls.extend(self._get_layer_metadata_urls(child_layer))
         return metadata_urls
 
-    def _get_layer_resolution_hint_raw(self, layer: main.Layer) -> Tuple[Optional[float], Optional[float]]:
-        resolution_hint_min = None
-        resolution_hint_max = None
-        if layer.scaleHint:
-            # scaleHint is based upon a pixel diagonal length whereas we use
-            # resolutions based upon a pixel edge length. There is a sqrt(2)
-            # ratio between edge and diagonal of a square.
-            resolution_hint_min = float(layer.scaleHint["min"]) / sqrt(2)
-            resolution_hint_max = (
-                float(layer.scaleHint["max"]) / sqrt(2)
-                if layer.scaleHint["max"] not in ("0", "Infinity")
-                else 999999999
-            )
-        for child_layer in layer.layers:
-            resolution = self._get_layer_resolution_hint_raw(child_layer)
-            resolution_hint_min = (
-                resolution[0]
-                if resolution_hint_min is None
-                else (
-                    resolution_hint_min if resolution[0] is None else min(resolution_hint_min, resolution[0])
-                )
-            )
-            resolution_hint_max = (
-                resolution[1]
-                if resolution_hint_max is None
-                else (
-                    resolution_hint_max if resolution[1] is None else max(resolution_hint_max, resolution[1])
-                )
-            )
-
-        return (resolution_hint_min, resolution_hint_max)
-
-    def _get_layer_resolution_hint(self, layer: main.Layer) -> Tuple[float, float]:
-        resolution_hint_min, resolution_hint_max = self._get_layer_resolution_hint_raw(layer)
-        return (
-            0.0 if resolution_hint_min is None else resolution_hint_min,
-            999999999 if resolution_hint_max is None else resolution_hint_max,
-        )
-
     async def _layer(
         self,
         layer: main.Layer,
@@ -461,15 +537,11 @@ class Theme:
         errors = set()
         try:
             if self.request.user:
-                count = (
-                    models.DBSession.query(main.RestrictionArea)
-                    .join(main.RestrictionArea.roles)
-                    .filter(main.Role.id.in_(get_roles_id(self.request)))
-                    .filter(main.RestrictionArea.layers.any(main.Layer.id == layer.id))
-                    .filter(main.RestrictionArea.readwrite.is_(True))
-                    .count()
-                )
-                if count > 0:
+                if self._writable_layers is None:
+                    layers_acl = get_layers_acl()
+                    self._writable_layers = (layers_acl, layers_acl.writable(get_roles_id(self.request)))
+                layers_acl, writable = self._writable_layers
+                if layers_acl.contains(writable, layer.id):
                     layer_theme["edit_columns"] = get_layer_metadata(layer)
                     layer_theme["editable"] = True
         except Exception as exception:
@@ -558,10 +630,10 @@ class Theme:
             layer_theme["xyz"] = layer.xyz
 
     @staticmethod
-    def _layer_included(tree_item: main.TreeItem) -> bool:
-        return isinstance(tree_item, main.Layer)
+    def _layer_included(tree_item: TreeNode) -> bool:
+        return not tree_item.is_group
 
-    def _get_ogc_servers(self, group: main.LayerGroup, depth: int) -> Set[Union[str, bool]]:
+    def _get_ogc_servers(self, group: TreeNode, depth: int) -> Set[Union[str, bool]]:
         """Get unique identifier for each child by recursing on all the children."""
 
         ogc_servers: Set[Union[str, bool]] = set()
@@ -572,14 +644,14 @@ class Theme:
             return ogc_servers
 
         # recurse on children
-        if isinstance(group, main.LayerGroup) and group.children:
-            for tree_item in group.children:
+        if group.item_type == "group":
+            for tree_item in self._get_layer_tree().children(group):
                 ogc_servers.update(self._get_ogc_servers(tree_item, depth + 1))
 
-        if isinstance(group, main.LayerWMS):
-            ogc_servers.add(group.ogc_server.name)
+        if group.item_type == "l_wms":
+            ogc_servers.add(cast(str, group.ogc_server))
 
-        if isinstance(group, main.LayerWMTS):
+        if group.item_type == "l_wmts":
             ogc_servers.add(False)
 
         return ogc_servers
@@ -591,7 +663,7 @@ class Theme:
     async def _group(
         self,
         path: str,
-        group: main.LayerGroup,
+        group: TreeNode,
         layers: List[str],
         depth: int = 1,
         min_levels: int = 1,
@@ -600,6 +672,7 @@ class Theme:
         dim: Optional[DimensionInformation] = None,
         wms_layers: Optional[List[str]] = None,
         layers_name: Optional[List[str]] = None,
+        tree_item_ids: Optional[Set[int]] = None,
         **kwargs: Any,
     ) -> Tuple[Optional[Dict[str, Any]], Set[str]]:
         if wms_layers is None:
@@ -609,6 +682,9 @@ class Theme:
         children = []
         errors = set()
 
+        if tree_item_ids is not None:
+            tree_item_ids.add(group.id)
+
         if re.search("[/?#]", group.name):
             errors.add(f"The group has an unsupported name '{group.name}'.")
 
@@ -627,8 +703,8 @@ class Theme:
                 time_ = TimeInformation()
             dim = DimensionInformation()
 
-        for tree_item in group.children:
-            if isinstance(tree_item, main.LayerGroup):
+        for tree_item in self._get_layer_tree().children(group):
+            if tree_item.item_type == "group":
                 group_theme, gp_errors = await self._group(
                     f"{path}/{tree_item.name}",
                     tree_item,
@@ -640,18 +716,23 @@ class Theme:
                     dim=dim,
                     wms_layers=wms_layers,
                     layers_name=layers_name,
+                    tree_item_ids=tree_item_ids,
                     **kwargs,
                 )
                 errors |= gp_errors
                 if group_theme is not None:
                     children.append(group_theme)
             elif self._layer_included(tree_item):
+                if tree_item_ids is not None:
+                    tree_item_ids.add(tree_item.id)
                 if tree_item.name in layers:
                     layers_name.append(tree_item.name)
-                    if isinstance(tree_item, main.LayerWMS):
-                        wms_layers.extend(tree_item.layer.split(","))
+                    if tree_item.item_type == "l_wms":
+                        wms_layers.extend(cast(str, tree_item.layer).split(","))
 
-                    layer_theme, l_errors = await self._layer(tree_item, mixed=mixed, time_=time_, dim=dim)
+                    layer_theme, l_errors = await self._layer(
+                        self._get_layer(tree_item), mixed=mixed, time_=time_, dim=dim
+                    )
                     errors |= l_errors
                     if layer_theme is not None:
                         if depth < min_levels:
@@ -694,8 +775,19 @@ class Theme:
         return None, errors
 
     def _layers(self, interface: str) -> List[str]:
-        query = self._create_layer_query(interface=interface)
-        return [name for (name,) in query.all()]
+        """Get the name of the layers visible with the current roles in the interface."""
+        layers_acl = get_layers_acl()
+        protected = layers_acl.protected(get_roles_id(self.request))
+        return [
+            node.name
+            for node in self._get_layer_tree().nodes.values()
+            if not node.is_group
+            and (interface is None or node.is_in_interface(interface))
+            and (
+                node.public
+                or (node.item_type in ("l_wms", "l_wmts") and layers_acl.contains(protected, node.id))
+            )
+        ]
 
     async def _wms_layers(
         self, ogc_server: main.OGCServer
@@ -707,10 +799,20 @@ class Theme:
 
         return wms, set()
 
+    def _get_layer_tree(self) -> LayerTree:
+        if self._layer_tree is None:
+            self._layer_tree = get_layer_tree()
+        return self._layer_tree
+
+    @staticmethod
+    def _get_layer(node: TreeNode) -> main.Layer:
+        # Usually already in the sqlalchemy session.identity_map, see _load_tree_items.
+        return models.DBSession.get(main.TreeItem, node.id)
+
     def _load_tree_items(self) -> None:
-        # Populate sqlalchemy session.identity_map to reduce the number of database requests.
+        # Populate sqlalchemy session.identity_map to reduce the number of database requests,
+        # the tree structure comes from the layer tree.
         self._ogcservers_cache = models.DBSession.query(main.OGCServer).all()
-        self._treeitems_cache = models.DBSession.query(main.TreeItem).all()
         self._layerswms_cache = (
             models.DBSession.query(main.LayerWMS)
             .options(subqueryload(main.LayerWMS.dimensions), subqueryload(main.LayerWMS.metadatas))
@@ -721,18 +823,9 @@ class Theme:
             .options(subqueryload(main.LayerWMTS.dimensions), subqueryload(main.LayerWMTS.metadatas))
             .all()
         )
-        self._layergroup_cache = (
-            models.DBSession.query(main.LayerGroup)
-            .options(subqueryload(main.LayerGroup.metadatas), subqueryload(main.LayerGroup.children_relation))
-            .all()
-        )
         self._themes_cache = (
             models.DBSession.query(main.Theme)
-            .options(
-                subqueryload(main.Theme.functionalities),
-                subqueryload(main.Theme.metadatas),
-                subqueryload(main.Theme.children_relation),
-            )
+            .options(subqueryload(main.Theme.functionalities), subqueryload(main.Theme.metadatas))
             .all()
         )
 
@@ -740,9 +833,12 @@ class Theme:
         self, interface: str = "desktop", filter_themes: bool = True, min_levels: int = 1
     ) -> Tuple[List[Dict[str, Any]], Set[str]]:
         """Return theme information for the role identified by ``role_id``."""
-        self._load_tree_items()
+        with self.timer.phase("tree"):
+            self._load_tree_items()
+            self._get_layer_tree()
         errors = set()
-        layers = self._layers(interface)
+        with self.timer.phase("layers"):
+            layers = self._layers(interface)
 
         themes = models.DBSession.query(main.Theme)
         themes = themes.filter(main.Theme.public.is_(True))
@@ -765,7 +861,7 @@ class Theme:
                 errors.add(f"The theme has an unsupported name '{theme.name}'.")
                 continue
 
-            children, children_errors = await self._get_children(theme, layers, min_levels)
+            children, children_errors = await self._get_children(theme, layers, min_levels, interface)
             errors |= children_errors
 
             # Test if the theme is visible for the current user
@@ -810,15 +906,18 @@ class Theme:
         return {"success": True}
 
     async def _get_children(
-        self, theme: main.Theme, layers: List[str], min_levels: int
+        self, theme: main.Theme, layers: List[str], min_levels: int, interface: Optional[str] = None
     ) -> Tuple[List[Dict[str, Any]], Set[str]]:
         children = []
         errors: Set[str] = set()
-        for item in theme.children:
-            if isinstance(item, main.LayerGroup):
-                group_theme, gp_errors = await self._group(
-                    f"{theme.name}/{item.name}", item, layers, min_levels=min_levels
-                )
+        tree = self._get_layer_tree()
+        theme_node = tree.get(theme.id)
+        for item in tree.children(theme_node) if theme_node is not None else []:
+            if item.item_type == "group":
+                with self.timer.phase("group", f"{theme.name}/{item.name}"):
+                    group_theme, gp_errors = await self._first_level_group(
+                        f"{theme.name}/{item.name}", item, layers, min_levels, interface
+                    )
                 errors |= gp_errors
                 if group_theme is not None:
                     children.append(group_theme)
@@ -829,12 +928,42 @@ class Theme:
                         f"(0/{min_levels:d})."
                     )
                 elif item.name in layers:
-                    layer_theme, l_errors = await self._layer(item, dim=DimensionInformation())
+                    layer_theme, l_errors = await self._layer(
+                        self._get_layer(item), dim=DimensionInformation()
+                    )
                     errors |= l_errors
                     if layer_theme is not None:
                         children.append(layer_theme)
         return children, errors
 
+    async def _first_level_group(
+        self, path: str, group: TreeNode, layers: List[str], min_levels: int, interface: Optional[str]
+    ) -> Tuple[Optional[Dict[str, Any]], Set[str]]:
+        if not self.fragment_cache:
+            return await self._group(path, group, layers, min_levels=min_levels)
+
+        # The visible layers and the editable flag depend on the interface and on the roles.
+        key = (
+            path,
+            group.id,
+            interface,
+            min_levels,
+            self.request.headers.get("Host"),
+            self._get_roles_key(),
+        )
+        result = FRAGMENT_CACHE.get(key)
+        if result is not None:
+            return result
+
+        generation = FRAGMENT_CACHE.generation
+        tree_item_ids: Set[int] = set()
+        result = await self._group(path, group, layers, min_levels=min_levels, tree_item_ids=tree_item_ids)
+        FRAGMENT_CACHE.set(key, result, tree_item_ids, generation)
+        return result
+
+    def _get_roles_key(self) -> str:
+        return ",".join(str(role_id) for role_id in sorted(set(get_roles_id(self.request))))
+
     @CACHE_REGION.cache_on_arguments()
     def _get_layers_enum(self) -> Dict[str, Dict[str, str]]:
         layers_enum = {}
@@ -879,7 +1008,9 @@ class Theme:
             headers["sec-roles"] = "root"
 
         try:
-            content, _ = get_http_cached(self.http_options, wfs_url.url(), headers, cache)
+            content, content_type = await async_get_http_cached(
+                self.http_options, wfs_url.url(), headers, cache
+            )
         except requests.exceptions.RequestException as exception:
             error = (
                 f"Unable to get WFS DescribeFeatureType from the URL '{wfs_url.url()}' for "
@@ -906,13 +1037,18 @@ class Theme:
             return None, errors
 
         try:
-            return lxml.XML(content), errors
+            feature_type = lxml.XML(content)
         except Exception as e:
             errors.add(
                 f"Error '{e!s}' on reading DescribeFeatureType from URL {wfs_url}:\n{content.decode()}"
             )
             return None, errors
 
+        if not cache:
+            # Get without the cache, the cached document is replaced only when the new one is valid
+            set_http_cached(wfs_url.url(), (content, content_type))
+        return feature_type, errors
+
     def get_url_internal_wfs(
         self, ogc_server: main.OGCServer, errors: Set[str]
     ) -> Tuple[Optional[Url], Optional[Url], Optional[Url]]:
@@ -943,34 +1079,101 @@ class Theme:
             url_internal_wfs = url_wfs
         return url_internal_wfs, url, url_wfs
 
-    async def _preload(self, errors: Set[str]) -> None:
-        tasks = set()
+    def _get_ogc_servers_layers_count(self) -> Dict[int, int]:
+        """Get the number of WMS layers by OGC server id, with one query for the whole request."""
+        if self._ogc_servers_layers_count is None:
+            self._ogc_servers_layers_count = dict(
+                models.DBSession.query(main.LayerWMS.ogc_server_id, sqlalchemy.func.count(main.LayerWMS.id))
+                .group_by(main.LayerWMS.ogc_server_id)
+                .all()
+            )
+        return self._ogc_servers_layers_count
+
+    def _get_used_ogc_servers(self, errors: Set[str]) -> List[Tuple[main.OGCServer, Url]]:
+        """Get the OGC servers used by at least one layer, with their internal WFS URL."""
+        result = []
+        layers_count = self._get_ogc_servers_layers_count()
         for ogc_server in models.DBSession.query(main.OGCServer).all():
             # Don't load unused OGC servers, required for landing page, because the related OGC server
             # will be on error in those functions.
-            nb_layers = (
-                models.DBSession.query(sqlalchemy.func.count(main.LayerWMS.id))
-                .filter(main.LayerWMS.ogc_server_id == ogc_server.id)
-                .one()
-            )
-            LOG.debug("%i layers for OGC server '%s'", nb_layers[0], ogc_server.name)
-            if nb_layers[0] > 0:
-                LOG.debug("Preload OGC server '%s'", ogc_server.name)
+            nb_layers = layers_count.get(ogc_server.id, 0)
+            LOG.debug("%i layers for OGC server '%s'", nb_layers, ogc_server.name)
+            if nb_layers > 0:
                 url_internal_wfs, _, _ = self.get_url_internal_wfs(ogc_server, errors)
                 if url_internal_wfs is not None:
-                    tasks.add(self.preload_ogc_server(ogc_server, url_internal_wfs))
+                    result.append((ogc_server, url_internal_wfs))
+        return result
+
+    async def _preload(self, errors: Set[str]) -> None:
+        async def preload(ogc_server: main.OGCServer, url_internal_wfs: Url) -> None:
+            with self.timer.phase("preload", ogc_server.name, ogc_server.name):
+                await self.preload_ogc_server(ogc_server, url_internal_wfs)
+
+        tasks = set()
+        for ogc_server, url_internal_wfs in self._get_used_ogc_servers(errors):
+            LOG.debug("Preload OGC server '%s'", ogc_server.name)
+            tasks.add(preload(ogc_server, url_internal_wfs))
 
         await asyncio.gather(*tasks)
 
+    async def refresh_ogc_servers(self) -> bool:
+        """
+        Refresh the cache of all the used OGC servers.
+
+        The cached values are replaced only when the new ones are successfully get and parsed,
+        in the meantime the old ones are still served.
+
+        Return True if something changed.
+        """
+        errors: Set[str] = set()
+
+        async def refresh(ogc_server: main.OGCServer, url_internal_wfs: Url) -> bool:
+            changed = False
+            # The old values are only read from the cache, absent after an invalidation
+            if ogc_server.wfs_support:
+                old_attributes = await self._get_features_attributes(
+                    url_internal_wfs, ogc_server, cached_only=True
+                )
+                new_attributes = await self._get_features_attributes(
+                    url_internal_wfs, ogc_server, cache=False, stale_on_error=True
+                )
+                changed = new_attributes[0] is not None and new_attributes[:2] != old_attributes[:2]
+            old_wms, _ = await self._wms_getcap(ogc_server, cached_only=True)
+            new_wms, _ = await self._wms_getcap(ogc_server, cache=False)
+            return changed or (new_wms is not None and new_wms != old_wms)
+
+        results = await asyncio.gather(
+            *[
+                refresh(ogc_server, url_internal_wfs)
+                for ogc_server, url_internal_wfs in self._get_used_ogc_servers(errors)
+            ]
+        )
+        if errors:
+            LOG.error("Error while refreshing the OGC servers:\n%s", "\n".join(errors))
+        if any(results):
+            # The fragments are built from the capabilities
+            FRAGMENT_CACHE.invalidate()
+            return True
+        return False
+
     async def preload_ogc_server(
         self, ogc_server: main.OGCServer, url_internal_wfs: Url, cache: bool = True
     ) -> None:
         if ogc_server.wfs_support:
-            await self._get_features_attributes(url_internal_wfs, ogc_server, cache=cache)
-        await self._wms_getcap(ogc_server, False, cache=cache)
+            await asyncio.gather(
+                self._get_features_attributes(url_internal_wfs, ogc_server, cache=cache),
+                self._wms_getcap(ogc_server, False, cache=cache),
+            )
+        else:
+            await self._wms_getcap(ogc_server, False, cache=cache)
 
     async def _get_features_attributes(
-        self, url_internal_wfs: Url, ogc_server: main.OGCServer, cache: bool = True
+        self,
+        url_internal_wfs: Url,
+        ogc_server: main.OGCServer,
+        cache: bool = True,
+        stale_on_error: bool = False,
+        cached_only: bool = False,
     ) -> Tuple[Optional[Dict[str, Dict[Any, Dict[str, Any]]]], Optional[str], Set[str]]:
         @CACHE_OGC_SERVER_REGION.cache_on_arguments()
         def _get_features_attributes_cache(
@@ -1055,15 +1258,20 @@ class Theme:
 
             return attributes, namespace, all_errors
 
-        if cache:
+        if cache or cached_only:
             result = _get_features_attributes_cache.get(  # type: ignore[attr-defined]
                 url_internal_wfs,
                 ogc_server.name,
             )
             if result != dogpile.cache.api.NO_VALUE:
                 return result  # type: ignore[no-any-return]
+            if cached_only:
+                return None, None, set()
 
         feature_type, errors = await self._wfs_get_features_type(url_internal_wfs, ogc_server, False, cache)
+        if errors and stale_on_error:
+            # Keep the cached value
+            return None, None, errors
 
         return _get_features_attributes_cache.refresh(  # type: ignore[attr-defined,no-any-return]
             url_internal_wfs,
@@ -1094,15 +1302,10 @@ class Theme:
             # Don't log if it looks to be already preloaded.
             if (time.time() - start_time) > 1:
                 LOG.info("Do preload in %.3fs.", time.time() - start_time)
-            LOG.debug("Run garbage collection: %s", ", ".join([str(gc.collect(n)) for n in range(3)]))
             result["ogcServers"] = {}
+            layers_count = self._get_ogc_servers_layers_count()
             for ogc_server in models.DBSession.query(main.OGCServer).all():
-                nb_layers = (
-                    models.DBSession.query(sqlalchemy.func.count(main.LayerWMS.id))
-                    .filter(main.LayerWMS.ogc_server_id == ogc_server.id)
-                    .one()
-                )
-                if nb_layers[0] == 0:
+                if layers_count.get(ogc_server.id, 0) == 0:
                     # QGIS Server landing page requires an OGC server that can't be used here.
                     continue
 
@@ -1117,29 +1320,31 @@ class Theme:
                         f"The OGC server '{ogc_server.name}' is configured to support WFS "
                         "but no internal WFS URL is found."
                     )
-                if ogc_server.wfs_support and url_internal_wfs:
-                    attributes, namespace, errors = await self._get_features_attributes(
-                        url_internal_wfs, ogc_server
-                    )
-                    # Create a local copy (don't modify the cache)
-                    if attributes is not None:
-                        attributes = dict(attributes)
-                    all_errors |= errors
-
-                    all_private_layers = get_private_layers([ogc_server.id]).values()
-                    protected_layers_name = [
-                        layer.name for layer in get_protected_layers(self.request, [ogc_server.id]).values()
-                    ]
-                    private_layers_name: List[str] = []
-                    for layers in [
-                        v.layer for v in all_private_layers if v.name not in protected_layers_name
-                    ]:
-                        private_layers_name.extend(layers.split(","))
-
-                    if attributes is not None:
-                        for name in private_layers_name:
-                            if name in attributes:
-                                del attributes[name]
+                with self.timer.phase("attributes", ogc_server.name, ogc_server.name):
+                    if ogc_server.wfs_support and url_internal_wfs:
+                        attributes, namespace, errors = await self._get_features_attributes(
+                            url_internal_wfs, ogc_server
+                        )
+                        # Create a local copy (don't modify the cache)
+                        if attributes is not None:
+                            attributes = dict(attributes)
+                        all_errors |= errors
+
+                        all_private_layers = get_private_layers([ogc_server.id]).values()
+                        protected_layers_name = [
+                            layer.name
+                            for layer in get_protected_layers(self.request, [ogc_server.id]).values()
+                        ]
+                        private_layers_name: List[str] = []
+                        for layers in [
+                            v.layer for v in all_private_layers if v.name not in protected_layers_name
+                        ]:
+                            private_layers_name.extend(layers.split(","))
+
+                        if attributes is not None:
+                            for name in private_layers_name:
+                                if name in attributes:
+                                    del attributes[name]
 
                 result["ogcServers"][ogc_server.name] = {
                     "url": url.url() if url else None,
@@ -1169,9 +1374,10 @@ class Theme:
                 result["background_layers"] = exported_group["children"] if exported_group is not None else []
                 all_errors |= errors
 
-            result["errors"] = list(all_errors)
-            if all_errors:
-                LOG.info("Theme errors:\n%s", "\n".join(all_errors))
+            with self.timer.phase("errors"):
+                result["errors"] = list(all_errors)
+                if all_errors:
+                    LOG.info("Theme errors:\n%s", "\n".join(all_errors))
             return result
 
         @CACHE_REGION.cache_on_arguments()
@@ -1188,11 +1394,41 @@ class Theme:
             del intranet, interface, sets, min_levels, group, background_layers_group, host
             return asyncio.run(get_theme())
 
-        if self.request.user is None:
+        @CACHE_REGION.cache_on_arguments()
+        def get_theme_roles(
+            roles_id: str,
+            interface: str,
+            sets: str,
+            min_levels: str,
+            group: str,
+            background_layers_group: str,
+            host: str,
+        ) -> Dict[str, Union[Dict[str, Dict[str, Any]], List[str]]]:
+            # Only for cache key
+            del roles_id, interface, sets, min_levels, group, background_layers_group, host
+            return asyncio.run(get_theme())
+
+        self.timer.start_request(self.request)
+        try:
+            if self.request.user is None:
+                return cast(
+                    Dict[str, Union[Dict[str, Dict[str, Any]], List[str]]],
+                    get_theme_anonymous(
+                        is_intranet(self.request),
+                        interface,
+                        sets,
+                        min_levels,
+                        group,
+                        background_layers_group,
+                        self.request.headers.get("Host"),
+                    ),
+                )
+            # The result only depends on the effective roles (including the intranet and registered ones),
+            # so all the users with the same roles share the same cache entry.
             return cast(
                 Dict[str, Union[Dict[str, Dict[str, Any]], List[str]]],
-                get_theme_anonymous(
-                    is_intranet(self.request),
+                get_theme_roles(
+                    self._get_roles_key(),
                     interface,
                     sets,
                     min_levels,
@@ -1201,16 +1437,15 @@ class Theme:
                     self.request.headers.get("Host"),
                 ),
             )
-        return asyncio.run(get_theme())
+        finally:
+            self.timer.end_view()
 
     async def _get_group(
         self, group: main.LayerGroup, interface: main.Interface
     ) -> Tuple[Optional[Dict[str, Any]], Set[str]]:
         layers = self._layers(interface)
-        try:
-            group_db = models.DBSession.query(main.LayerGroup).filter(main.LayerGroup.name == group).one()
-            return await self._group(group_db.name, group_db, layers, depth=2, dim=DimensionInformation())
-        except NoResultFound:
+        group_node = self._get_layer_tree().get_by_name("group", group)
+        if group_node is None:
             return (
                 None,
                 {
@@ -1218,6 +1453,7 @@ class Theme:
                     f"{', '.join([i[0] for i in models.DBSession.query(main.LayerGroup.name).all()])}"
                 },
             )
+        return await self._group(group_node.name, group_node, layers, depth=2, dim=DimensionInformation())
 
     @view_config(route_name="ogc_server_clear_cache", renderer="json")  # type: ignore
     def ogc_server_clear_cache_view(self) -> Dict[str, Any]:
@@ -1248,4 +1484,5 @@ class Theme:
         # Fill the cache
         await self.preload_ogc_server(ogc_server, url_internal_wfs, False)
 
+        FRAGMENT_CACHE.invalidate()
         cache_invalidate_cb()
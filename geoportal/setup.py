@@ -76,6 +76,10 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=INSTALL_REQUIRES,
+    extras_require={
+        # Faster JSON serializer for the cache, see 'CacheSerializer'
+        "orjson": ["orjson"],
+    },
     setup_requires=SETUP_REQUIRES,
     tests_require=TESTS_REQUIRE,
     entry_points={
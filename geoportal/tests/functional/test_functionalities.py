@@ -95,14 +95,19 @@ class TestFunctionalities(TestCase):
         from c2cgeoportal_commons.models.static import User
         from c2cgeoportal_geoportal.lib.functionality import get_functionality
 
-        request = create_dummy_request()
-        request.user = None
-        request1 = create_dummy_request()
-        request1.user = DBSession.query(User).filter(User.username == "__test_user1").one()
-        request2 = create_dummy_request()
-        request2.user = DBSession.query(User).filter(User.username == "__test_user2").one()
-        request3 = create_dummy_request()
-        request3.user = DBSession.query(User).filter(User.username == "__test_user3").one()
+        def create_requests():
+            requests = []
+            for username in (None, "__test_user1", "__test_user2", "__test_user3"):
+                request = create_dummy_request()
+                request.user = (
+                    None
+                    if username is None
+                    else DBSession.query(User).filter(User.username == username).one()
+                )
+                requests.append(request)
+            return requests
+
+        request, request1, request2, request3 = create_requests()
 
         settings = {
             "admin_interface": {
@@ -133,12 +138,11 @@ class TestFunctionalities(TestCase):
         settings = {
             "admin_interface": {"available_functionalities": [{"name": "__test_a"}, {"name": "__test_s"}]}
         }
+        # New requests, the functionalities are memoized in the request
+        request, request1, request2, request3 = create_requests()
         request.registry.settings.update(settings)
         request1.registry.settings.update(settings)
         request2.registry.settings.update(settings)
-        request1.user = DBSession.query(User).filter(User.username == "__test_user1").one()
-        request2.user = DBSession.query(User).filter(User.username == "__test_user2").one()
-        request3.user = DBSession.query(User).filter(User.username == "__test_user3").one()
         self.assertEqual(get_functionality("__test_s", request, False), [])
         self.assertEqual(get_functionality("__test_a", request, False), [])
         self.assertEqual(get_functionality("__test_s", request1, False), ["registered"])
@@ -153,12 +157,11 @@ class TestFunctionalities(TestCase):
         settings = {
             "admin_interface": {"available_functionalities": [{"name": "__test_a"}, {"name": "__test_s"}]}
         }
+        # New requests, the functionalities are memoized in the request
+        request, request1, request2, request3 = create_requests()
         request.registry.settings.update(settings)
         request1.registry.settings.update(settings)
         request2.registry.settings.update(settings)
-        request1.user = DBSession.query(User).filter(User.username == "__test_user1").one()
-        request2.user = DBSession.query(User).filter(User.username == "__test_user2").one()
-        request3.user = DBSession.query(User).filter(User.username == "__test_user3").one()
         self.assertEqual(get_functionality("__test_s", request, False), ["anonymous"])
         self.assertEqual(set(get_functionality("__test_a", request, False)), {"a1", "a2"})
         self.assertEqual(get_functionality("__test_s", request1, False), ["anonymous"])
@@ -175,12 +178,11 @@ class TestFunctionalities(TestCase):
         settings = {
             "admin_interface": {"available_functionalities": [{"name": "__test_a"}, {"name": "__test_s"}]}
         }
+        # New requests, the functionalities are memoized in the request
+        request, request1, request2, request3 = create_requests()
         request.registry.settings.update(settings)
         request1.registry.settings.update(settings)
         request2.registry.settings.update(settings)
-        request1.user = DBSession.query(User).filter(User.username == "__test_user1").one()
-        request2.user = DBSession.query(User).filter(User.username == "__test_user2").one()
-        request3.user = DBSession.query(User).filter(User.username == "__test_user3").one()
         self.assertEqual(get_functionality("__test_s", request, False), ["anonymous"])
         self.assertEqual(set(get_functionality("__test_a", request, False)), {"a1", "a2"})
         self.assertEqual(get_functionality("__test_s", request1, False), ["registered"])
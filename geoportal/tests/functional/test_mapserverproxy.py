@@ -903,6 +903,12 @@ class TestMapserverproxyView(TestCase):
             str(response.cache_control), "max-age=10, must-revalidate, no-cache, no-store, public"
         )
 
+    def _create_column_restriction_request(self):
+        request = self._create_dummy_request()
+        request.method = "POST"
+        request.body = COLUMN_RESTRICTION_GETFEATURE_REQUEST
+        return request
+
     def test_substitution(self):
         from c2cgeoportal_geoportal.views.mapserverproxy import MapservProxy
 
@@ -949,11 +955,11 @@ class TestMapserverproxyView(TestCase):
         assert "éàè" not in response.body.decode("utf-8")
         assert "123" not in response.body.decode("utf-8")
 
-        request.body = COLUMN_RESTRICTION_GETFEATURE_REQUEST
+        # The functionalities are memoized in the request, then we use a new request on each change
         fill_tech_user_functionality(
             "anonymous", [("mapserver_substitution", e) for e in ["cols=name", "cols=city", "cols=country"]]
         )
-        response = MapservProxy(request).proxy()
+        response = MapservProxy(self._create_column_restriction_request()).proxy()
         self.assertTrue(response.status_int, 200)
         assert "Lausanne" in response.body.decode("utf-8")
         assert "Swiss" in response.body.decode("utf-8")
@@ -961,7 +967,7 @@ class TestMapserverproxyView(TestCase):
         fill_tech_user_functionality(
             "anonymous", [("mapserver_substitution", e) for e in ["cols=name", "cols=city"]]
         )
-        response = MapservProxy(request).proxy()
+        response = MapservProxy(self._create_column_restriction_request()).proxy()
         self.assertTrue(response.status_int, 200)
         assert "Lausanne" in response.body.decode("utf-8")
         assert "Swiss" not in response.body.decode("utf-8")
@@ -969,13 +975,13 @@ class TestMapserverproxyView(TestCase):
         fill_tech_user_functionality(
             "anonymous", [("mapserver_substitution", e) for e in ["cols=name", "cols=country"]]
         )
-        response = MapservProxy(request).proxy()
+        response = MapservProxy(self._create_column_restriction_request()).proxy()
         self.assertTrue(response.status_int, 200)
         assert "Lausanne" not in response.body.decode("utf-8")
         assert "Swiss" in response.body.decode("utf-8")
 
         fill_tech_user_functionality("anonymous", [("mapserver_substitution", e) for e in ["cols=name"]])
-        response = MapservProxy(request).proxy()
+        response = MapservProxy(self._create_column_restriction_request()).proxy()
         self.assertTrue(response.status_int, 200)
         assert "Lausanne" not in response.body.decode("utf-8")
         assert "Swiss" not in response.body.decode("utf-8")
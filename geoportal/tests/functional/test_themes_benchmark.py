@@ -0,0 +1,285 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+"""
+Benchmark of the themes view.
+
+Build a synthetic layer tree, serve the OGC documents from a local stub server, and report the cold and
+warm durations, the number of database queries and the memory peak of the anonymous and authenticated
+themes builds.
+
+Run with e.g. ``C2CGEOPORTAL_BENCHMARK=10x10x20`` (themes x groups x layers), the report is printed
+(use ``pytest -s``), and written as JSON in the file ``C2CGEOPORTAL_BENCHMARK_REPORT`` if defined.
+"""
+
+# pylint: disable=missing-docstring,attribute-defined-outside-init,protected-access
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+import sqlalchemy.event
+import transaction
+from tests.functional import create_dummy_request
+from tests.functional import setup_common as setup_module  # noqa
+from tests.functional import teardown_common as teardown_module  # noqa
+
+from c2cgeoportal_geoportal.lib import caching
+
+BENCHMARK = os.environ.get("C2CGEOPORTAL_BENCHMARK")
+
+pytestmark = pytest.mark.skipif(
+    not BENCHMARK, reason="Set C2CGEOPORTAL_BENCHMARK=<themes>x<groups>x<layers> to run the benchmark"
+)
+
+REGIONS = ("std", "obj", "ogc-server")
+
+
+def _capabilities(layers: List[str]) -> bytes:
+    layers_xml = "".join(
+        f"""
+      <Layer queryable="1">
+        <Name>{name}</Name>
+        <Title>{name}</Title>
+        <SRS>EPSG:2056</SRS>
+        <ScaleHint min="0.5" max="2000"/>
+        <Extent name="time" default="2020">2000/2020/P1Y</Extent>
+      </Layer>"""
+        for name in layers
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<WMT_MS_Capabilities version="1.1.1">
+  <Service>
+    <Name>OGC:WMS</Name>
+    <Title>Benchmark</Title>
+  </Service>
+  <Capability>
+    <Request>
+      <GetCapabilities>
+        <Format>application/vnd.ogc.wms_xml</Format>
+      </GetCapabilities>
+    </Request>
+    <Layer>
+      <Title>Root</Title>{layers_xml}
+    </Layer>
+  </Capability>
+</WMT_MS_Capabilities>
+""".encode()
+
+
+def _describe_feature_type(layers: List[str]) -> bytes:
+    types_xml = "".join(
+        f"""
+  <complexType name="{name}Type">
+    <complexContent>
+      <extension base="gml:AbstractFeatureType">
+        <sequence>
+          <element name="geometry" type="gml:PointPropertyType"/>
+          <element name="id" type="integer"/>
+          <element name="name" type="string"/>
+        </sequence>
+      </extension>
+    </complexContent>
+  </complexType>
+  <element name="{name}" type="feature:{name}Type" substitutionGroup="gml:_Feature"/>"""
+        for name in layers
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<schema targetNamespace="http://mapserver.gis.umn.edu/mapserver"
+    xmlns:feature="http://mapserver.gis.umn.edu/mapserver"
+    xmlns:gml="http://www.opengis.net/gml"
+    xmlns="http://www.w3.org/2001/XMLSchema"
+    elementFormDefault="qualified" version="0.1">
+  <import namespace="http://www.opengis.net/gml"
+      schemaLocation="http://schemas.opengis.net/gml/2.1.2/feature.xsd"/>{types_xml}
+</schema>
+""".encode()
+
+
+class _StubOGCServerHandler(BaseHTTPRequestHandler):
+    documents: Dict[str, bytes] = {}
+
+    def do_GET(self) -> None:  # noqa
+        query = {key.upper(): value for key, value in parse_qsl(urlsplit(self.path).query)}
+        content = self.documents.get(query.get("REQUEST", "").lower())
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args: Any) -> None:
+        del args  # Don't log the requests
+
+
+class TestThemesBenchmark:
+    @classmethod
+    def setup_class(cls):
+        from c2cgeoportal_commons.models import DBSession
+        from c2cgeoportal_commons.models.main import OGCSERVER_AUTH_NOAUTH, Interface, OGCServer, Role
+        from c2cgeoportal_commons.models.static import User
+        from c2cgeoportal_geoportal.scripts.create_demo_theme import create_synthetic_themes
+
+        cls.nb_themes, cls.nb_groups, cls.nb_layers = (int(e) for e in BENCHMARK.split("x"))
+        layers = [
+            f"synthetic_{theme}_{group}_{layer}"
+            for theme in range(cls.nb_themes)
+            for group in range(cls.nb_groups)
+            for layer in range(cls.nb_layers)
+        ]
+        _StubOGCServerHandler.documents = {
+            "getcapabilities": _capabilities(layers),
+            "describefeaturetype": _describe_feature_type(layers),
+        }
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOGCServerHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        interface = Interface(name="desktop")
+        role = Role(name="__benchmark_role")
+        user = User(
+            username="__benchmark_user", password="__benchmark_user", settings_role=role, roles=[role]
+        )
+        user.email = "__benchmark_user@example.com"
+        ogc_server = OGCServer(
+            name="__benchmark_ogc_server",
+            url=f"http://127.0.0.1:{cls.server.server_port}/wms",
+            auth=OGCSERVER_AUTH_NOAUTH,
+        )
+        DBSession.add_all([interface, role, user, ogc_server])
+        create_synthetic_themes(
+            DBSession, ogc_server, [interface], cls.nb_themes, cls.nb_groups, cls.nb_layers, roles=[role]
+        )
+        transaction.commit()
+        cls.results: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.shutdown()
+        for region in REGIONS:
+            caching.init_region({"backend": "dogpile.cache.null"}, region)
+        cls._report()
+
+    @classmethod
+    def _report(cls):
+        print()
+        print(f"Themes benchmark, {cls.nb_themes} themes x {cls.nb_groups} groups x {cls.nb_layers} layers")
+        print(f"{'build':<30} {'duration [ms]':>14} {'queries':>8} {'memory peak [MiB]':>18}")
+        for name, result in cls.results.items():
+            print(
+                f"{name:<30} {result['duration'] * 1000:>14.1f} {result['queries']:>8d} "
+                f"{result['memory_peak'] / 1024 / 1024:>18.1f}"
+            )
+        report_filename = os.environ.get("C2CGEOPORTAL_BENCHMARK_REPORT")
+        if report_filename:
+            with open(report_filename, "w", encoding="utf-8") as report_file:
+                json.dump(
+                    {
+                        "tree": {"themes": cls.nb_themes, "groups": cls.nb_groups, "layers": cls.nb_layers},
+                        "results": cls.results,
+                    },
+                    report_file,
+                    indent=2,
+                )
+
+    @staticmethod
+    def _create_theme_obj(user=None):
+        from c2cgeoportal_geoportal.views.theme import Theme
+
+        request = create_dummy_request(
+            {
+                "admin_interface": {
+                    "available_metadata": [
+                        {"name": "thumbnail"},
+                        {"name": "isExpanded", "type": "boolean"},
+                        {"name": "legend", "type": "boolean"},
+                        {"name": "identifierAttributeField"},
+                    ]
+                },
+            }
+        )
+        request.user = user
+        request.params = {"interface": "desktop"}
+        return Theme(request)
+
+    def _measure(self, name: str, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        from c2cgeoportal_commons.models import DBSession
+
+        queries = []
+
+        def count_query(*args: Any) -> None:
+            queries.append(args)
+
+        engine = DBSession.get_bind()
+        sqlalchemy.event.listen(engine, "before_cursor_execute", count_query)
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            result = build()
+            duration = time.perf_counter() - start
+            _, memory_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            sqlalchemy.event.remove(engine, "before_cursor_execute", count_query)
+
+        self.results[name] = {"duration": duration, "queries": len(queries), "memory_peak": memory_peak}
+        return result
+
+    def _benchmark(self, name: str, user=None) -> Dict[str, Any]:
+        for region in REGIONS:
+            caching.init_region({"backend": "dogpile.cache.memory"}, region)
+        caching.invalidate_region()
+
+        cold = self._measure(f"{name} cold", lambda: self._create_theme_obj(user).themes())
+        # Only the themes cache is cleared, the OGC servers documents are still in cache
+        caching.get_region("std").invalidate()
+        self._measure(f"{name} cold (OGC cached)", lambda: self._create_theme_obj(user).themes())
+        warm = self._measure(f"{name} warm", lambda: self._create_theme_obj(user).themes())
+        assert warm == cold
+        return cold
+
+    def test_anonymous(self):
+        themes = self._benchmark("anonymous")
+        assert [e for e in themes["errors"] if "synthetic" in e] == []
+        assert len(themes["themes"]) == self.nb_themes
+
+    def test_authenticated(self):
+        from c2cgeoportal_commons.models import DBSession
+        from c2cgeoportal_commons.models.static import User
+
+        user = DBSession.query(User).filter(User.username == "__benchmark_user").one()
+        themes = self._benchmark("authenticated", user)
+        assert [e for e in themes["errors"] if "synthetic" in e] == []
+        assert len(themes["themes"]) == self.nb_themes
@@ -262,11 +262,12 @@ class TestThemesView(TestCase):
         assert set(attributes.keys()) == {"hotel_label", "police1"}
 
         assert set(self.std_cache.keys()) == set()
+        generation = caching.get_generation()
         assert set(caching.MEMORY_CACHE_DICT.keys()) == {
-            "c2cgeoportal_geoportal.lib.oauth2|_get_oauth_client_cache|10|60",
-            "c2cgeoportal_geoportal.lib.functionality|_get_role|anonymous",
-            "c2cgeoportal_geoportal.lib.functionality|_get_functionalities_type",
-            "c2cgeoportal_geoportal.lib|_get_intranet_networks",
+            f"{generation}:c2cgeoportal_geoportal.lib.oauth2|_get_oauth_client_cache|10|60",
+            f"{generation}:c2cgeoportal_geoportal.lib.functionality|_get_role|anonymous",
+            f"{generation}:c2cgeoportal_geoportal.lib.functionality|_get_functionalities_type",
+            f"{generation}:c2cgeoportal_geoportal.lib|_get_intranet_networks",
         }
         assert set(self.ogc_cache.keys()) == {
             "c2cgeoportal_geoportal.views.theme|_get_features_attributes_cache|http://mapserver:8080/?SERVICE=WFS&VERSION=1.0.0&REQUEST=DescribeFeatureType&ROLE_IDS=0&USER_ID=0|__test_ogc_server",
@@ -302,11 +303,12 @@ class TestThemesView(TestCase):
         assert set(attributes.keys()) == {"hotel_label", "police2"}
 
         assert set(self.std_cache.keys()) == set()
+        generation = caching.get_generation()
         assert set(caching.MEMORY_CACHE_DICT.keys()) == {
-            "c2cgeoportal_geoportal.lib.oauth2|_get_oauth_client_cache|10|60",
-            "c2cgeoportal_geoportal.lib.functionality|_get_role|anonymous",
-            "c2cgeoportal_geoportal.lib.functionality|_get_functionalities_type",
-            "c2cgeoportal_geoportal.lib|_get_intranet_networks",
+            f"{generation}:c2cgeoportal_geoportal.lib.oauth2|_get_oauth_client_cache|10|60",
+            f"{generation}:c2cgeoportal_geoportal.lib.functionality|_get_role|anonymous",
+            f"{generation}:c2cgeoportal_geoportal.lib.functionality|_get_functionalities_type",
+            f"{generation}:c2cgeoportal_geoportal.lib|_get_intranet_networks",
         }
         assert set(self.ogc_cache.keys()) == {
             "c2cgeoportal_geoportal.views.theme|_get_features_attributes_cache|http://mapserver:8080/?SERVICE=WFS&VERSION=1.0.0&REQUEST=DescribeFeatureType&ROLE_IDS=0&USER_ID=0|__test_ogc_server",
@@ -314,3 +316,73 @@ class TestThemesView(TestCase):
             "c2cgeoportal_geoportal.views.theme|do_get_http_cached|http://mapserver:8080/?SERVICE=WFS&VERSION=1.0.0&REQUEST=DescribeFeatureType&ROLE_IDS=0&USER_ID=0",
             "c2cgeoportal_geoportal.views.theme|do_get_http_cached|http://mapserver:8080/?SERVICE=WMS&VERSION=1.1.1&REQUEST=GetCapabilities&ROLE_IDS=0&USER_ID=0",
         }
+
+    @responses.activate
+    def test_ogc_server_refresh(self):
+        from c2cgeoportal_commons.models import DBSession
+        from c2cgeoportal_commons.models.main import OGCServer
+        from c2cgeoportal_geoportal.views.theme import Theme
+
+        ogc_server = DBSession.query(OGCServer).one()
+
+        request = create_dummy_request()
+        theme = Theme(request)
+        url_internal_wfs, _, _ = theme.get_url_internal_wfs(ogc_server, set())
+
+        wms_url = (
+            "http://mapserver:8080/?SERVICE=WMS&VERSION=1.1.1&REQUEST=GetCapabilities&ROLE_IDS=0&USER_ID=0"
+        )
+        wfs_url = "http://mapserver:8080/?SERVICE=WFS&VERSION=1.0.0&REQUEST=DescribeFeatureType&ROLE_IDS=0&USER_ID=0"
+        responses.get(
+            wms_url,
+            content_type="application/vnd.ogc.wms_xml",
+            body=CAP.format(name2="__test_layer_internal_wms2"),
+        )
+        responses.get(wfs_url, content_type="application/vnd.ogc.wms_xml", body=DFT.format(name2="police1"))
+        asyncio.run(theme._preload(set()))
+
+        # Nothing changed
+        assert asyncio.run(theme.refresh_ogc_servers()) is False
+        responses.reset()
+
+        responses.get(
+            wms_url,
+            content_type="application/vnd.ogc.wms_xml",
+            body=CAP.format(name2="__test_layer_internal_wms3"),
+        )
+        responses.get(wfs_url, content_type="application/vnd.ogc.wms_xml", body=DFT.format(name2="police2"))
+        assert asyncio.run(theme.refresh_ogc_servers()) is True
+        responses.reset()
+
+        layers, err = asyncio.run(theme._wms_getcap(ogc_server))
+        assert err == set()
+        assert "__test_layer_internal_wms3" in layers["layers"]
+        attributes, _, err = asyncio.run(theme._get_features_attributes(url_internal_wfs, ogc_server))
+        assert err == set()
+        assert set(attributes.keys()) == {"hotel_label", "police2"}
+
+        # On error, the old values are kept
+        responses.get(wms_url, status=500)
+        responses.get(wfs_url, status=500)
+        assert asyncio.run(theme.refresh_ogc_servers()) is False
+        responses.reset()
+
+        layers, err = asyncio.run(theme._wms_getcap(ogc_server))
+        assert err == set()
+        assert "__test_layer_internal_wms3" in layers["layers"]
+        attributes, _, err = asyncio.run(theme._get_features_attributes(url_internal_wfs, ogc_server))
+        assert err == set()
+        assert set(attributes.keys()) == {"hotel_label", "police2"}
+
+        # On an invalid document, the old values are kept
+        responses.get(wms_url, content_type="application/vnd.ogc.wms_xml", body="<invalid")
+        responses.get(wfs_url, content_type="application/vnd.ogc.wms_xml", body="<invalid")
+        assert asyncio.run(theme.refresh_ogc_servers()) is False
+        responses.reset()
+
+        layers, err = asyncio.run(theme._wms_getcap(ogc_server))
+        assert err == set()
+        assert "__test_layer_internal_wms3" in layers["layers"]
+        attributes, _, err = asyncio.run(theme._get_features_attributes(url_internal_wfs, ogc_server))
+        assert err == set()
+        assert set(attributes.keys()) == {"hotel_label", "police2"}
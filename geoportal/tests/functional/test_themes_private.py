@@ -266,6 +266,27 @@ class TestThemesPrivateView(TestCase):
             ],
         )
 
+    def test_private_roles_cache(self):
+        from c2cgeoportal_commons.models import DBSession
+        from c2cgeoportal_commons.models.static import User
+        from c2cgeoportal_geoportal.lib import caching
+
+        caching.init_region({"backend": "dogpile.cache.memory"}, "std")
+        try:
+            user = DBSession.query(User).filter_by(username="__test_user").one()
+            themes = self._create_theme_obj(user=user).themes()
+            # Same roles => same cache entry
+            assert self._create_theme_obj(user=user).themes() is themes
+
+            user2 = DBSession.query(User).filter_by(username="__test_user2").one()
+            themes2 = self._create_theme_obj(user=user2).themes()
+            assert themes2 is not themes
+            assert [self._only_name(t) for t in themes2["themes"]] != [
+                self._only_name(t) for t in themes["themes"]
+            ]
+        finally:
+            caching.init_region({"backend": "dogpile.cache.null"}, "std")
+
     def test_ogc_server_private_layers(self):
         from c2cgeoportal_commons.models import DBSession
         from c2cgeoportal_commons.models.static import User
@@ -27,13 +27,26 @@
 
 # pylint: disable=missing-docstring,attribute-defined-outside-init,protected-access
 
+import os
+import tempfile
+from unittest import TestCase, mock
 
-from unittest import TestCase
-
+from dogpile.cache.api import NO_VALUE, CachedValue
 from tests import DummyRequest
 
+from c2cgeoportal_geoportal.lib import caching
 from c2cgeoportal_geoportal.lib.cacheversion import get_cache_version
-from c2cgeoportal_geoportal.lib.caching import init_region, invalidate_region
+from c2cgeoportal_geoportal.lib.caching import (
+    BoundedCacheDict,
+    BoundedMemoryBackend,
+    CacheSerializer,
+    HybridRedisBackend,
+    HybridSharedRedisBackend,
+    SharedMemoryStore,
+    _redis_key,
+    init_region,
+    invalidate_region,
+)
 from c2cgeoportal_geoportal.lib.common_headers import CORS_METHODS, Cache, set_common_headers
 
 
@@ -273,3 +286,583 @@ class TestSetCorsHeaders(TestCase):
     def test_nocache(self):
         init_region({"backend": "dogpile.cache.null"}, "std")
         assert get_cache_version() != get_cache_version()
+
+
+class _FakeRedis:
+    """A Redis client that stores the values in a dictionary and records the round-trips."""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append("GET")
+        return self.data.get(key)
+
+    def mget(self, keys):
+        self.commands.append("MGET")
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value):
+        self.commands.append("SET")
+        self.data[key] = value
+
+    def mset(self, mapping):
+        self.commands.append("MSET")
+        self.data.update(mapping)
+
+    def delete(self, *keys):
+        self.commands.append("DEL")
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class TestHybridRedisBackend(TestCase):
+    def setUp(self):  # noqa
+        self.cache_dict = {}
+        self.backend = HybridRedisBackend({"url": "redis://localhost:6379", "cache_dict": self.cache_dict})
+        self.redis = _FakeRedis()
+        self.backend._redis.reader_client = self.redis
+        self.backend._redis.writer_client = self.redis
+
+    @staticmethod
+    def _value(value):
+        return CachedValue(value, {"ct": 0, "v": 1})
+
+    def test_set_multi(self):
+        self.backend.set_multi({"a": self._value(1), "b": self._value(2)})
+        assert self.redis.commands == ["MSET"]
+        assert set(self.redis.data.keys()) == {_redis_key("a"), _redis_key("b")}
+        assert set(self.cache_dict.keys()) == {"a", "b"}
+
+    def test_get_multi(self):
+        self.backend.set_multi({"a": self._value(1), "b": self._value(2)})
+        self.cache_dict.clear()
+        self.backend.set("c", self._value(3))
+        self.redis.commands = []
+
+        values = self.backend.get_multi(["a", "b", "c", "d"])
+        assert [v if v is NO_VALUE else v.payload for v in values] == [1, 2, 3, NO_VALUE]
+        # Only the values missing in memory are get from Redis, in one round-trip
+        assert self.redis.commands == ["MGET"]
+        # The memory cache is backfilled
+        assert set(self.cache_dict.keys()) == {"a", "b", "c"}
+
+        self.redis.commands = []
+        self.backend.get_multi(["a", "b", "c"])
+        assert self.redis.commands == []
+
+    def test_get_mutex(self):
+        assert self.backend.get_mutex("a") is None
+
+        backend = HybridRedisBackend(
+            {
+                "url": "redis://localhost:6379",
+                "distributed_lock": True,
+                "thread_local_lock": False,
+                "lock_timeout": 30,
+            }
+        )
+        mutex = backend.get_mutex("a")
+        assert mutex is not None
+        assert mutex.mutex.name == f"_lock{_redis_key('a')}"
+        assert mutex.mutex.timeout == 30
+
+    def test_delete_multi(self):
+        self.backend.set_multi({"a": self._value(1), "b": self._value(2), "c": self._value(3)})
+        self.redis.commands = []
+        self.backend.delete_multi(["a", "b"])
+        assert self.redis.commands == ["DEL"]
+        assert list(self.redis.data.keys()) == [_redis_key("c")]
+        assert list(self.cache_dict.keys()) == ["c"]
+
+        self.backend.delete_multi([])
+        assert self.redis.commands == ["DEL"]
+
+
+class TestSharedMemoryStore(TestCase):
+    def setUp(self):  # noqa
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):  # noqa
+        self.directory.cleanup()
+
+    def test_shared(self):
+        store = SharedMemoryStore(self.path)
+        store.set_multi({"a": b"1", "b": b"2"})
+        # Another process opens the same file
+        other = SharedMemoryStore(self.path)
+        assert other.get_multi(["a", "b", "c"]) == [b"1", b"2", None]
+
+        other.delete_multi(["a"])
+        assert store.get_multi(["a", "b"]) == [None, b"2"]
+        store.clear()
+        assert other.get_multi(["b"]) == [None]
+
+    def test_many_keys(self):
+        store = SharedMemoryStore(self.path)
+        store.QUERY_KEYS = 3
+        keys = [f"key{index}" for index in range(10)]
+        store.set_multi({key: key.encode() for key in keys[:7]})
+        assert store.get_multi(keys) == [key.encode() for key in keys[:7]] + [None] * 3
+        store.delete_multi(keys[1:])
+        assert store.get_multi(keys) == [b"key0"] + [None] * 9
+        # Above the default limit of variables of old SQLite versions (999)
+        store = SharedMemoryStore(self.path)
+        keys = [f"key{index}" for index in range(2000)]
+        assert store.get_multi(keys) == [b"key0"] + [None] * 1999
+        store.delete_multi(keys)
+        assert store.get_multi(["key0"]) == [None]
+
+    def test_expiration(self):
+        store = SharedMemoryStore(self.path)
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.time.time", return_value=1000):
+            store.set_multi({"a": b"1"}, expiration_time=10)
+            store.set_multi({"b": b"2"})
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.time.time", return_value=1011):
+            assert store.get_multi(["a", "b"]) == [None, b"2"]
+            store.evict()
+        assert store.evictions["expired"] == 1
+
+    def test_evict_lru(self):
+        store = SharedMemoryStore(self.path, max_entries=2)
+        for index, key in enumerate(["a", "b", "c"]):
+            with mock.patch("c2cgeoportal_geoportal.lib.caching.time.time", return_value=index * 100):
+                store.set_multi({key: b"1"})
+        # Access "a" to make it the most recently used
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.time.time", return_value=1000):
+            store.get_multi(["a"])
+        store.evict()
+        assert store.get_multi(["a", "b", "c"]) == [b"1", None, b"1"]
+        assert store.evictions["entries"] == 1
+
+    def test_evict_size(self):
+        store = SharedMemoryStore(self.path, max_size=25)
+        store.EVICTION_CHECK_INTERVAL = 1
+        for index, key in enumerate(["a", "b", "c"]):
+            with mock.patch("c2cgeoportal_geoportal.lib.caching.time.time", return_value=index * 100):
+                store.set_multi({key: b"0123456789"})
+        assert store.get_multi(["a", "b", "c"]) == [None, b"0123456789", b"0123456789"]
+        assert store.evictions["size"] == 1
+
+
+class TestHybridSharedRedisBackend(TestCase):
+    def setUp(self):  # noqa
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+        self.backend = self._create_backend()
+        self.redis = _FakeRedis()
+        self.backend._redis.reader_client = self.redis
+        self.backend._redis.writer_client = self.redis
+
+    def tearDown(self):  # noqa
+        self.directory.cleanup()
+
+    def _create_backend(self):
+        return HybridSharedRedisBackend({"url": "redis://localhost:6379", "shared_path": self.path})
+
+    @staticmethod
+    def _value(value):
+        return CachedValue(value, {"ct": 0, "v": 1})
+
+    def test_default_path(self):
+        # One file per region by default
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.SharedMemoryStore") as store:
+            HybridSharedRedisBackend({"url": "redis://localhost:6379", "region_name": "std"})
+            HybridSharedRedisBackend({"url": "redis://localhost:6379", "region_name": "ogc-server"})
+        assert [call.args[0] for call in store.call_args_list] == [
+            "/dev/shm/c2cgeoportal_cache_std.sqlite",
+            "/dev/shm/c2cgeoportal_cache_ogc-server.sqlite",
+        ]
+
+    def test_shared(self):
+        self.backend.set_multi({"a": self._value(1), "b": self._value(2)})
+        assert self.redis.commands == ["MSET"]
+        self.redis.commands = []
+
+        # The value set by a worker is directly visible by the others
+        values = self._create_backend().get_multi(["a", "b"])
+        assert [v.payload for v in values] == [1, 2]
+        assert self.redis.commands == []
+
+    def test_get_multi(self):
+        self.backend.set_multi({"a": self._value(1), "b": self._value(2)})
+        self.backend._store.clear()
+        self.redis.commands = []
+
+        values = self.backend.get_multi(["a", "b", "c"])
+        assert [v if v is NO_VALUE else v.payload for v in values] == [1, 2, NO_VALUE]
+        assert self.redis.commands == ["MGET"]
+
+        # The shared store is backfilled
+        self.redis.commands = []
+        assert self.backend.get("a").payload == 1
+        assert self.redis.commands == []
+
+    def test_delete_multi(self):
+        self.backend.set_multi({"a": self._value(1), "b": self._value(2)})
+        self.backend.delete_multi(["a"])
+        assert list(self.redis.data.keys()) == [_redis_key("b")]
+        assert self.backend._store.get_multi(["a", "b"])[0] is None
+
+
+class TestBoundedCacheDict(TestCase):
+    def test_max_entries(self):
+        cache = BoundedCacheDict(max_entries=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        assert cache["a"] == 1
+        cache["c"] = 3
+        # "b" is the least recently used
+        assert cache.keys() == ["a", "c"]
+        assert cache.evictions == {"entries": 1, "size": 0, "expired": 0}
+
+    def test_max_size(self):
+        cache = BoundedCacheDict(max_size=3000)
+        cache["a"] = "a" * 1000
+        cache["b"] = "b" * 1000
+        assert cache.size > 2000
+        cache["c"] = "c" * 1000
+        assert cache.keys() == ["b", "c"]
+        assert cache.evictions == {"entries": 0, "size": 1, "expired": 0}
+        # The last entry is kept even if it alone exceeds the budget
+        cache["d"] = "d" * 4000
+        assert cache.keys() == ["d"]
+        del cache["d"]
+        assert cache.size == 0
+
+    def test_configure(self):
+        cache = BoundedCacheDict()
+        for key in "abcd":
+            cache[key] = key
+        cache.configure(max_entries=2)
+        assert cache.keys() == ["c", "d"]
+
+    def test_expiration_time(self):
+        cache = BoundedCacheDict()
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.time.monotonic", return_value=100):
+            cache.set("a", 1, 10)
+            cache.set("b", 2)
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.time.monotonic", return_value=111):
+            assert cache.get("a") is None
+            assert "a" not in cache
+            assert cache.pop("a", None) is None
+            assert cache["b"] == 2
+        assert cache.evictions == {"entries": 0, "size": 0, "expired": 1}
+
+    def test_pop(self):
+        cache = BoundedCacheDict()
+        cache["a"] = "a" * 100
+        assert cache.pop("a") == "a" * 100
+        assert cache.size == 0
+        assert cache.pop("a", None) is None
+        with self.assertRaises(KeyError):
+            cache.pop("a")
+
+    def test_pop_concurrent(self):
+        import sys
+        import threading
+
+        # The entries are removed or evicted by the other threads while popping
+        cache = BoundedCacheDict(max_entries=2)
+        errors = []
+
+        def run(thread):
+            try:
+                for index in range(5000):
+                    cache[f"{thread}-{index}"] = index
+                    cache["shared"] = index
+                    cache.pop("shared", None)
+            except KeyError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=run, args=[thread]) for thread in range(4)]
+        # Switch often between the threads
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert errors == []
+        assert len(cache) <= 2
+
+    def test_backend(self):
+        cache = BoundedCacheDict()
+        backend = BoundedMemoryBackend({"cache_dict": cache, "memory_expiration_time": 10})
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.time.monotonic", return_value=100):
+            backend.set("a", 1)
+            assert backend.get("a") == 1
+        with mock.patch("c2cgeoportal_geoportal.lib.caching.time.monotonic", return_value=111):
+            assert backend.get("a") is NO_VALUE
+
+        with self.assertRaises(ValueError):
+            BoundedMemoryBackend({"cache_dict": {}, "memory_expiration_time": 10})
+
+
+class _FakeGenerationRedis:
+    def __init__(self, value=None):
+        self.value = value
+        self.gets = 0
+
+    def incr(self, key):
+        assert key == "c2cgeoportal_cache_generation"
+        self.value = int(self.value or 0) + 1
+        return self.value
+
+    def get(self, key):
+        assert key == "c2cgeoportal_cache_generation"
+        self.gets += 1
+        return None if self.value is None else str(self.value)
+
+
+class TestGeneration(TestCase):
+    def setUp(self):  # noqa
+        init_region({"backend": "dogpile.cache.memory"}, "obj")
+        caching.MEMORY_CACHE_DICT.clear()
+        caching._set_generation(0)
+
+    def tearDown(self):  # noqa
+        caching.MEMORY_CACHE_DICT.clear()
+        caching._set_generation(0)
+        init_region({"backend": "dogpile.cache.null"}, "obj")
+
+    def test_key(self):
+        caching.get_region("obj").set("key", "value")
+        caching.get_region("ogc-server")
+        assert caching.get_region("ogc-server").key_mangler is None
+        assert list(caching.MEMORY_CACHE_DICT.keys()) == ["0:key"]
+
+    def test_increment_without_redis(self):
+        region = caching.get_region("obj")
+        region.set("key", "value")
+        caching.MEMORY_CACHE_DICT["other"] = "value"
+        with mock.patch("c2cwsgiutils.redis_utils.get", return_value=(None, None, None)):
+            assert caching.increment_generation() == 1
+        assert region.get("key") is NO_VALUE
+        # The entries of the old generations are removed from the memory
+        assert list(caching.MEMORY_CACHE_DICT.keys()) == ["other"]
+
+    def test_increment(self):
+        redis = _FakeGenerationRedis(41)
+        with mock.patch("c2cwsgiutils.redis_utils.get", return_value=(redis, redis, None)):
+            assert caching.increment_generation() == 42
+        assert redis.value == 42
+
+    def test_refresh(self):
+        redis = _FakeGenerationRedis(3)
+        with mock.patch("c2cwsgiutils.redis_utils.get", return_value=(redis, redis, None)):
+            caching.refresh_generation(force=True)
+            assert caching.get_generation() == 3
+            redis.value = 4
+            # Not checked again before the interval
+            caching.refresh_generation()
+            assert caching.get_generation() == 3
+            assert redis.gets == 1
+            caching.refresh_generation(force=True)
+            assert caching.get_generation() == 4
+
+    def test_invalidate_without_origin_handler(self):
+        import zope.event
+
+        from c2cgeoportal_commons import models
+
+        region = caching.get_region("obj")
+        region.set("key", "value")
+
+        events = []
+
+        def handle(event):
+            if isinstance(event, models.InvalidateCacheEvent):
+                events.append(event)
+                caching.invalidate_generation(None, event.generation_incremented)
+
+        # Like in the admin interface, no handler increments the generation in the origin process
+        zope.event.subscribers.append(handle)
+        try:
+            models._invalidate_cache()  # pylint: disable=protected-access
+        finally:
+            zope.event.subscribers.remove(handle)
+
+        assert [event.generation_incremented for event in events] == [False]
+        assert caching.get_generation() == 0
+        assert region.get("key") is NO_VALUE
+
+    def test_invalidate_generation_incremented(self):
+        region = caching.get_region("obj")
+        region.set("key", "value")
+        redis = _FakeGenerationRedis(1)
+        with mock.patch("c2cwsgiutils.redis_utils.get", return_value=(redis, redis, None)):
+            caching.invalidate_generation(None, True)
+        assert caching.get_generation() == 1
+        assert region.get("key") is NO_VALUE
+
+    def test_broadcast_ogc_server(self):
+        import zope.event
+
+        from c2cgeoportal_commons import models
+
+        region = init_region({"backend": "dogpile.cache.memory"}, "ogc-server")
+        try:
+            region.set("capabilities", "old")
+            caching.get_region("obj").set("key", "value")
+            assert len(caching.MEMORY_CACHE_DICT) == 2
+
+            def handle(event):
+                if isinstance(event, models.InvalidateCacheEvent):
+                    caching.invalidate_generation(None, event.generation_incremented)
+
+            # Received by the other processes, when the origin incremented the generation
+            redis = _FakeGenerationRedis(1)
+            zope.event.subscribers.append(handle)
+            try:
+                with mock.patch("c2cwsgiutils.redis_utils.get", return_value=(redis, redis, None)):
+                    models._cache_invalidate_cb(
+                        generation_incremented=True
+                    )  # pylint: disable=protected-access
+            finally:
+                zope.event.subscribers.remove(handle)
+
+            # The not generation keyed memory entries are also dropped
+            assert region.get("capabilities") is NO_VALUE
+            assert caching.get_region("obj").get("key") is NO_VALUE
+            assert len(caching.MEMORY_CACHE_DICT) == 0
+        finally:
+            init_region({"backend": "dogpile.cache.null"}, "ogc-server")
+
+
+class TestCacheSerializer(TestCase):
+    VALUE = CachedValue(
+        {"themes": [{"name": f"theme{i}", "children": []} for i in range(100)]}, {"ct": 1, "v": 1}
+    )
+
+    def test_pickle(self):
+        serializer = CacheSerializer()
+        data = serializer.dumps(self.VALUE)
+        assert data[:3] == b"\x01-p"
+        assert serializer.loads(data) == self.VALUE
+
+    def test_json(self):
+        serializer = CacheSerializer(serializer="json")
+        data = serializer.dumps(self.VALUE)
+        assert data[:3] == b"\x01-j"
+        assert serializer.loads(data) == self.VALUE
+        # Not JSON serializable values fall back to pickle
+        value = CachedValue({1, 2}, {"ct": 1, "v": 1})
+        data = serializer.dumps(value)
+        assert data[:3] == b"\x01-p"
+        assert serializer.loads(data) == value
+
+    def test_json_not_str_keys(self):
+        value = CachedValue({"layers": {1: "a", 2: ["b", {3: "c"}]}}, {"ct": 1, "v": 1})
+        for orjson in (caching.orjson, None):
+            with mock.patch("c2cgeoportal_geoportal.lib.caching.orjson", orjson):
+                serializer = CacheSerializer(serializer="json")
+                # The keys are not converted to strings, fall back to pickle
+                data = serializer.dumps(value)
+                assert data[:3] == b"\x01-p"
+                assert serializer.loads(data) == value
+                assert serializer.dumps(self.VALUE)[:3] == b"\x01-j"
+
+    def test_compression(self):
+        serializer = CacheSerializer(serializer="json", compression="zlib", compression_threshold=100)
+        data = serializer.dumps(self.VALUE)
+        assert data[:2] == b"\x01z"
+        assert len(data) < len(CacheSerializer(serializer="json").dumps(self.VALUE)) / 5
+        assert serializer.loads(data) == self.VALUE
+        # Below the threshold
+        small = CachedValue("small", {"ct": 1, "v": 1})
+        assert serializer.dumps(small)[:2] == b"\x01-"
+        # Readable with an other configuration
+        assert CacheSerializer().loads(data) == self.VALUE
+
+    def test_legacy(self):
+        import pickle
+
+        assert CacheSerializer().loads(pickle.dumps(self.VALUE)) == self.VALUE
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            CacheSerializer(serializer="xml")
+        with self.assertRaises(ValueError):
+            CacheSerializer(compression="rar")
+
+
+class TestCacheStats(TestCase):
+    def setUp(self):  # noqa
+        caching.CACHE_STATS._data.clear()
+        caching.configure_stats(True)
+
+    def tearDown(self):  # noqa
+        caching.CACHE_STATS._data.clear()
+        caching.MEMORY_CACHE_DICT.clear()
+        caching.configure_stats(False)
+        init_region({"backend": "dogpile.cache.null"}, "obj")
+
+    def test_disabled(self):
+        caching.configure_stats(False)
+        region = init_region({"backend": "dogpile.cache.memory"}, "obj")
+        assert not isinstance(region.backend, caching.StatsProxy)
+
+        @region.cache_on_arguments()
+        def cached(value):
+            return value
+
+        cached(1)
+        cached(1)
+        assert caching.CACHE_STATS.get_data() == []
+
+    @staticmethod
+    def _get_stats():
+        return {
+            (labels["region"], labels["function"]): counters
+            for labels, counters in caching.CACHE_STATS.get_data()
+        }
+
+    def test_function_name(self):
+        assert caching._get_function_name("12:module.name|function|arg1|arg2") == "module.name|function"
+        assert caching._get_function_name("module.name|function") == "module.name|function"
+        assert caching._get_function_name("key") == "other"
+
+    def test_region(self):
+        region = init_region({"backend": "dogpile.cache.memory"}, "obj")
+
+        @region.cache_on_arguments()
+        def cached(value):
+            return value
+
+        cached(1)
+        cached(1)
+        cached(2)
+        stats = self._get_stats()[("obj", "tests.test_caching|cached")]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+        assert stats["creations"] == 2
+        assert stats["creation_seconds"] > 0
+
+    def test_hybrid(self):
+        backend = HybridRedisBackend({"url": "redis://localhost:6379", "cache_dict": {}})
+        redis = _FakeRedis()
+        backend._redis.reader_client = redis
+        backend._redis.writer_client = redis
+        proxy = caching.StatsProxy("std").wrap(backend)
+        value = CachedValue("value", {"ct": 0, "v": 1})
+
+        proxy.set("module|function|1", value)
+        proxy.get("module|function|1")
+        backend._memory._cache.clear()
+        proxy.get_multi(["module|function|1", "module|function|2"])
+        # The miss is counted once the value is created
+        proxy.get("module|function|2")
+        proxy.set("module|function|2", value)
+        stats = self._get_stats()[("std", "module|function")]
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["creations"] == 2
+        assert stats["memory_hits"] == 1
+        assert stats["redis_hits"] == 1
+        assert stats["stored_bytes"] > 0
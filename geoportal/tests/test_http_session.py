@@ -0,0 +1,94 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from c2cgeoportal_geoportal.lib.http_session import get_cookie_session, get_pool_stats, get_session
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.send_header("Set-Cookie", "session=secret")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        del args
+
+
+class TestHTTPSession(TestCase):
+    def setUp(self):  # noqa
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def tearDown(self):  # noqa
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_options(self):
+        session, options = get_session({"timeout": 10, "pool_maxsize": 3, "max_retries": {"total": 2}})
+        assert options == {"timeout": 10}
+        adapter = session.get_adapter("http://example.com")
+        assert adapter._pool_maxsize == 3  # pylint: disable=protected-access
+        assert adapter.max_retries.total == 2
+
+        assert get_session({"pool_maxsize": 3, "max_retries": {"total": 2}, "verify": False})[0] is session
+        assert get_session({"pool_maxsize": 4})[0] is not session
+
+    def test_keep_alive(self):
+        session, options = get_session({"timeout": 10, "pool_connections": 5})
+        for _ in range(3):
+            response = session.get(self.url, **options)
+            assert response.content == b"ok"
+
+        stats = dict((labels["host"], values) for labels, values in get_pool_stats())
+        host_stats = stats[f"http://127.0.0.1:{self.server.server_address[1]}"]
+        assert host_stats == {"connections": 1, "requests": 3, "idle": 1}
+
+        # The session is shared by all the users, the cookies are not kept
+        assert len(session.cookies) == 0
+
+    def test_cookie_session(self):
+        shared_session, options = get_session({"timeout": 10, "pool_connections": 6})
+        session = get_cookie_session({"timeout": 10, "pool_connections": 6})
+        assert session.get(self.url, **options).content == b"ok"
+        # The cookies are kept for a sticky session, but not in the shared session
+        assert session.cookies.get("session") == "secret"
+        assert len(shared_session.cookies) == 0
+        # With the pooled connections
+        assert session.get_adapter(self.url) is shared_session.get_adapter(self.url)
+        assert get_cookie_session({"pool_connections": 6}) is not session
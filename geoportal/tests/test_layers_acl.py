@@ -0,0 +1,69 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+# pylint: disable=missing-docstring
+
+from unittest import TestCase
+
+from c2c.template.config import config
+
+
+class TestLayersACL(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+
+    def test_roles_union(self):
+        from c2cgeoportal_geoportal.lib.layers import LayersACL
+
+        acl = LayersACL(
+            layer_ids=[0, 1, 2, 3],
+            public=0b0011,
+            readable={1: 0b0110, 2: 0b1000},
+            writable={1: 0b0010},
+            with_area={2: 0b1000},
+        )
+        assert list(acl.ids(acl.readable([1, 2]))) == [1, 2, 3]
+        assert list(acl.ids(acl.protected([1]))) == [2]
+        assert list(acl.ids(acl.protected([1, 2, 3]))) == [2, 3]
+        assert acl.contains(acl.writable([1]), 1)
+        assert not acl.contains(acl.writable([2]), 1)
+        assert acl.with_area([1]) == 0
+        assert acl.readable([]) == 0
+
+    def test_sparse_ids(self):
+        from c2cgeoportal_geoportal.lib.layers import LayersACL
+
+        # The bits are indexed by the positions of the layers, not by their ids
+        acl = LayersACL(layer_ids=[3, 1000, 100000], public=0, readable={1: 0b101}, writable={}, with_area={})
+        bitset = acl.readable([1])
+        assert bitset.bit_length() == 3
+        assert list(acl.ids(bitset)) == [3, 100000]
+        assert acl.contains(bitset, 100000)
+        assert not acl.contains(bitset, 1000)
+        assert not acl.contains(bitset, 2)
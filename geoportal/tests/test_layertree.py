@@ -0,0 +1,106 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+# pylint: disable=missing-docstring
+
+from unittest import TestCase
+
+import pytest
+from c2c.template.config import config
+
+
+def _node(id_, item_type, name, children=(), **kwargs):
+    from c2cgeoportal_geoportal.lib.layertree import TreeNode, TreeNodeMetadata
+
+    return TreeNode(
+        id=id_,
+        item_type=item_type,
+        name=name,
+        description=None,
+        public=kwargs.get("public"),
+        ogc_server=kwargs.get("ogc_server"),
+        layer=kwargs.get("layer"),
+        interfaces=frozenset(kwargs.get("interfaces", [])),
+        metadatas=tuple(TreeNodeMetadata(*metadata) for metadata in kwargs.get("metadatas", [])),
+        children=tuple(children),
+    )
+
+
+class TestLayerTree(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+
+    def _tree(self):
+        from c2cgeoportal_geoportal.lib.layertree import LayerTree
+
+        return LayerTree(
+            {
+                1: _node(1, "theme", "theme", [2], interfaces=["desktop"]),
+                2: _node(2, "group", "block", [3, 4], metadatas=[("exclusiveGroup", "true")]),
+                3: _node(3, "l_wms", "wms", public=True, ogc_server="server", layer="a,b"),
+                4: _node(4, "l_wmts", "wmts", public=False),
+                5: _node(5, "group", "background", [4]),
+            }
+        )
+
+    def test_navigation(self):
+        tree = self._tree()
+        theme = tree.get(1)
+        assert [node.name for node in tree.children(theme)] == ["block"]
+        assert [node.name for node in tree.walk(theme)] == ["theme", "block", "wms", "wmts"]
+        assert {node.name for node in tree.parents(tree.get(4))} == {"block", "background"}
+        assert tree.get_by_name("group", "background").id == 5
+        assert tree.get_by_name("group", "wms") is None
+        assert 3 in tree
+        assert 6 not in tree
+
+    def test_node(self):
+        tree = self._tree()
+        assert tree.get(1).is_group
+        assert tree.get(1).is_in_interface("desktop")
+        assert not tree.get(3).is_group
+        assert tree.get(2).get_metadata("exclusiveGroup")[0].value == "true"
+        assert tree.get(2).get_metadata("isExpanded") == []
+
+    def test_immutable(self):
+        tree = self._tree()
+        with pytest.raises(AttributeError):
+            tree.get(1).name = "other"
+        with pytest.raises(TypeError):
+            tree.nodes[6] = tree.get(1)
+
+    def test_pickle(self):
+        import pickle
+
+        tree = pickle.loads(pickle.dumps(self._tree()))
+        assert tree.nodes == self._tree().nodes
+        assert {node.name for node in tree.parents(tree.get(4))} == {"block", "background"}
+        assert tree.get_by_name("group", "background").id == 5
+        with pytest.raises(TypeError):
+            tree.nodes[6] = tree.get(1)
@@ -0,0 +1,240 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring
+
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+import webob
+from c2c.template.config import config
+from tests import create_dummy_request
+from tests import setup_common as setup_module  # noqa
+
+from c2cgeoportal_geoportal.lib import legend_cache
+from c2cgeoportal_geoportal.lib.legend_cache import LegendCache
+
+
+class TestLegendCache(TestCase):
+    def setUp(self):  # noqa
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.cache = LegendCache(self.directory.name, 3000)
+
+    def tearDown(self):  # noqa
+        self.directory.cleanup()
+
+    def test_key(self):
+        key = LegendCache.key(
+            "server", "/mapserv_proxy", {"LAYER": "a", "SCALE": "2500.4", "FORMAT": "image/png", "_": "123"}
+        )
+        assert key == LegendCache.key(
+            "server", "/mapserv_proxy", {"scale": "2499.6", "layer": "a", "format": "image/png", "style": ""}
+        )
+        assert key != LegendCache.key("other", "/mapserv_proxy", {"layer": "a", "scale": "2500"})
+        assert key != LegendCache.key("server", "/mapserv_proxy", {"layer": "a", "scale": "3000"})
+        assert key != LegendCache.key("server", "/mapserv_proxy", {"layer": "b", "scale": "2500"})
+
+        # Renewed after an invalidation of the cache
+        with mock.patch("c2cgeoportal_geoportal.lib.legend_cache.get_generation", return_value=10):
+            assert key != LegendCache.key(
+                "server", "/mapserv_proxy", {"layer": "a", "scale": "2500", "format": "image/png"}
+            )
+
+    def test_get_set(self):
+        key = LegendCache.key("server", "/mapserv_proxy", {"layer": "a"})
+        assert self.cache.get(key) is None
+
+        entry = self.cache.set(key, b"image", "image/png")
+        cached = self.cache.get(key)
+        assert cached == entry
+        assert cached.content == b"image"
+        assert cached.content_type == "image/png"
+        assert cached.etag == self.cache.set(key, b"image", "image/png").etag
+        assert cached.etag != self.cache.set(key, b"other", "image/png").etag
+
+        # Shared by the processes
+        assert LegendCache(self.directory.name).get(key).content == b"other"
+
+    def test_evict(self):
+        keys = [LegendCache.key("server", "/mapserv_proxy", {"layer": str(index)}) for index in range(4)]
+        for index, key in enumerate(keys):
+            self.cache.set(key, b"x" * 1000, "image/png")
+            # The least recently used is the first one
+            os.utime(self.cache._file_path(key), (index, index))  # pylint: disable=protected-access
+        self.cache.get(keys[0])
+        os.utime(
+            self.cache._file_path(keys[0]), (time.time(), time.time())
+        )  # pylint: disable=protected-access
+
+        # The metadata files are counted in the size
+        self.cache.max_size = (
+            sum(
+                os.path.getsize(os.path.join(directory, file_name))
+                for directory, _, file_names in os.walk(self.directory.name)
+                for file_name in file_names
+            )
+            - 1
+        )
+        self.cache.evict()
+        assert self.cache.evictions == 1
+        assert self.cache.get(keys[0]) is not None
+        assert self.cache.get(keys[1]) is None
+        assert self.cache.get(keys[2]) is not None
+        assert self.cache.get(keys[3]) is not None
+
+    def test_evict_temp_files(self):
+        key = LegendCache.key("server", "/mapserv_proxy", {"layer": "a"})
+        self.cache.set(key, b"image", "image/png")
+        directory = os.path.dirname(self.cache._file_path(key))  # pylint: disable=protected-access
+        for name in (".old", ".new"):
+            with open(os.path.join(directory, name), "wb") as temp_file:
+                temp_file.write(b"partial")
+        os.utime(os.path.join(directory, ".old"), (0, 0))
+
+        # The temporary files left by an interrupted write are removed
+        self.cache.evict()
+        assert sorted(name for name in os.listdir(directory) if name.startswith(".")) == [".new"]
+        assert self.cache.get(key).content == b"image"
+        assert self.cache.evictions == 0
+
+    def test_init(self):
+        legend_cache.init({"legend_cache": {"enabled": False}})
+        assert legend_cache.get_legend_cache() is None
+        legend_cache.init({"legend_cache": {"enabled": True, "path": self.directory.name, "max_size": 2}})
+        assert legend_cache.get_legend_cache().path == self.directory.name
+        assert legend_cache.get_legend_cache().max_size == 2 * 1024 * 1024
+        legend_cache.init({})
+        assert legend_cache.get_legend_cache() is None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    paths = []
+
+    def do_GET(self):  # noqa
+        self.paths.append(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"image")
+
+    def log_message(self, *args):
+        del args
+
+
+class TestLegendView(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+
+    def setUp(self):  # noqa
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.cache = LegendCache(self.directory.name)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        _Handler.paths = []
+
+    def tearDown(self):  # noqa
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def _proxy(self, auth="No auth", user=None):
+        from c2cgeoportal_commons.models import main
+        from c2cgeoportal_geoportal.views.mapserverproxy import MapservProxy
+
+        ogc_server = mock.Mock(
+            auth=auth,
+            type=main.OGCSERVER_TYPE_MAPSERVER,
+            url=f"http://127.0.0.1:{self.server.server_address[1]}/mapserv",
+        )
+        ogc_server.name = "server"
+        request = create_dummy_request(
+            {"http_options": {"timeout": 10}},
+            params={"SERVICE": "WMS", "REQUEST": "GetLegendGraphic", "LAYER": "a", "ogcserver": "server"},
+        )
+        request.matched_route = mock.Mock()
+        request.matched_route.name = "mapserverproxy"
+        request.user = user
+        request.c2c_request_id = "1234"
+        with mock.patch(
+            "c2cgeoportal_geoportal.views.ogcproxy.OGCProxy._get_ogcserver_byname", return_value=ogc_server
+        ):
+            return MapservProxy(request)
+
+    def _get(self, **kwargs):
+        with mock.patch(
+            "c2cgeoportal_geoportal.views.mapserverproxy.get_legend_cache", return_value=self.cache
+        ):
+            return self._proxy(**kwargs).proxy()
+
+    def test_miss_and_hit(self):
+        response = self._get()
+        assert response.body == b"image"
+        assert response.content_type == "image/png"
+        assert len(_Handler.paths) == 1
+        # Stored in the cache
+        stored = [
+            os.path.join(path, name)
+            for path, _, names in os.walk(self.directory.name)
+            for name in names
+            if not name.endswith(".json")
+        ]
+        assert len(stored) == 1
+        with open(stored[0], "rb") as stored_file:
+            assert stored_file.read() == b"image"
+
+        # Served from the cache
+        cached_response = self._get()
+        assert cached_response.body == b"image"
+        assert cached_response.etag == response.etag
+        assert len(_Handler.paths) == 1
+
+    def test_not_modified(self):
+        etag = self._get().etag
+        response = webob.Request.blank("/", headers={"If-None-Match": f'"{etag}"'}).get_response(self._get())
+        assert response.status_code == 304
+        assert response.body == b""
+        assert len(_Handler.paths) == 1
+
+    def test_geoserver_user(self):
+        from c2cgeoportal_commons.models import main
+
+        user = mock.Mock(id=1, username="user")
+        with mock.patch("c2cgeoportal_geoportal.views.mapserverproxy.get_roles_name", return_value=["role"]):
+            for _ in range(2):
+                response = self._get(auth=main.OGCSERVER_AUTH_GEOSERVER, user=user)
+                assert response.body == b"image"
+        # The legend can depend on the user, not cached
+        assert len(_Handler.paths) == 2
+        assert os.listdir(self.directory.name) == []
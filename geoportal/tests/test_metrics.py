@@ -0,0 +1,60 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+# pylint: disable=missing-docstring
+
+from unittest import TestCase
+
+from c2cgeoportal_geoportal.lib.metrics import STATS_FAMILIES, StatsFamily, StatsProvider
+from c2cgeoportal_geoportal.lib.timing import THEMES_HISTOGRAM
+
+
+class TestStatsProvider(TestCase):
+    def test_get_data(self):
+        family = StatsFamily(
+            "test",
+            {"hits": ("Hits", "counter")},
+            lambda: [
+                {"pid": 1, "hostname": "a", "values": [({"region": "std"}, {"hits": 2})]},
+                None,
+                {"pid": 2, "hostname": "b", "values": [({"region": "obj"}, {"hits": 3})]},
+            ],
+        )
+        assert StatsProvider("test_hits", "Hits", "counter", family, "hits").get_data() == [
+            ({"region": "std", "pid": "1", "hostname": "a"}, 2),
+            ({"region": "obj", "pid": "2", "hostname": "b"}, 3),
+        ]
+
+    def test_themes_timing(self):
+        family = STATS_FAMILIES["themes_timing"]
+        counts = list(range(len(THEMES_HISTOGRAM.buckets) + 1))
+        buckets = family.get_samples("bucket", {"phase": "a"}, (counts, 1.5))
+        assert buckets[0] == ({"phase": "a", "le": "0.005"}, 0)
+        assert buckets[-1] == ({"phase": "a", "le": "+Inf"}, counts[-1])
+        assert family.get_samples("sum", {"phase": "a"}, (counts, 1.5)) == [({"phase": "a"}, 1.5)]
+        assert family.get_samples("count", {"phase": "a"}, (counts, 1.5)) == [({"phase": "a"}, counts[-1])]
@@ -0,0 +1,123 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring,protected-access
+
+import threading
+from unittest import TestCase, mock
+
+from c2cgeoportal_geoportal.lib import ogc_server_refresher
+from c2cgeoportal_geoportal.lib.ogc_server_refresher import OGCServerRefresher
+
+
+class _FakeRedis:
+    """Store the leader lock with its time to live, and run the lock scripts."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        self.ttl[key] = ex
+        return True
+
+    def eval(self, script, numkeys, key, token, *args):
+        assert numkeys == 1
+        if self.data.get(key) != token:
+            return 0
+        if script == ogc_server_refresher._EXTEND_SCRIPT:
+            self.ttl[key] = args[0]
+        else:
+            assert script == ogc_server_refresher._RELEASE_SCRIPT
+            del self.data[key]
+            del self.ttl[key]
+        return 1
+
+
+class TestOGCServerRefresher(TestCase):
+    def _leader_refresh(self, refresher, redis):
+        with mock.patch(
+            "c2cgeoportal_geoportal.lib.ogc_server_refresher.redis_utils.get",
+            return_value=(redis, redis, None),
+        ):
+            refresher._leader_refresh()
+
+    def test_lock_held_while_refreshing(self):
+        redis = _FakeRedis()
+        started = threading.Event()
+        finish = threading.Event()
+        slow = OGCServerRefresher(mock.Mock(settings={}), 600)
+        slow.refresh = mock.Mock(side_effect=lambda: (started.set(), finish.wait(5)))
+        other = OGCServerRefresher(mock.Mock(settings={}), 600)
+        other.refresh = mock.Mock()
+
+        with mock.patch.object(ogc_server_refresher, "LOCK_TIMEOUT", 0.03):
+            thread = threading.Thread(target=self._leader_refresh, args=[slow, redis])
+            thread.start()
+            assert started.wait(5)
+            # The refresh is longer than the lock time to live, the lock is extended
+            finish.wait(0.1)
+            assert redis.ttl["c2cgeoportal_ogc_server_refresher"] == 0.03
+            self._leader_refresh(other, redis)
+            finish.set()
+            thread.join()
+
+        assert slow.refresh.call_count == 1
+        assert other.refresh.call_count == 0
+        # Kept until the end of the interval, to skip the refresh of the other processes
+        assert redis.ttl["c2cgeoportal_ogc_server_refresher"] == 598
+        self._leader_refresh(other, redis)
+        assert other.refresh.call_count == 0
+
+    def test_release_only_our_lock(self):
+        redis = _FakeRedis()
+        refresher = OGCServerRefresher(mock.Mock(settings={}), 1)
+
+        def refresh():
+            # The lock expired and was taken by another process
+            redis.data["c2cgeoportal_ogc_server_refresher"] = "other"
+
+        refresher.refresh = mock.Mock(side_effect=refresh)
+        self._leader_refresh(refresher, redis)
+        assert refresher.refresh.call_count == 1
+        assert redis.data["c2cgeoportal_ogc_server_refresher"] == "other"
+
+        # Released at the end of a short interval
+        del redis.data["c2cgeoportal_ogc_server_refresher"]
+        refresher.refresh = mock.Mock()
+        self._leader_refresh(refresher, redis)
+        assert "c2cgeoportal_ogc_server_refresher" not in redis.data
+
+    def test_without_redis(self):
+        refresher = OGCServerRefresher(mock.Mock(settings={}), 600)
+        refresher.refresh = mock.Mock()
+        self._leader_refresh(refresher, None)
+        self._leader_refresh(refresher, None)
+        assert refresher.refresh.call_count == 2
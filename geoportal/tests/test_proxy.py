@@ -0,0 +1,146 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+import pytest
+import requests
+from tests import create_dummy_request
+from tests import setup_common as setup_module  # noqa
+
+from c2cgeoportal_commons.lib.url import Url
+from c2cgeoportal_geoportal.views.proxy import STREAM_CHUNK_SIZE
+
+_CONTENT = bytes(range(256)) * (STREAM_CHUNK_SIZE // 64)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    paths = []
+
+    def do_GET(self):  # noqa
+        self.paths.append(self.path)
+        if self.path.startswith("/slow"):
+            time.sleep(0.5)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(_CONTENT)))
+        self.end_headers()
+        self.wfile.write(_CONTENT)
+
+    def log_message(self, *args):
+        del args
+
+
+class TestProxy(TestCase):
+    def setUp(self):  # noqa
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = Url(f"http://127.0.0.1:{self.server.server_address[1]}/image.png")
+        _Handler.paths = []
+
+    def tearDown(self):  # noqa
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def _create_proxy(request_id="1234", headers=None):
+        from c2cgeoportal_geoportal.views.proxy import Proxy
+
+        request = create_dummy_request({"http_options": {"timeout": 10}}, headers=headers or {})
+        request.c2c_request_id = request_id
+        return Proxy(request)
+
+    def test_stream(self):
+        proxy = self._create_proxy()
+        response = proxy._proxy_response("test", self.url)  # pylint: disable=protected-access
+
+        assert response.status_code == 200
+        assert response.content_type == "image/png"
+        # The content is not buffered
+        assert not isinstance(response.app_iter, list)
+        chunks = list(response.app_iter)
+        assert len(chunks) == 4
+        assert b"".join(chunks) == _CONTENT
+
+        # The connection is back in the pool
+        pool = proxy.http_session.get_adapter(self.url.url()).poolmanager.connection_from_url(self.url.url())
+        assert pool.pool.qsize() == pool.pool.maxsize
+
+    def test_coalescing(self):
+        url = Url(f"http://127.0.0.1:{self.server.server_address[1]}/slow")
+        proxies = [self._create_proxy(str(index)) for index in range(5)]
+        proxies.append(self._create_proxy("other", {"Authorization": "Basic b3RoZXI6b3RoZXI="}))
+        responses = [None] * len(proxies)
+
+        def fetch(index):
+            responses[index] = proxies[index]._proxy(url)  # pylint: disable=protected-access
+
+        threads = [threading.Thread(target=fetch, args=[index]) for index in range(len(proxies))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # The identical requests share the same upstream fetch, not the one with another authorization
+        assert _Handler.paths == ["/slow", "/slow"]
+        assert len({id(response) for response in responses}) == 2
+        assert all(response.content == _CONTENT for response in responses)
+
+        from c2cgeoportal_geoportal.views import proxy
+
+        assert proxy._in_flight == {}  # pylint: disable=protected-access
+
+    def test_circuit_open(self):
+        from pyramid.httpexceptions import HTTPBadGateway
+
+        from c2cgeoportal_geoportal.lib import upstream
+
+        upstream.init({"upstream_limits": {"failure_threshold": 1}})
+        try:
+            closed_url = Url("http://127.0.0.1:1/image.png")
+            with pytest.raises(HTTPBadGateway):
+                self._create_proxy()._proxy(closed_url)  # pylint: disable=protected-access
+            assert upstream.get_upstream(closed_url.url()).state == upstream.OPEN
+
+            with mock.patch.object(requests.Session, "request") as request:
+                with pytest.raises(HTTPBadGateway):
+                    self._create_proxy()._proxy(closed_url)  # pylint: disable=protected-access
+                request.assert_not_called()
+
+            # The other upstream servers are not impacted
+            assert (
+                self._create_proxy()._proxy(self.url).content == _CONTENT
+            )  # pylint: disable=protected-access
+        finally:
+            upstream.init({})
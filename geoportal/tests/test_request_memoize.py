@@ -0,0 +1,77 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring
+
+from unittest import TestCase
+
+from c2c.template.config import config
+from tests import create_dummy_request
+from tests import setup_common as setup_module  # noqa
+
+
+class TestRequestMemoize(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+
+    def test_memoize(self):
+        from c2cgeoportal_geoportal.lib import request_memoize
+
+        calls = []
+
+        @request_memoize(lambda request, name: (name, request.user))
+        def get(request, name):
+            calls.append(name)
+            return [name, request.user]
+
+        request = create_dummy_request()
+        request.user = None
+        assert get(request, "a") == ["a", None]
+        assert get(request, "a") is get(request, "a")
+        assert calls == ["a"]
+
+        get(request, "b")
+        assert calls == ["a", "b"]
+
+        # The user changed (login) => the value is computed again
+        request.user = "user"
+        assert get(request, "a") == ["a", "user"]
+        assert calls == ["a", "b", "a"]
+
+        # A new request has its own memo
+        get(create_dummy_request(user=None), "a")
+        assert calls == ["a", "b", "a", "a"]
+
+    def test_is_intranet(self):
+        from c2cgeoportal_geoportal.lib import is_intranet
+
+        request = create_dummy_request({"intranet": {"networks": ["192.168.1.0/24"]}})
+        request.client_addr = "192.168.1.10"
+        assert is_intranet(request)
+        request.client_addr = "10.0.0.1"
+        assert not is_intranet(request)
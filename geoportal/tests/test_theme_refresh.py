@@ -0,0 +1,116 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring,protected-access
+
+import asyncio
+from unittest import TestCase, mock
+
+import responses
+from c2c.template.config import config
+from tests import create_dummy_request
+
+from c2cgeoportal_geoportal.lib import caching
+
+CAP = """<?xml version="1.0" encoding="utf-8"?>
+<WMT_MS_Capabilities version="1.1.1">
+<Capability><Layer><Name>{name}</Name></Layer></Capability>
+</WMT_MS_Capabilities>"""
+URL = "http://example.com/wms?SERVICE=WMS&VERSION=1.1.1&REQUEST=GetCapabilities&ROLE_IDS=0&USER_ID=0"
+
+
+class TestThemeRefresh(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+        caching.MEMORY_CACHE_DICT.clear()
+        caching.init_region({"backend": "dogpile.cache.memory"}, "ogc-server")
+
+    def teardown_method(self, _):
+        caching.MEMORY_CACHE_DICT.clear()
+        caching.init_region({"backend": "dogpile.cache.null"}, "ogc-server")
+
+    @staticmethod
+    def _ogc_server():
+        from c2cgeoportal_commons.models import main
+
+        ogc_server = mock.Mock(
+            id=1,
+            url="http://example.com/wms",
+            auth=main.OGCSERVER_AUTH_NOAUTH,
+            type=main.OGCSERVER_TYPE_QGISSERVER,
+            wfs_support=False,
+        )
+        ogc_server.name = "server"
+        return ogc_server
+
+    @responses.activate
+    def test_keep_cached_on_invalid_document(self):
+        from c2cgeoportal_geoportal.views.theme import Theme, get_http_cached
+
+        ogc_server = self._ogc_server()
+        theme = Theme(create_dummy_request())
+
+        responses.get(URL, content_type="text/xml", body=CAP.format(name="layer1"))
+        layers, errors = asyncio.run(theme._wms_getcap(ogc_server))
+        assert errors == set()
+        assert "layer1" in layers["layers"]
+        responses.reset()
+
+        # A valid document replaces the cached values
+        responses.get(URL, content_type="text/xml", body=CAP.format(name="layer2"))
+        layers, errors = asyncio.run(theme._wms_getcap(ogc_server, cache=False))
+        assert "layer2" in layers["layers"]
+        responses.reset()
+
+        # An invalid document doesn't replace them
+        responses.get(URL, content_type="text/xml", body="<invalid")
+        layers, errors = asyncio.run(theme._wms_getcap(ogc_server, cache=False))
+        assert layers is None
+        assert len(errors) == 1
+        responses.reset()
+
+        layers, errors = asyncio.run(theme._wms_getcap(ogc_server))
+        assert errors == set()
+        assert "layer2" in layers["layers"]
+        content, _ = get_http_cached({}, URL, {})
+        assert b"layer2" in content
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_refresh_cold_cache(self):
+        from c2cgeoportal_geoportal.views.theme import Theme
+
+        ogc_server = self._ogc_server()
+        theme = Theme(create_dummy_request())
+        responses.get(URL, content_type="text/xml", body=CAP.format(name="layer1"))
+        with mock.patch.object(Theme, "_get_used_ogc_servers", return_value=[(ogc_server, None)]):
+            # Nothing in the cache, one fetch and the new capabilities are a change
+            assert asyncio.run(theme.refresh_ogc_servers())
+            assert len(responses.calls) == 1
+            assert not asyncio.run(theme.refresh_ogc_servers())
+            assert len(responses.calls) == 2
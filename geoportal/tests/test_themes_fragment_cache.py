@@ -0,0 +1,111 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+# pylint: disable=missing-docstring
+
+
+import asyncio
+from unittest import TestCase
+
+from c2c.template.config import config
+
+from c2cgeoportal_commons.models import InvalidateCacheEvent
+
+
+class TestThemeFragmentCache(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+
+    def test_invalidate_dependencies(self):
+        from c2cgeoportal_geoportal.views.theme import ThemeFragmentCache
+
+        cache = ThemeFragmentCache()
+        cache.set(("g1",), ({"name": "g1"}, set()), {1, 2}, cache.generation)
+        cache.set(("g2",), ({"name": "g2"}, set()), {3, 4}, cache.generation)
+
+        cache.invalidate([2])
+        assert cache.get(("g1",)) is None
+        assert cache.get(("g2",)) == ({"name": "g2"}, set())
+
+        cache.invalidate()
+        assert cache.get(("g2",)) is None
+
+    def test_outdated_generation(self):
+        from c2cgeoportal_geoportal.views.theme import ThemeFragmentCache
+
+        cache = ThemeFragmentCache()
+        generation = cache.generation
+        cache.invalidate([5])
+        cache.set(("g1",), ({"name": "g1"}, set()), {1}, generation)
+        assert cache.get(("g1",)) is None
+
+    def test_event(self):
+        import zope.event
+
+        from c2cgeoportal_geoportal.views.theme import FRAGMENT_CACHE
+
+        FRAGMENT_CACHE.set(("g1",), ({"name": "g1"}, set()), {1}, FRAGMENT_CACHE.generation)
+        FRAGMENT_CACHE.set(("g2",), ({"name": "g2"}, set()), {2}, FRAGMENT_CACHE.generation)
+        zope.event.notify(InvalidateCacheEvent([1]))
+        assert FRAGMENT_CACHE.get(("g1",)) is None
+        assert FRAGMENT_CACHE.get(("g2",)) is not None
+        zope.event.notify(InvalidateCacheEvent())
+        assert FRAGMENT_CACHE.get(("g2",)) is None
+
+    def test_bounded(self):
+        from c2cgeoportal_geoportal.views.theme import ThemeFragmentCache
+
+        cache = ThemeFragmentCache(max_entries=2)
+        cache.set(("g1",), ({"name": "g1"}, set()), {1}, cache.generation)
+        cache.set(("g2",), ({"name": "g2"}, set()), {2}, cache.generation)
+        assert cache.get(("g1",)) is not None
+        cache.set(("g3",), ({"name": "g3"}, set()), {1}, cache.generation)
+        # The least recently used is evicted
+        assert len(cache) == 2
+        assert cache.get(("g2",)) is None
+        cache.invalidate([1])
+        assert len(cache) == 0
+
+    def test_refresh_ogc_servers(self):
+        from unittest import mock
+
+        from c2cgeoportal_geoportal.views.theme import FRAGMENT_CACHE, Theme
+
+        FRAGMENT_CACHE.set(("g1",), ({"name": "g1"}, set()), {1}, FRAGMENT_CACHE.generation)
+        theme = Theme.__new__(Theme)
+        ogc_server = mock.Mock(wfs_support=False)
+        with mock.patch.object(Theme, "_get_used_ogc_servers", return_value=[(ogc_server, None)]):
+            with mock.patch.object(Theme, "_wms_getcap", side_effect=[({"layers": {}}, set())] * 2):
+                assert not asyncio.run(theme.refresh_ogc_servers())
+            assert FRAGMENT_CACHE.get(("g1",)) is not None
+            with mock.patch.object(
+                Theme, "_wms_getcap", side_effect=[({"layers": {}}, set()), ({"layers": {"a": {}}}, set())]
+            ):
+                assert asyncio.run(theme.refresh_ogc_servers())
+        assert FRAGMENT_CACHE.get(("g1",)) is None
@@ -0,0 +1,81 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+
+# pylint: disable=missing-docstring
+
+from unittest.mock import patch
+
+from pyramid import testing
+
+from c2cgeoportal_geoportal.lib.timing import Histogram, PhaseTimer, get_interface_label
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    histogram.observe({"phase": "tree"}, 0.05)
+    histogram.observe({"phase": "tree"}, 0.5)
+    histogram.observe({"phase": "tree"}, 5)
+    histogram.observe({"phase": "layers"}, 0.5)
+    assert sorted(histogram.get_data(), key=lambda e: e[0]["phase"]) == [
+        ({"phase": "layers"}, [0, 1, 1], 0.5),
+        ({"phase": "tree"}, [1, 2, 3], 5.55),
+    ]
+
+
+def test_server_timing():
+    histogram = Histogram()
+    timer = PhaseTimer(histogram, {"interface": "desktop"})
+    timer.add("preload", 0.0123, 'server "1"', "server1")
+    with timer.phase("tree"):
+        pass
+    assert timer.server_timing().startswith('preload;dur=12.3;desc="server \\"1\\"", tree;dur=')
+    assert {tuple(sorted(labels.items())) for labels, _, _ in histogram.get_data()} == {
+        (("interface", "desktop"), ("ogc_server", "server1"), ("phase", "preload")),
+        (("interface", "desktop"), ("ogc_server", ""), ("phase", "tree")),
+    }
+
+
+@patch("c2cgeoportal_geoportal.lib.timing.is_auth")
+def test_response_header(is_auth):
+    request = testing.DummyRequest()
+    response = request.response
+    for auth in (False, True):
+        is_auth.return_value = auth
+        timer = PhaseTimer(Histogram(), {})
+        timer.start_request(request)
+        timer.end_view()
+        request.response_callbacks.pop()(request, response)
+        assert [name for name, _, _ in timer.timings] == ["serialization", "total"]
+        assert ("Server-Timing" in response.headers) == auth
+
+
+def test_interface_label():
+    settings = {"interfaces": [{"name": "desktop", "default": True}, {"name": "mobile"}]}
+    assert get_interface_label(settings, "mobile") == "mobile"
+    assert get_interface_label(settings, "random-1234") == "other"
+    assert get_interface_label({}, "desktop") == "other"
@@ -0,0 +1,126 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring
+
+import threading
+from unittest import TestCase, mock
+
+import pytest
+import requests
+
+from c2cgeoportal_geoportal.lib import upstream
+from c2cgeoportal_geoportal.lib.upstream import Upstream, UpstreamUnavailable
+
+
+class _Response:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+
+
+def _fail():
+    raise requests.exceptions.ConnectionError()
+
+
+class TestUpstream(TestCase):
+    def tearDown(self):  # noqa
+        upstream.init({})
+
+    def test_concurrency(self):
+        guard = Upstream("http://example.com", {"max_concurrency": 1, "queue_timeout": 0.1})
+        started = threading.Event()
+        done = threading.Event()
+
+        def slow():
+            started.set()
+            done.wait(5)
+            return _Response()
+
+        thread = threading.Thread(target=guard.call, args=[slow])
+        thread.start()
+        started.wait(5)
+        assert guard.in_flight == 1
+        with pytest.raises(UpstreamUnavailable):
+            guard.call(_Response)
+        assert guard.rejected == 1
+        done.set()
+        thread.join()
+
+        assert guard.in_flight == 0
+        assert guard.call(_Response).status_code == 200
+
+    def test_circuit(self):
+        guard = Upstream("http://example.com", {"failure_threshold": 2, "open_duration": 10})
+        with pytest.raises(requests.exceptions.ConnectionError):
+            guard.call(_fail)
+        # 4xx are errors of the client
+        assert guard.call(lambda: _Response(404)).status_code == 404
+        assert guard.state == upstream.CLOSED
+        with pytest.raises(requests.exceptions.ConnectionError):
+            guard.call(_fail)
+        assert guard.call(lambda: _Response(503)).status_code == 503
+        assert guard.state == upstream.OPEN
+        assert guard.trips == 1
+
+        function = mock.Mock(return_value=_Response())
+        with pytest.raises(UpstreamUnavailable):
+            guard.call(function)
+        function.assert_not_called()
+
+        # After the open duration, a failing trial request opens the circuit again
+        with mock.patch(
+            "c2cgeoportal_geoportal.lib.upstream.time.monotonic", return_value=guard._opened_at + 11
+        ):
+            assert guard.call(lambda: _Response(502)).status_code == 502
+        assert guard.state == upstream.OPEN
+        assert guard.trips == 2
+
+        # And a succeeding one closes it
+        with mock.patch(
+            "c2cgeoportal_geoportal.lib.upstream.time.monotonic", return_value=guard._opened_at + 11
+        ):
+            guard.call(function)
+        function.assert_called_once()
+        assert guard.state == upstream.CLOSED
+        assert guard.failures == 0
+
+    def test_slow(self):
+        guard = Upstream("http://example.com", {"failure_threshold": 1, "slow_threshold": 1})
+        with mock.patch("c2cgeoportal_geoportal.lib.upstream.time.monotonic", side_effect=[0, 2, 2]):
+            guard.call(_Response)
+        assert guard.state == upstream.OPEN
+
+    def test_stats(self):
+        upstream.init({"upstream_limits": {"failure_threshold": 1}})
+        guard = upstream.get_upstream("https://example.com:8443/mapserv?SERVICE=WMS")
+        assert upstream.get_upstream("https://example.com:8443/print") is guard
+        assert upstream.get_upstream("https://example.com/print") is not guard
+        with pytest.raises(requests.exceptions.ConnectionError):
+            guard.call(_fail)
+
+        stats = dict((labels["upstream"], values) for labels, values in upstream.get_upstream_stats())
+        assert stats["https://example.com:8443"] == {"state": 2, "in_flight": 0, "trips": 1, "rejected": 0}
@@ -0,0 +1,136 @@
+# Copyright (c) 2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring
+
+import asyncio
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+from c2c.template.config import config
+from tests import setup_common as setup_module  # noqa
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"<a/>\n")
+
+    def log_message(self, *args):
+        del args
+
+
+class TestRewarmer(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+
+    def test_coalesce(self):
+        from c2cgeoportal_geoportal.lib.warmup import Rewarmer
+
+        done = threading.Event()
+        rewarmer = Rewarmer(mock.Mock(settings={}), 0.2)
+        rewarmer.rewarm = mock.Mock(side_effect=lambda: done.set())
+        with mock.patch("c2cgeoportal_geoportal.lib.warmup.redis_utils.get", return_value=(None, None, None)):
+            rewarmer.start()
+            # Successive invalidations
+            for _ in range(3):
+                rewarmer.schedule()
+                time.sleep(0.05)
+            assert not done.is_set()
+            assert done.wait(2)
+            time.sleep(0.3)
+        assert rewarmer.rewarm.call_count == 1
+
+    def test_leader(self):
+        from c2cgeoportal_geoportal.lib.warmup import Rewarmer
+
+        redis = mock.Mock()
+        redis.set.side_effect = [True, None]
+        rewarmer = Rewarmer(mock.Mock(settings={}), 0)
+        with mock.patch(
+            "c2cgeoportal_geoportal.lib.warmup.redis_utils.get", return_value=(redis, redis, None)
+        ), mock.patch("c2cgeoportal_geoportal.lib.warmup.caching.refresh_generation"), mock.patch(
+            "c2cgeoportal_geoportal.lib.warmup.caching.get_generation", return_value=3
+        ):
+            assert rewarmer._is_leader()  # pylint: disable=protected-access
+            # Another process already does the warm-up of this generation
+            assert not rewarmer._is_leader()  # pylint: disable=protected-access
+        assert redis.set.call_args[0][0] == "c2cgeoportal_cache_rewarm:3"
+
+
+class TestWarmUpFork(TestCase):
+    def setup_method(self, _):
+        # Required to import the models
+        config.init("/opt/c2cgeoportal/geoportal/tests/config.yaml")
+
+    def test_fetch_after_fork(self):
+        from c2cgeoportal_geoportal.lib import http_session, warmup
+        from c2cgeoportal_geoportal.views.theme import async_get_http_cached
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+        def fetch(path):
+            return asyncio.run(asyncio.wait_for(async_get_http_cached({}, url + path, {}), 5))
+
+        try:
+            # The warm-up starts the threads of the pool and opens the connections in the main process
+            with mock.patch.object(
+                warmup, "_warm_up_themes", side_effect=lambda *args: fetch("parent")
+            ), mock.patch.object(warmup, "_warm_up_fulltextsearch_groups"), mock.patch.object(
+                warmup, "_warm_up_editing_classes"
+            ), mock.patch.object(
+                warmup.caching, "refresh_generation"
+            ), mock.patch(
+                "c2cgeoportal_commons.models.DBSession"
+            ):
+                warmup.warm_up(mock.Mock(settings={}))
+                assert http_session._SESSIONS  # pylint: disable=protected-access
+
+            pid = os.fork()
+            if pid == 0:
+                # Child: the worker should get its own thread pool and connections
+                try:
+                    no_session = not http_session._SESSIONS  # pylint: disable=protected-access
+                    os._exit(0 if no_session and fetch("child") == (b"<a/>\n", "text/xml") else 1)
+                except BaseException:  # pylint: disable=broad-exception-caught
+                    os._exit(2)
+            _, status = os.waitpid(pid, 0)
+            assert os.waitstatus_to_exitcode(status) == 0
+        finally:
+            server.shutdown()
+            server.server_close()
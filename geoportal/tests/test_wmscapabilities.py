@@ -0,0 +1,125 @@
+# Copyright (c) 2013-2023, Camptocamp SA
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+
+# pylint: disable=missing-docstring,attribute-defined-outside-init,protected-access
+
+
+import pytest
+
+CAPABILITIES = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE WMT_MS_Capabilities SYSTEM "http://schemas.opengis.net/wms/1.1.1/WMS_MS_Capabilities.dtd">
+<WMT_MS_Capabilities version="1.1.1">
+  <Service>
+    <Name>OGC:WMS</Name>
+    <Title>Test</Title>
+    <OnlineResource xmlns:xlink="http://www.w3.org/1999/xlink" xlink:href="http://example.com/"/>
+  </Service>
+  <Capability>
+    <Request>
+      <GetCapabilities>
+        <Format>application/vnd.ogc.wms_xml</Format>
+      </GetCapabilities>
+    </Request>
+    <Layer>
+      <Name>root</Name>
+      <Title>Root</Title>
+      <!-- Comment -->
+      <Layer queryable="1">
+        <Name>group</Name>
+        <Title>Group</Title>
+        <ScaleHint min="10" max="Infinity"/>
+        <Layer queryable="1">
+          <Name>point</Name>
+          <Title>Point</Title>
+          <Style><Name>default</Name><Title>Default</Title></Style>
+          <ScaleHint min="2" max="1000"/>
+          <Extent name="time" default="2014">2000/2010/P1Y</Extent>
+        </Layer>
+        <Layer>
+          <Title>Unnamed</Title>
+          <ScaleHint min="1" max="0"/>
+        </Layer>
+      </Layer>
+      <Layer>
+        <Name>polygon</Name>
+        <Title>Polygon</Title>
+        <Extent name="elevation">0,10</Extent>
+        <Extent name="TIME">2000,2001</Extent>
+      </Layer>
+    </Layer>
+  </Capability>
+</WMT_MS_Capabilities>
+"""
+
+
+class TestParseLayers:
+    def test_parse(self):
+        from c2cgeoportal_geoportal.lib.wmscapabilities import parse_layers
+
+        layers = parse_layers(CAPABILITIES)
+        assert list(layers) == ["root", "group", "point", "polygon"]
+        assert layers["point"] == {
+            "info": {
+                "name": "point",
+                "minResolutionHint": 1.41,
+                "maxResolutionHint": 707.11,
+                "queryable": True,
+            },
+            "timepositions": ["2000/2010/P1Y"],
+            "defaulttimeposition": "2014",
+            "children": [],
+        }
+        assert layers["group"]["info"]["minResolutionHint"] == 0.71
+        assert layers["group"]["info"]["maxResolutionHint"] == 999999999
+        assert layers["group"]["children"] == ["point", None]
+        assert layers["polygon"]["info"]["queryable"] is False
+        assert layers["polygon"]["timepositions"] == ["2000", "2001"]
+        assert layers["polygon"]["defaulttimeposition"] is None
+        assert layers["root"]["children"] == ["group", "polygon"]
+
+    def test_same_as_owslib(self):
+        from owslib.wms import WebMapService
+
+        from c2cgeoportal_geoportal.lib.wmscapabilities import parse_layers
+
+        layers = parse_layers(CAPABILITIES)
+        wms = WebMapService(None, xml=CAPABILITIES, version="1.1.1")
+        assert list(layers) == list(wms.contents)
+        for name, layer in layers.items():
+            wms_layer = wms[name]
+            assert layer["info"]["queryable"] == (wms_layer.queryable == 1)
+            assert layer["timepositions"] == wms_layer.timepositions
+            assert layer["defaulttimeposition"] == wms_layer.defaulttimeposition
+            assert layer["children"] == [child.name for child in wms_layer.layers]
+
+    def test_not_capabilities(self):
+        from c2cgeoportal_geoportal.lib.wmscapabilities import parse_layers
+
+        with pytest.raises(ValueError):
+            parse_layers(
+                b"<ServiceExceptionReport><ServiceException>Error</ServiceException></ServiceExceptionReport>"
+            )